@@ -1,16 +1,13 @@
 import json
 import logging
-import re
-import boto3
-from botocore.exceptions import ClientError
 import os
 import datetime
-import time
-import uuid
 import random
-from opensearchpy import OpenSearch, RequestsHttpConnection, AWSV4SignerAuth
+from opensearch_pool import get_opensearch_client
+from index_schema import shot_index_body
+from aws_clients import get_resource, lazy_client
 
-sqs_client = boto3.client("sqs")
+sqs_client = lazy_client("sqs")
 
 
 def lambda_handler(event, context):
@@ -26,7 +23,7 @@ def lambda_handler(event, context):
 
     jobId = response["MessageId"]
 
-    dynamodb = boto3.resource("dynamodb")
+    dynamodb = get_resource("dynamodb")
     table = dynamodb.Table(os.environ["vss_dynamodb_table"])
     status = str(random.randint(1, 25)) + "%"
     started = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -72,92 +69,23 @@ def lambda_handler(event, context):
 
 
 def create_opensearch_index(host, region, index, len_embedding):
-    host = host.split("://")[1] if "://" in host else host
-    credentials = boto3.Session().get_credentials()
-    auth = AWSV4SignerAuth(credentials, region, "aoss")
-
-    client = OpenSearch(
-        hosts=[{"host": host, "port": 443}],
-        http_auth=auth,
-        use_ssl=True,
-        verify_certs=True,
-        connection_class=RequestsHttpConnection,
-        pool_maxsize=20,
-    )
+    client = get_opensearch_client(host, region)
 
     exist = client.indices.exists(index=index)
     if not exist:
         print("Creating index")
-        index_body = {
-            "mappings": {
-                "properties": {
-                    "jobId": {"type": "text"},
-                    "video_name": {"type": "text"},
-                    "shot_id": {"type": "text"},
-                    "shot_startTime": {"type": "text"},
-                    "shot_endTime": {"type": "text"},
-                    "shot_description": {"type": "text"},
-                    "shot_publicFigures": {"type": "text"},
-                    "shot_privateFigures": {"type": "text"},
-                    "shot_transcript": {"type": "text"},
-                    "shot_image_vector": {
-                        "type": "knn_vector",
-                        "dimension": len_embedding,
-                        "method": {
-                            "engine": "nmslib",
-                            "space_type": "cosinesimil",
-                            "name": "hnsw",
-                            "parameters": {"ef_construction": 512, "m": 16},
-                        },
-                    },
-                    "shot_desc_vector": {
-                        "type": "knn_vector",
-                        "dimension": len_embedding,
-                        "method": {
-                            "engine": "nmslib",
-                            "space_type": "cosinesimil",
-                            "name": "hnsw",
-                            "parameters": {"ef_construction": 512, "m": 16},
-                        },
-                    },
-                    "shot_transcript_vector": {
-                        "type": "knn_vector",
-                        "dimension": len_embedding,
-                        "method": {
-                            "engine": "nmslib",
-                            "space_type": "cosinesimil",
-                            "name": "hnsw",
-                            "parameters": {"ef_construction": 512, "m": 16},
-                        },
-                    },
-                }
-            },
-            "settings": {
-                "index": {
-                    "number_of_shards": 2,
-                    "knn.algo_param": {"ef_search": 512},
-                    "knn": True,
-                }
-            },
-        }
+        index_body = shot_index_body(
+            len_embedding,
+            quantization=os.environ.get("vector_quantization", "none"),
+            small_dimension=int(os.environ.get("small_vector_dimension", "0")),
+        )
         response = client.indices.create(index=index, body=index_body)
 
     return client
 
 
 def create_shot_collection(host, region, index, len_embedding):
-    host = host.split("://")[1] if "://" in host else host
-    credentials = boto3.Session().get_credentials()
-    auth = AWSV4SignerAuth(credentials, region, "aoss")
-
-    client = OpenSearch(
-        hosts=[{"host": host, "port": 443}],
-        http_auth=auth,
-        use_ssl=True,
-        verify_certs=True,
-        connection_class=RequestsHttpConnection,
-        pool_maxsize=20,
-    )
+    client = get_opensearch_client(host, region)
 
     exist = client.indices.exists(index=index)
     if not exist:
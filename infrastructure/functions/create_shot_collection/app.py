@@ -1,18 +1,11 @@
 import json
-import logging
-import re
-import boto3
-from botocore.exceptions import ClientError
 import os
-import datetime
-import time
-import uuid
-import random
-from opensearchpy import OpenSearch, RequestsHttpConnection, AWSV4SignerAuth
-import base64
+from opensearch_pool import get_opensearch_client
+from aws_clients import lazy_client
+from frame_format import embedding_image, frame_key
 
-bedrock_client = boto3.client(service_name="bedrock-runtime")
-s3_client = boto3.client("s3")
+bedrock_client = lazy_client("bedrock-runtime")
+s3_client = lazy_client("s3")
 
 def lambda_handler(event, context):
     bucket_images = os.environ["bucket_images"]
@@ -38,7 +31,7 @@ def lambda_handler(event, context):
     for index, value in enumerate(shot_frames):
         if value["frame_publicFigures"] != "" or value["frame_privateFigures"] != "":
             embedding = get_titan_image_embedding(
-                bucket_images, jobId, os.environ["image_embedding_model"], f"{value['frame']}.png"
+                bucket_images, jobId, os.environ["image_embedding_model"], value["frame"]
             )
             embedding_request_body = json.dumps(
                 {
@@ -83,10 +76,10 @@ def lambda_handler(event, context):
         "shot_endTime": shot_endTime
     }
 
-def get_titan_image_embedding(bucket_images, jobId, embedding_model, image_name):
-    s3_object = s3_client.get_object(Bucket=bucket_images, Key=f"{jobId}/{image_name}")
+def get_titan_image_embedding(bucket_images, jobId, embedding_model, frame):
+    s3_object = s3_client.get_object(Bucket=bucket_images, Key=frame_key(jobId, frame))
     image_content = s3_object['Body'].read()
-    base64_image_string = base64.b64encode(image_content).decode()
+    base64_image_string = embedding_image(image_content)
 
     accept = "application/json"
     content_type = "application/json"
@@ -100,22 +93,6 @@ def get_titan_image_embedding(bucket_images, jobId, embedding_model, image_name)
     embedding = response_body.get("embedding")
     return embedding
 
-def get_opensearch_client(host, region):
-    host = host.split("://")[1] if "://" in host else host
-    credentials = boto3.Session().get_credentials()
-    auth = AWSV4SignerAuth(credentials, region, "aoss")
-
-    client = OpenSearch(
-        hosts=[{"host": host, "port": 443}],
-        http_auth=auth,
-        use_ssl=True,
-        verify_certs=True,
-        connection_class=RequestsHttpConnection,
-        pool_maxsize=20,
-    )
-
-    return client
-
 def milliseconds_to_time_format(ms):
     return "{:02d}:{:02d}:{:02d}:{:03d}".format(
         int((ms // 3600000) % 24),  # hours
@@ -1,15 +1,23 @@
 import json
-import logging
-import re
-import boto3
-from botocore.exceptions import ClientError
 import os
-import time
-from opensearchpy import OpenSearch, RequestsHttpConnection, AWSV4SignerAuth
+import datetime
+from vector_backend import get_vector_client
+from index_generation import bump_index_generation
+from index_schema import add_small_vectors, split_figures
 import base64
+from aws_clients import lazy_client, lazy_resource
+from frame_format import frame_key, get_model_format
 
-bedrock_client = boto3.client(service_name="bedrock-runtime")
-s3_client = boto3.client("s3")
+bedrock_client = lazy_client("bedrock-runtime")
+s3_client = lazy_client("s3")
+dynamodb = lazy_resource("dynamodb")
+
+# Shots are routed to the shard of their job so jobId-filtered searches can
+# skip the other shards; only enable for a fresh index
+ROUTE_BY_JOB = os.environ.get("route_by_job", "false").lower() == "true"
+# Dimension of the truncated shortlist vectors, 0 when the index has none
+SMALL_VECTOR_DIMENSION = int(os.environ.get("small_vector_dimension", "0"))
+upload_dates = {}
 
 
 def lambda_handler(event, context):
@@ -35,31 +43,43 @@ def lambda_handler(event, context):
         os.environ["text_embedding_model"], shot_transcript
     )
 
+    shot_document = {
+        "jobId": jobId,
+        "video_name": video_name,
+        "shot_id": shot_id,
+        "shot_startTime": shot_startTime,
+        "shot_endTime": shot_endTime,
+        "shot_description": shot_description,
+        # One value per figure, so exact figure filters match any of them
+        "shot_publicFigures": split_figures(shot_publicFigures),
+        "shot_privateFigures": split_figures(shot_privateFigures),
+        "shot_transcript": shot_transcript,
+        "upload_date": get_upload_date(jobId),
+        "shot_desc_vector": shot_desc_embedding,
+        "shot_image_vector": shot_image_embedding,
+        "shot_transcript_vector": shot_transcript_embedding,
+    }
     embedding_request_body = json.dumps(
-        {
-            "jobId": jobId,
-            "video_name": video_name,
-            "shot_id": shot_id,
-            "shot_startTime": shot_startTime,
-            "shot_endTime": shot_endTime,
-            "shot_description": shot_description,
-            "shot_publicFigures": shot_publicFigures,
-            "shot_privateFigures": shot_privateFigures,
-            "shot_transcript": shot_transcript,
-            "shot_desc_vector": shot_desc_embedding,
-            "shot_image_vector": shot_image_embedding,
-            "shot_transcript_vector": shot_transcript_embedding,
-        }
+        add_small_vectors(shot_document, SMALL_VECTOR_DIMENSION)
     )
 
     documentId = f"{video_name}-{shot_id}"
-    client = get_opensearch_client(os.environ["aoss_host"], os.environ["region"])
+    client = get_vector_client(os.environ["aoss_host"], os.environ["region"])
 
+    params = {"timeout": 60}
+    if ROUTE_BY_JOB:
+        params["routing"] = jobId
+    # Reindexing into a new schema version targets that index explicitly
+    aoss_index = event.get("target_index", os.environ["aoss_index"])
     response = client.index(
-        index=os.environ["aoss_index"],
+        index=aoss_index,
         body=embedding_request_body,
-        params={"timeout": 60},
+        params=params,
     )
+    # Invalidates the search function's cached responses for this index
+    generation_table = os.environ.get("index_generation_table")
+    if generation_table:
+        bump_index_generation(generation_table, aoss_index)
 
     return {"status": 200}
 
@@ -80,6 +100,20 @@ def get_shot_metadata(bucket_shots, jobId, shot_id):
     )
 
 
+def get_upload_date(jobId):
+    """ISO start time of the job, used for upload date filtering in search."""
+    if jobId not in upload_dates:
+        table = dynamodb.Table(os.environ["vss_dynamodb_table"])
+        item = table.get_item(Key={"JobId": jobId}).get("Item", {})
+        started = item.get("Started")
+        if started:
+            started = datetime.datetime.strptime(
+                started, "%Y-%m-%d %H:%M:%S"
+            ).isoformat()
+        upload_dates[jobId] = started
+    return upload_dates[jobId]
+
+
 def get_text_embedding(text_embedding_model, text):
     accept = "application/json"
     content_type = "application/json"
@@ -110,7 +144,9 @@ def get_text_embedding(text_embedding_model, text):
 
 
 def get_image_embedding(bucket, jobId, image):
-    s3_object = s3_client.get_object(Bucket=bucket, Key=f"{jobId}/{image}.png")
+    s3_object = s3_client.get_object(
+        Bucket=bucket, Key=frame_key(jobId, image, get_model_format())
+    )
     image_content = s3_object["Body"].read()
     base64_image_string = base64.b64encode(image_content).decode()
 
@@ -128,20 +164,3 @@ def get_image_embedding(bucket, jobId, image):
     response_body = json.loads(response["body"].read())
     embedding = response_body.get("embedding")
     return embedding
-
-
-def get_opensearch_client(host, region):
-    host = host.split("://")[1] if "://" in host else host
-    credentials = boto3.Session().get_credentials()
-    auth = AWSV4SignerAuth(credentials, region, "aoss")
-
-    client = OpenSearch(
-        hosts=[{"host": host, "port": 443}],
-        http_auth=auth,
-        use_ssl=True,
-        verify_certs=True,
-        connection_class=RequestsHttpConnection,
-        pool_maxsize=20,
-    )
-
-    return client
@@ -1,12 +1,11 @@
-import boto3
-from botocore.exceptions import ClientError
 from boto3.dynamodb.conditions import Key
 import os
 import json
 import re
+from aws_clients import get_client, lazy_client, lazy_resource
 
-dynamodb_client = boto3.resource("dynamodb")
-s3_client = boto3.client("s3")
+dynamodb_client = lazy_resource("dynamodb")
+s3_client = lazy_client("s3")
 
 
 def lambda_handler(event, context):
@@ -34,7 +33,7 @@ def lambda_handler(event, context):
     sfTaskToken = item["LambdaTranscribeTaskToken"]
 
     # sendTaskSuccess to Step Function to notify Transcribe has successfully finished the job
-    stepfunctions = boto3.client("stepfunctions")
+    stepfunctions = get_client("stepfunctions")
     sfResponse = stepfunctions.send_task_success(taskToken=sfTaskToken, output="{}")
 
     return {"statusCode": 200}
@@ -1,11 +1,7 @@
-import json
-import logging
-import re
-import boto3
-from botocore.exceptions import ClientError
 import os
 import datetime
-from opensearchpy import OpenSearch, RequestsHttpConnection, AWSV4SignerAuth
+from opensearch_pool import get_opensearch_client
+from aws_clients import get_resource
 
 
 def lambda_handler(event, context):
@@ -19,7 +15,7 @@ def lambda_handler(event, context):
 
 
 def updatejobStatus(dynamodb_table, jobId, status, endTime):
-    dynamodb = boto3.resource("dynamodb")
+    dynamodb = get_resource("dynamodb")
     table = dynamodb.Table(dynamodb_table)
     dynamodbResponse = table.update_item(
         Key={"JobId": jobId},
@@ -30,18 +26,7 @@ def updatejobStatus(dynamodb_table, jobId, status, endTime):
 
 
 def delete_shot_collection(host, region, index):
-    host = host.split("://")[1] if "://" in host else host
-    credentials = boto3.Session().get_credentials()
-    auth = AWSV4SignerAuth(credentials, region, "aoss")
-
-    client = OpenSearch(
-        hosts=[{"host": host, "port": 443}],
-        http_auth=auth,
-        use_ssl=True,
-        verify_certs=True,
-        connection_class=RequestsHttpConnection,
-        pool_maxsize=20,
-    )
+    client = get_opensearch_client(host, region)
 
     exist = client.indices.exists(index=index)
     if exist:
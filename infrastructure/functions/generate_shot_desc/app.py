@@ -1,20 +1,11 @@
 import json
-import logging
-import re
-import boto3
-from botocore.exceptions import ClientError
 import os
-import time
-import base64
-from botocore.config import Config
-from opensearchpy import OpenSearch, RequestsHttpConnection, AWSV4SignerAuth
+from opensearch_pool import get_opensearch_client
+from aws_clients import lazy_client
+from frame_format import bedrock_image_block, embedding_image, frame_key
 
-config = Config(read_timeout=900)
-import re
-
-dynamodb_client = boto3.resource("dynamodb")
-bedrock_client = boto3.client(service_name="bedrock-runtime")
-s3_client = boto3.client("s3")
+bedrock_client = lazy_client("bedrock-runtime")
+s3_client = lazy_client("s3")
 
 
 def lambda_handler(event, context):
@@ -82,7 +73,7 @@ def get_shot_metadata(bucket_shots, jobId, shot_id):
 
 
 def augment_detection_with_embeddings(bucket_images, jobId, shot_frames):
-    client = get_opensearch_client(os.environ["aoss_host"], os.environ["region"], jobId)
+    client = get_opensearch_client(os.environ["aoss_host"], os.environ["region"])
     augmented_shot_frames = []
     shot_publicFigures = set()
     shot_privateFigures = set()
@@ -113,7 +104,7 @@ def augment_detection_with_embeddings(bucket_images, jobId, shot_frames):
             bucket_images,
             jobId,
             os.environ["image_embedding_model"],
-            f"{frame_name}.png",
+            frame_name,
         )
 
         query = {
@@ -214,12 +205,10 @@ def generate_shot_description(bucket_images, jobId, shot_frames, shot_transcript
     for index, value in enumerate(shot_frames):
         frame_name = value['frame']
         s3_object = s3_client.get_object(
-            Bucket=bucket_images, Key=f"{jobId}/{frame_name}.png"
+            Bucket=bucket_images, Key=frame_key(jobId, frame_name)
         )
         image_content = s3_object["Body"].read()
-        message["content"].append(
-            {"image": {"format": "png", "source": {"bytes": image_content}}}
-        )
+        message["content"].append(bedrock_image_block(image_content))
 
     messages = [message]
     inferenceConfig = {
@@ -235,10 +224,10 @@ def generate_shot_description(bucket_images, jobId, shot_frames, shot_transcript
     return output_message
 
 
-def get_titan_image_embedding(bucket_images, jobId, embedding_model, image_name):
-    s3_object = s3_client.get_object(Bucket=bucket_images, Key=jobId + "/" + image_name)
+def get_titan_image_embedding(bucket_images, jobId, embedding_model, frame):
+    s3_object = s3_client.get_object(Bucket=bucket_images, Key=frame_key(jobId, frame))
     image_content = s3_object["Body"].read()
-    base64_image_string = base64.b64encode(image_content).decode()
+    base64_image_string = embedding_image(image_content)
 
     accept = "application/json"
     content_type = "application/json"
@@ -251,23 +240,6 @@ def get_titan_image_embedding(bucket_images, jobId, embedding_model, image_name)
     return embedding
 
 
-def get_opensearch_client(host, region, index):
-    host = host.split("://")[1] if "://" in host else host
-    credentials = boto3.Session().get_credentials()
-    auth = AWSV4SignerAuth(credentials, region, "aoss")
-
-    client = OpenSearch(
-        hosts=[{"host": host, "port": 443}],
-        http_auth=auth,
-        use_ssl=True,
-        verify_certs=True,
-        connection_class=RequestsHttpConnection,
-        pool_maxsize=20,
-    )
-
-    return client
-
-
 def add_shot_transcript(shot_startTime, shot_endTime, transcript):
     relevant_transcript = ""
     for item in transcript:
@@ -1,19 +1,12 @@
-import json
-import logging
-import re
-import boto3
-from botocore.exceptions import ClientError
 import os
-import time
 from PIL import Image
 import math
 import io
 import base64
+from aws_clients import lazy_client
+from frame_format import frame_content_type, frame_key, get_model_format, save_image
 
-dynamodb_client = boto3.resource("dynamodb")
-rek_client = boto3.client("rekognition")
-s3_client = boto3.client("s3")
-bedrock_client = boto3.client(service_name="bedrock-runtime")
+s3_client = lazy_client("s3")
 
 
 def lambda_handler(event, context):
@@ -28,7 +21,7 @@ def lambda_handler(event, context):
 
     images = []
     for frame in frames:
-        obj = s3_client.get_object(Bucket=bucket_images, Key=f"{jobId}/{frame}.png")
+        obj = s3_client.get_object(Bucket=bucket_images, Key=frame_key(jobId, frame))
         image_data = obj["Body"].read()
         images.append(Image.open(io.BytesIO(image_data)))
 
@@ -83,10 +76,12 @@ def generate_shot_image(
 
     # Max size allowed (3.75 MB)
     max_size_bytes = 3.75 * 1024 * 1024
+    # The shot image is embedded, so it is stored in a format the model takes
+    image_format = get_model_format()
 
     # Check initial size
     buffer = io.BytesIO()
-    grid_image.save(buffer, format="PNG")
+    save_image(grid_image, buffer, image_format)
     size = buffer.tell()
 
     # If too large, resize the image
@@ -98,7 +93,7 @@ def generate_shot_image(
         grid_image = grid_image.resize((new_width, new_height), Image.LANCZOS)
 
         buffer = io.BytesIO()
-        grid_image.save(buffer, format="PNG")
+        save_image(grid_image, buffer, image_format)
         size = buffer.tell()
 
         if size > max_size_bytes:
@@ -108,7 +103,7 @@ def generate_shot_image(
                 height = int(height * 0.9)
                 grid_image = grid_image.resize((width, height), Image.LANCZOS)
                 buffer = io.BytesIO()
-                grid_image.save(buffer, format="PNG")
+                save_image(grid_image, buffer, image_format)
                 size = buffer.tell()
 
     buffer.seek(0)
@@ -116,6 +111,6 @@ def generate_shot_image(
     s3_client.upload_fileobj(
         buffer,
         bucket_shots,
-        f"{jobId}/{shot_id}.png",
-        ExtraArgs={"ContentType": "image/png"},
+        frame_key(jobId, shot_id, image_format),
+        ExtraArgs={"ContentType": frame_content_type(image_format)},
     )
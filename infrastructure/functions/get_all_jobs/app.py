@@ -1,15 +1,8 @@
 import json
-import logging
-import re
-import boto3
-from botocore.exceptions import ClientError
 import os
-import datetime
-import time
-import uuid
-import random
+from aws_clients import lazy_resource
 
-dynamodb_client = boto3.resource("dynamodb")
+dynamodb_client = lazy_resource("dynamodb")
 
 
 def lambda_handler(event, context):
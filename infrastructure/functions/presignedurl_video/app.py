@@ -1,10 +1,10 @@
 import json
 import logging
-import boto3
 from botocore.exceptions import ClientError
 import os
+from aws_clients import lazy_client
 
-s3_client = boto3.client("s3")
+s3_client = lazy_client("s3")
 
 
 def lambda_handler(event, context):
@@ -1,14 +1,8 @@
-import json
-import logging
-import re
-import boto3
-from botocore.exceptions import ClientError
 import os
-import time
+from aws_clients import lazy_client
+from frame_format import frame_key, rekognition_image
 
-dynamodb_client = boto3.resource("dynamodb")
-rek_client = boto3.client("rekognition")
-s3_client = boto3.client("s3")
+rek_client = lazy_client("rekognition")
 
 
 def lambda_handler(event, context):
@@ -37,9 +31,7 @@ def startCelebrityDetection(bucket_images, jobId, frames):
     shot_frames = []
     for frame in frames:
         response = rek_client.recognize_celebrities(
-            Image={
-                "S3Object": {"Bucket": bucket_images, "Name": f"{jobId}/{frame}.png"}
-            }
+            Image=rekognition_image(bucket_images, frame_key(jobId, frame))
         )
 
         min_confidence = 95.0
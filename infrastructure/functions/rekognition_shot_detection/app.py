@@ -1,13 +1,8 @@
-import json
-import logging
-import re
-import boto3
-from botocore.exceptions import ClientError
 import os
-import time
+from aws_clients import lazy_client, lazy_resource
 
-dynamodb_client = boto3.resource("dynamodb")
-rek_client = boto3.client("rekognition")
+dynamodb_client = lazy_resource("dynamodb")
+rek_client = lazy_client("rekognition")
 
 
 def lambda_handler(event, context):
@@ -1,22 +1,27 @@
 import json
-import logging
-import re
-import boto3
-from botocore.exceptions import ClientError
 from boto3.dynamodb.conditions import Key
 import os
-import time
-import subprocess
+import shutil
 import concurrent.futures
+from aws_clients import get_resource, lazy_client
+from frame_extraction import extract_frames
+from frame_format import frame_content_type, get_frame_format
 
-sf_client = boto3.client("stepfunctions")
-rek_client = boto3.client("rekognition")
-s3_client = boto3.client("s3")
+sf_client = lazy_client("stepfunctions")
+rek_client = lazy_client("rekognition")
+s3_client = lazy_client("s3")
+
+SHOTS_MANIFEST = "shots.jsonl"
+MAX_RESULTS = 1000
+# Covers the whole extraction, which is bounded by the function timeout
+PRESIGNED_URL_EXPIRATION = 3600
+# Minimum part size of an S3 multipart upload, except for the last part
+MANIFEST_PART_SIZE = 5 * 1024 * 1024
 
 
 def lambda_handler(event, context):
     dynamodb_table = os.environ["vss_dynamodb_table"]
-    dynamodb = boto3.resource("dynamodb")
+    dynamodb = get_resource("dynamodb")
     table = dynamodb.Table(dynamodb_table)
     SNSTopic = os.environ["SNSTopic"]
 
@@ -31,20 +36,38 @@ def lambda_handler(event, context):
     jobId = item["JobId"]
     video_name = item["Input"]
 
-    frames, shots = getShotDetectionResults(jobId, video_name, rekognitionTaskId)
-
-    generateImages(
-        jobId,
-        os.environ["bucket_videos"],
-        video_name,
-        frames,
-        os.environ["tmp_dir"],
-        os.environ["bucket_images"],
+    manifest_key = f"{jobId}/{SHOTS_MANIFEST}"
+    frames, shot_count = getShotDetectionResults(
+        jobId, video_name, rekognitionTaskId, os.environ["bucket_shots"], manifest_key
     )
 
+    try:
+        generateImages(
+            jobId,
+            os.environ["bucket_videos"],
+            video_name,
+            frames,
+            os.environ["tmp_dir"],
+            os.environ["bucket_images"],
+        )
+    except Exception as e:
+        # Fail the execution now rather than leave it waiting for the callback
+        sf_client.send_task_failure(
+            taskToken=item["LambdaRekognitionTaskToken"],
+            error="FrameExtractionFailed",
+            cause=str(e)[:256],
+        )
+        raise
+
     message = event["Records"][0]["Sns"]["Message"]
     message = json.loads(message)
-    message["Shots"] = shots
+    # The shots are passed by reference: the Distributed Maps read the manifest
+    # with an ItemReader, so the state payload stays small for long videos
+    message["ShotsManifest"] = {
+        "Bucket": os.environ["bucket_shots"],
+        "Key": manifest_key,
+    }
+    message["ShotCount"] = shot_count
     message = json.dumps(message)
 
     sfResponse = sf_client.send_task_success(
@@ -54,16 +77,11 @@ def lambda_handler(event, context):
     return {"statusCode": 200}
 
 
-def getShotDetectionResults(jobId, video_name, rekognitionTaskId):
-    maxResults = 1000
-    paginationToken = ""
-
-    response = rek_client.get_segment_detection(
-        JobId=rekognitionTaskId, MaxResults=maxResults, NextToken=paginationToken
-    )
-
+def getShotDetectionResults(jobId, video_name, rekognitionTaskId, bucket_shots, key):
+    """Streams every detected shot, page by page, into a JSONL manifest in S3."""
     frames = []
-    shots = []
+    shot_count = 0
+
     def get_timestamps(shot, N):
         start_time = shot["StartTimestampMillis"]
         end_time = shot["EndTimestampMillis"]
@@ -71,92 +89,168 @@ def getShotDetectionResults(jobId, video_name, rekognitionTaskId):
         timestamps = [start_time + i * step for i in range(N)]
         return timestamps
 
-    for i, shot in enumerate(response["Segments"]):
-        shot_timestamps = get_timestamps(shot, 3)
-        frames.extend(shot_timestamps)
-
-        shot_startTime = 0 if i == 0 else shot["StartTimestampMillis"]
-        shot_endTime = shot["EndTimestampMillis"]
-
-        shots.append(
-            {
-                "jobId": jobId,
-                "video_name": video_name,
-                "shot_startTime": shot_startTime,
-                "shot_endTime": shot_endTime,
-                "frames": shot_timestamps,
-            }
+    with ManifestWriter(bucket_shots, key) as manifest:
+        for page in get_segment_pages(rekognitionTaskId):
+            for shot in page:
+                shot_timestamps = get_timestamps(shot, 3)
+                frames.extend(shot_timestamps)
+
+                shot_startTime = 0 if shot_count == 0 else shot["StartTimestampMillis"]
+                shot_endTime = shot["EndTimestampMillis"]
+
+                manifest.write(
+                    {
+                        "jobId": jobId,
+                        "video_name": video_name,
+                        "shot_id": f"{shot_startTime}-{shot_endTime}",
+                        "shot_startTime": shot_startTime,
+                        "shot_endTime": shot_endTime,
+                        "frames": shot_timestamps,
+                    }
+                )
+                shot_count += 1
+
+    return frames, shot_count
+
+
+def get_segment_pages(rekognitionTaskId):
+    """Yields the shot segments of a finished detection job one page at a time."""
+    kwargs = {"JobId": rekognitionTaskId, "MaxResults": MAX_RESULTS}
+    while True:
+        response = rek_client.get_segment_detection(**kwargs)
+        yield [
+            segment
+            for segment in response["Segments"]
+            if segment.get("Type", "SHOT") == "SHOT"
+        ]
+        if not response.get("NextToken"):
+            return
+        kwargs["NextToken"] = response["NextToken"]
+
+
+class ManifestWriter:
+    """
+    Writes JSON lines to an S3 object as they are produced.
+
+    Lines are buffered up to the multipart part size and uploaded as parts, so
+    memory stays bounded however many shots a video has. A manifest smaller
+    than one part is written with a single put_object.
+    """
+
+    def __init__(self, bucket, key, part_size=MANIFEST_PART_SIZE):
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.buffer = bytearray()
+        self.upload_id = None
+        self.parts = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        elif self.upload_id:
+            s3_client.abort_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self.upload_id
+            )
+
+    def write(self, record):
+        self.buffer += (json.dumps(record) + "\n").encode("utf-8")
+        if len(self.buffer) >= self.part_size:
+            self.flush()
+
+    def flush(self):
+        if self.upload_id is None:
+            self.upload_id = s3_client.create_multipart_upload(
+                Bucket=self.bucket, Key=self.key, ContentType="application/jsonl"
+            )["UploadId"]
+        part_number = len(self.parts) + 1
+        response = s3_client.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=bytes(self.buffer),
         )
+        self.parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+        self.buffer = bytearray()
 
-    return frames, shots
+    def close(self):
+        if self.upload_id is None:
+            s3_client.put_object(
+                Bucket=self.bucket,
+                Key=self.key,
+                Body=bytes(self.buffer),
+                ContentType="application/jsonl",
+            )
+            return
+        if self.buffer:
+            self.flush()
+        s3_client.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            MultipartUpload={"Parts": self.parts},
+        )
 
 
 def generateImages(jobId, bucket_videos, video_name, timestamps, tmp_dir, bucket_images):
-    tmp_video_dir = tmp_dir + "/video/"
     tmp_frames_dir = tmp_dir + "/" + jobId + "/"
-    os.makedirs(tmp_video_dir, exist_ok=True)
     os.makedirs(tmp_frames_dir, exist_ok=True)
-    ffmpeg_path = "/opt/bin/ffmpeg"
-    local_video_path = os.path.join(tmp_video_dir, video_name)
-    
-    s3_client.download_file(bucket_videos, video_name, local_video_path)
-    
-    sorted_timestamps = sorted(timestamps)
-    last_timestamp = sorted_timestamps[-1]
-    
-    def extract_frame(timestamp_ms):
-        """Process a single timestamp and extract the frame"""
-        # Handling the last timestamp for edge case.
-        if timestamp_ms == last_timestamp:
-            output_file = f"{tmp_frames_dir}{timestamp_ms}.png"
-            subprocess.run(
-                [
-                    ffmpeg_path,
-                    "-sseof", "-0.1",
-                    "-i", local_video_path,
-                    "-vf", "scale='min(1280,iw):-1'",  #
-                    "-update", "1",
-                    "-frames:v", "1",
-                    "-q:v", "2",
-                    "-y",
-                    output_file
-                ],
-                stderr=subprocess.PIPE
-            )
-        else:
-            timestamp_sec = timestamp_ms / 1000.0
-            output_file = f"{tmp_frames_dir}{timestamp_ms}.png"
-            subprocess.run(
-                [
-                    ffmpeg_path,
-                    "-ss", f"{timestamp_sec:.3f}",
-                    "-i", local_video_path,
-                    "-vf", "scale='min(1280,iw):-1'",
-                    "-vframes", "1", 
-                    "-q:v", "2",
-                    output_file
-                ],
-                stderr=subprocess.PIPE
-            )
-        return output_file
-    
-    # Extract frames in parallel
-    with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-        frame_futures = [executor.submit(extract_frame, ts) for ts in timestamps]
-        concurrent.futures.wait(frame_futures)
-    
-    extra_args = {"ContentType": "image/png"}
-    with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-        upload_futures = []
-        for frame_file in os.listdir(tmp_frames_dir):
-            frame_path = os.path.join(tmp_frames_dir, frame_file)
-            upload_futures.append(
-                executor.submit(
-                    s3_client.upload_file,
-                    frame_path,
-                    bucket_images,
-                    f"{jobId}/{frame_file}",
-                    ExtraArgs=extra_args
-                )
+    local_video_path = None
+
+    if os.environ.get("video_source", "url") == "download":
+        tmp_video_dir = tmp_dir + "/video/"
+        os.makedirs(tmp_video_dir, exist_ok=True)
+        local_video_path = os.path.join(tmp_video_dir, video_name)
+        s3_client.download_file(bucket_videos, video_name, local_video_path)
+        video_path = local_video_path
+    else:
+        # ffmpeg reads the video with HTTP range requests, so extraction starts
+        # right away and the video never lands on the ephemeral storage
+        video_path = s3_client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": bucket_videos, "Key": video_name},
+            ExpiresIn=PRESIGNED_URL_EXPIRATION,
+        )
+
+    frame_format = get_frame_format()
+    extra_args = {"ContentType": frame_content_type(frame_format)}
+
+    def upload_frame(frame_path):
+        s3_client.upload_file(
+            frame_path,
+            bucket_images,
+            f"{jobId}/{os.path.basename(frame_path)}",
+            ExtraArgs=extra_args,
+        )
+        os.remove(frame_path)
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
+            upload_futures = []
+
+            def upload_frames(frames):
+                for frame_path in frames.values():
+                    upload_futures.append(executor.submit(upload_frame, frame_path))
+
+            # Frames are uploaded and removed batch by batch while the rest
+            # are still being extracted
+            extract_frames(
+                video_path,
+                timestamps,
+                tmp_frames_dir,
+                mode=os.environ.get("frame_extraction_mode", "select"),
+                workers=int(os.environ.get("frame_extraction_workers", "0")),
+                on_frames=upload_frames,
+                frame_format=frame_format,
             )
-        concurrent.futures.wait(upload_futures)
+            for future in upload_futures:
+                future.result()
+    finally:
+        # Warm containers reuse /tmp
+        shutil.rmtree(tmp_frames_dir, ignore_errors=True)
+        if local_video_path and os.path.exists(local_video_path):
+            os.remove(local_video_path)
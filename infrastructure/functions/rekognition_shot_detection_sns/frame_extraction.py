@@ -0,0 +1,277 @@
+"""
+Frame extraction engine for the shot frames.
+
+The frames of all requested timestamps are extracted by a handful of ffmpeg
+runs instead of one process per frame. The sorted timestamps are split into
+batches of consecutive timestamps and every batch is one ffmpeg run:
+
+- select mode decodes the time range of the batch once and keeps, for every
+  timestamp, the first frame at or after it (the frame an accurate -ss seek
+  returns). The showinfo filter reports the time of each kept frame.
+- seek mode opens one input per timestamp, each with its own -ss, so only the
+  group of pictures around every timestamp is decoded. It is cheaper when the
+  timestamps are far apart.
+
+The batches are fanned out to `workers` ffmpeg processes running side by
+side, one per core by default, each covering its own range of the video.
+
+The video can be a local file or an HTTP(S) URL such as a presigned S3 URL.
+ffmpeg then reads it with range requests, fetching only the byte ranges the
+batches decode, so nothing but the frames is written to disk. Passing
+on_frames lets the caller upload and delete each batch's frames as soon as
+it is done, which keeps the scratch space bounded by the batches in flight.
+
+Frames are encoded in the pipeline's frame format (see frame_format).
+"""
+
+import logging
+import math
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from frame_format import ffmpeg_options, frame_extension
+
+FFMPEG_PATH = "/opt/bin/ffmpeg"
+EXTRACTION_MODES = ("select", "seek")
+# Timestamps per ffmpeg run. A select batch only grows its select expression,
+# a seek batch opens a demuxer and a decoder per timestamp
+SELECT_BATCH_SIZE = 256
+SEEK_BATCH_SIZE = 8
+SCALE_FILTER = "scale='min(1280,iw):-1'"
+PTS_TIME_PATTERN = re.compile(r"pts_time:\s*(-?[\d.]+)")
+# Seconds decoded past the last timestamp of a select batch
+BATCH_TAIL = 0.5
+# A frame this many seconds before a timestamp still counts as at it
+TOLERANCE = 0.0005
+
+
+def extract_frames(
+    video_path,
+    timestamps,
+    output_dir,
+    mode="select",
+    workers=0,
+    on_frames=None,
+    frame_format="png",
+):
+    """
+    Extract the frame at every timestamp (in ms) of a video into
+    output_dir/<timestamp>.<extension>. Returns {timestamp: path}, after
+    passing each batch of it to on_frames as the batch completes.
+    """
+    if mode not in EXTRACTION_MODES:
+        raise ValueError(f"Unknown frame extraction mode: {mode}")
+    timestamps = sorted(set(timestamps))
+    if not timestamps:
+        return {}
+    os.makedirs(output_dir, exist_ok=True)
+
+    cores = os.cpu_count() or 1
+    workers = workers or cores
+    max_batch_size = SELECT_BATCH_SIZE if mode == "select" else SEEK_BATCH_SIZE
+    batches = plan_batches(
+        timestamps, min(max_batch_size, math.ceil(len(timestamps) / workers))
+    )
+    workers = min(workers, len(batches))
+    # Concurrent runs share the cores instead of each starting a decoder
+    # thread per core
+    threads = max(1, cores // workers)
+    extract_batch = extract_select_batch if mode == "select" else extract_seek_batch
+
+    frames = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                extract_batch, video_path, batch, output_dir, threads, frame_format
+            )
+            for batch in batches
+        ]
+        for future in as_completed(futures):
+            batch_frames = future.result()
+            frames.update(batch_frames)
+            if on_frames:
+                on_frames(batch_frames)
+
+    missing = [timestamp for timestamp in timestamps if timestamp not in frames]
+    if missing:
+        # Only timestamps past the last decoded frame, typically the end of
+        # the last shot, may take the last frame of the video. A gap before it
+        # means the video could not be read there, and a wrong frame would be
+        # described and indexed for that shot
+        last_decoded = max(frames, default=None)
+        if last_decoded is None or missing[0] < last_decoded:
+            raise Exception(f"No frame extracted for timestamps {missing}")
+        path = frame_path(output_dir, missing[0], frame_format)
+        extract_last_frame(video_path, path, frame_format)
+        last_frames = {missing[0]: path}
+        for timestamp in missing[1:]:
+            last_frames[timestamp] = frame_path(output_dir, timestamp, frame_format)
+            shutil.copyfile(path, last_frames[timestamp])
+        frames.update(last_frames)
+        if on_frames:
+            on_frames(last_frames)
+    return frames
+
+
+def plan_batches(timestamps, batch_size):
+    """Split sorted timestamps into runs of at most batch_size consecutive ones."""
+    batch_size = max(1, batch_size)
+    return [
+        timestamps[start : start + batch_size]
+        for start in range(0, len(timestamps), batch_size)
+    ]
+
+
+def select_expression(targets):
+    """
+    ffmpeg select expression keeping the first frame at or after each target
+    time (in seconds). prev_t is NaN on the first frame, where not(gte()) is 1.
+    """
+    terms = []
+    for target in targets:
+        target = f"{target - TOLERANCE:.4f}"
+        terms.append(f"gte(t,{target})*not(gte(prev_t,{target}))")
+    return "+".join(terms)
+
+
+def extract_select_batch(video_path, timestamps, output_dir, threads, frame_format):
+    start = timestamps[0] / 1000
+    targets = [timestamp / 1000 - start for timestamp in timestamps]
+    scratch_dir = tempfile.mkdtemp(dir=output_dir)
+    try:
+        log = run_ffmpeg(
+            [
+                FFMPEG_PATH,
+                "-nostdin",
+                "-nostats",
+                "-loglevel",
+                "info",
+                "-threads",
+                str(threads),
+                "-ss",
+                f"{start:.3f}",
+                "-t",
+                f"{targets[-1] + BATCH_TAIL:.3f}",
+                *input_options(video_path),
+                "-i",
+                video_path,
+                "-vf",
+                f"select='{select_expression(targets)}',{SCALE_FILTER},showinfo",
+                "-vsync",
+                "0",
+                *ffmpeg_options(frame_format),
+                os.path.join(scratch_dir, f"%06d.{frame_extension(frame_format)}"),
+            ]
+        )
+        frame_times = []
+        for line in log.splitlines():
+            match = PTS_TIME_PATTERN.search(line)
+            if match and "showinfo" in line:
+                frame_times.append(float(match.group(1)))
+        frame_files = sorted(os.listdir(scratch_dir))[: len(frame_times)]
+
+        # Both lists are in time order, so each timestamp takes the first kept
+        # frame at or after it. Timestamps within one frame share that frame
+        frames = {}
+        position = 0
+        for timestamp, target in zip(timestamps, targets):
+            while (
+                position < len(frame_files)
+                and frame_times[position] < target - TOLERANCE
+            ):
+                position += 1
+            if position == len(frame_files):
+                break
+            source = os.path.join(scratch_dir, frame_files[position])
+            frames[timestamp] = frame_path(output_dir, timestamp, frame_format)
+            shutil.copyfile(source, frames[timestamp])
+        return frames
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+
+def extract_seek_batch(video_path, timestamps, output_dir, threads, frame_format):
+    command = [FFMPEG_PATH, "-nostdin", "-nostats", "-loglevel", "error"]
+    for timestamp in timestamps:
+        command += [
+            "-threads",
+            str(threads),
+            "-ss",
+            f"{timestamp / 1000:.3f}",
+            *input_options(video_path),
+            "-i",
+            video_path,
+        ]
+    for index, timestamp in enumerate(timestamps):
+        command += [
+            "-map",
+            f"{index}:v:0",
+            "-vf",
+            SCALE_FILTER,
+            "-frames:v",
+            "1",
+            "-update",
+            "1",
+            *ffmpeg_options(frame_format),
+            "-y",
+            frame_path(output_dir, timestamp, frame_format),
+        ]
+    run_ffmpeg(command)
+    return {
+        timestamp: frame_path(output_dir, timestamp, frame_format)
+        for timestamp in timestamps
+        if os.path.exists(frame_path(output_dir, timestamp, frame_format))
+    }
+
+
+def extract_last_frame(video_path, path, frame_format):
+    run_ffmpeg(
+        [
+            FFMPEG_PATH,
+            "-nostdin",
+            "-loglevel",
+            "error",
+            "-sseof",
+            "-0.1",
+            *input_options(video_path),
+            "-i",
+            video_path,
+            "-vf",
+            SCALE_FILTER,
+            "-update",
+            "1",
+            "-frames:v",
+            "1",
+            *ffmpeg_options(frame_format),
+            "-y",
+            path,
+        ]
+    )
+    if not os.path.exists(path):
+        raise Exception(f"ffmpeg extracted no last frame from {path}")
+
+
+def input_options(video_path):
+    """Reconnect options for a video read over HTTP, e.g. a presigned URL."""
+    if not video_path.startswith(("http://", "https://")):
+        return []
+    return ["-reconnect", "1", "-reconnect_on_network_error", "1"]
+
+
+def frame_path(output_dir, timestamp, frame_format):
+    return os.path.join(output_dir, f"{timestamp}.{frame_extension(frame_format)}")
+
+
+def run_ffmpeg(command):
+    """Run ffmpeg and return its log, raising when it fails."""
+    completed = subprocess.run(
+        command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+    log = completed.stderr.decode(errors="replace")
+    if completed.returncode != 0:
+        logging.error(f"ffmpeg frame extraction failed: {log[-2000:]}")
+        raise Exception(f"ffmpeg exited with status {completed.returncode}")
+    return log
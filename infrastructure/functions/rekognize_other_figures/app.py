@@ -1,17 +1,9 @@
-import json
-import logging
-import re
-import boto3
-from botocore.exceptions import ClientError
 import os
-import time
-import base64
-from botocore.config import Config
+from aws_clients import lazy_client
+from frame_format import bedrock_image_block, frame_key
 
-config = Config(read_timeout=900)
-
-bedrock_client = boto3.client(service_name="bedrock-runtime")
-s3_client = boto3.client("s3")
+bedrock_client = lazy_client("bedrock-runtime")
+s3_client = lazy_client("s3")
 
 
 def lambda_handler(event, context):
@@ -67,12 +59,10 @@ def recognise_person_name(bucket_images, jobId, frames):
             ],
         }
         s3_object = s3_client.get_object(
-            Bucket=bucket_images, Key=f"{jobId}/{frame}.png"
+            Bucket=bucket_images, Key=frame_key(jobId, frame)
         )
         image_content = s3_object["Body"].read()
-        message["content"].append(
-            {"image": {"format": "png", "source": {"bytes": image_content}}}
-        )
+        message["content"].append(bedrock_image_block(image_content))
         messages = [message]
         inferenceConfig = {"maxTokens": 128}
 
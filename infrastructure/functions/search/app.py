@@ -1,471 +1,1295 @@
 import json
 import logging
 import re
-import boto3
-from botocore.exceptions import ClientError
 import os
+import threading
 import time
-import subprocess
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import base64
-import glob
-from opensearchpy import OpenSearch, RequestsHttpConnection, AWSV4SignerAuth
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import hashlib
+from vector_backend import get_vector_client
+from index_generation import CATALOG_KEY, get_index_generation
+from index_schema import (
+    join_figures,
+    small_vector_field,
+    truncate_vector,
+    vector_quantization,
+)
+from embedding_cache import (
+    DynamoDbEmbeddingTier,
+    EmbeddingCache,
+    S3EmbeddingTier,
+    image_cache_key,
+    text_cache_key,
+)
+from rerank import rerank
+from segments import (
+    MERGE_GAP_MS,
+    MERGE_POLICIES,
+    MERGE_POLICY,
+    SEGMENTS_PER_VIDEO,
+    merge_segments,
+)
+from metrics import (
+    emit_metrics,
+    profiling_enabled,
+    record_profile,
+    stage,
+    start_request,
+)
+from response_cache import ResponseCache, response_cache_key
+from filters import build_filter_clauses, parse_filters
+from aws_clients import lazy_client
 
-dynamodb_client = boto3.resource("dynamodb")
-bedrock_client = boto3.client(service_name="bedrock-runtime")
-s3_client = boto3.client("s3")
-comprehend_client = boto3.client("comprehend")
+bedrock_client = lazy_client("bedrock-runtime")
+s3_client = lazy_client("s3")
+
+TEXT_EMBEDDING_DIMENSIONS = 1024
+IMAGE_EMBEDDING_DIMENSIONS = 1024
+
+
+def create_embedding_cache():
+    shared_tier = None
+    if os.environ.get("embedding_cache_table"):
+        shared_tier = DynamoDbEmbeddingTier(os.environ["embedding_cache_table"])
+    elif os.environ.get("embedding_cache_bucket"):
+        shared_tier = S3EmbeddingTier(os.environ["embedding_cache_bucket"])
+    return EmbeddingCache(
+        max_entries=int(os.environ.get("embedding_cache_size", "1024")),
+        ttl_seconds=int(os.environ.get("embedding_cache_ttl", "86400")),
+        shared_tier=shared_tier,
+    )
+
+
+embedding_cache = create_embedding_cache()
+# Whole responses, invalidated through the index generation bumped on ingestion
+response_cache = ResponseCache(
+    max_entries=int(os.environ.get("response_cache_size", "256")),
+    ttl_seconds=int(os.environ.get("response_cache_ttl", "300")),
+)
 
 
 def lambda_handler(event, context):
+    if "warm_up_queries" in event:  # direct invocation, e.g. from a schedule
+        return warm_up_embedding_cache(event["warm_up_queries"])
+
     http_method = event.get("requestContext", {}).get("http", {}).get("method", "GET")
     if http_method == "GET":
-        aoss_index = event["queryStringParameters"]["index"]
-        client = get_opensearch_client(
-            os.environ["aoss_host"], os.environ["region"], aoss_index
-        )
-        query_type = event["queryStringParameters"]["type"]
-        user_query = event["queryStringParameters"]["query"]
-        if query_type == "text":  # search by text
-            response = searchByText(aoss_index, client, user_query)
-        else:  # search by clip
-            response = searchByClip(aoss_index, client, user_query)
-    else:  # search by image
-        request_data = json.loads(event["body"])
-        aoss_index = request_data["index"]
-        client = get_opensearch_client(
-            os.environ["aoss_host"], os.environ["region"], aoss_index
-        )
-        query_type = request_data["type"]
-        user_query = request_data["query"]
+        params = event["queryStringParameters"]
+    else:
+        params = json.loads(event["body"])
+    try:
+        options = get_search_options(params)
+        batch = None
+        if http_method != "GET" and "queries" in params:
+            batch = get_batch_queries(params)
+    except ValueError as e:
+        return {"statusCode": 400, "body": json.dumps({"error": str(e)})}
+
+    aoss_index = params["index"]
+    client = get_vector_client(os.environ["aoss_host"], os.environ["region"])
+    if http_method == "GET":
+        search_type = "text" if params["type"] == "text" else "clip"
+        user_query = params["query"]
+    elif batch is not None:
+        search_type = "batch"
+        user_query = json.dumps(batch)
+    else:
+        search_type = "image"
+        user_query = params["query"]
         if user_query.startswith("data:image"):
             user_query = user_query.split(",")[1]
-        response = searchByImage(aoss_index, client, user_query)
 
+    def run_search_request():
+        if search_type == "batch":
+            return searchBatch(aoss_index, client, batch, options)
+        if search_type == "text":
+            return searchByText(aoss_index, client, user_query, options)
+        if search_type == "clip":
+            return searchByClip(aoss_index, client, user_query, options)
+        return searchByImage(aoss_index, client, user_query, options)
+
+    with start_request(search_type, options["debug"]) as timings:
+        generation = None
+        # Debug requests always run the pipeline so the timings are real
+        if os.environ.get("index_generation_table") and not options["debug"]:
+            generation = get_generation(aoss_index, client)
+        try:
+            if len(resolve_indexes(aoss_index, client)) > MAX_FEDERATED_INDEXES:
+                raise ValueError(
+                    f"A search spans at most {MAX_FEDERATED_INDEXES} indexes"
+                )
+            if generation is None:
+                response = run_search_request()
+            else:
+                key = response_cache_key(
+                    aoss_index, generation, search_type, user_query, options
+                )
+                response = response_cache.get_or_compute(key, run_search_request)
+        except ValueError as e:  # e.g. a filter the index mapping cannot serve
+            return {"statusCode": 400, "body": json.dumps({"error": str(e)})}
+    emit_metrics(timings)
+
+    if options["debug"]:
+        response = {"results": response, "debug": timings.debug_report()}
     return {"statusCode": 200, "body": json.dumps(response)}
 
 
+def get_generation(aoss_index, client):
+    """
+    Cache generation of the searched indexes: the generation of a single name,
+    or all generations joined for a list or pattern. None if any is unknown.
+    """
+    names = []
+    for name in aoss_index.split(","):
+        if "*" in name:
+            names.extend(resolve_indexes(name, client))
+        else:
+            names.append(name)
+    generations = []
+    for name in names:
+        generation = get_index_generation(os.environ["index_generation_table"], name)
+        if generation is None:
+            return None
+        generations.append(str(generation))
+    return ".".join(generations)
+
+
+def get_search_options(params):
+    """Per-request search options, falling back to the function defaults."""
+    options = {
+        "retrieval": params.get("retrieval", SEARCH_RETRIEVAL_MODE),
+        "fusion": params.get("fusion", SEARCH_FUSION),
+        "merge_policy": params.get("merge_policy", MERGE_POLICY),
+        "segments_per_video": int(
+            params.get("segments_per_video", SEGMENTS_PER_VIDEO)
+        ),
+        # Return the per-stage timings and OpenSearch profile with the results
+        "debug": str(params.get("debug", "false")).lower() in ("1", "true"),
+        "filters": parse_filters(params),
+    }
+    if options["retrieval"] not in RETRIEVAL_MODES:
+        raise ValueError(f"Unsupported retrieval: {options['retrieval']}")
+    if options["fusion"] not in FUSION_METHODS:
+        raise ValueError(f"Unsupported fusion: {options['fusion']}")
+    if options["merge_policy"] not in MERGE_POLICIES:
+        raise ValueError(f"Unsupported merge_policy: {options['merge_policy']}")
+    if options["segments_per_video"] < 1:
+        raise ValueError("segments_per_video must be at least 1")
+    return options
+
+
 MAX_OPENSEARCH_RESULTS = 100
 OPENSEARCH_RELEVANCE_THRESHOLD = 0.5
 MAX_RERANK_RESULTS = 50
 RERANK_RELEVANCE_THRESHOLD = 0.05
 
+# "exact" scores every shot with script_score, "ann" uses the HNSW graphs and
+# "hybrid" fuses the HNSW results with a BM25 match on the shot text fields.
+RETRIEVAL_MODES = ("ann", "exact", "hybrid")
+FUSION_METHODS = ("weighted", "rrf")
+SEARCH_RETRIEVAL_MODE = os.environ.get("search_retrieval_mode", "ann")
+SEARCH_FUSION = os.environ.get("search_fusion", "weighted")
+TEXT_VECTOR_FIELDS = ["shot_desc_vector", "shot_transcript_vector"]
+# 75/25 weight split favouring shot description over transcript
+TEXT_VECTOR_WEIGHTS = [
+    float(weight)
+    for weight in os.environ.get("text_vector_weights", "0.75,0.25").split(",")
+]
+# Total boost of the exact script_score clauses, the original 3.0/1.0 split.
+# The weights are scaled to it so OPENSEARCH_RELEVANCE_THRESHOLD keeps cutting
+# exact scores where it always did
+EXACT_BOOST_TOTAL = 4.0
+RRF_RANK_CONSTANT = 60
+# Share of the BM25 list in hybrid fusion, the vector fields split the rest
+LEXICAL_WEIGHT = float(os.environ.get("lexical_weight", "0.3"))
+LEXICAL_FIELDS = [
+    "shot_publicFigures^2",
+    "shot_privateFigures^2",
+    "shot_description",
+    "shot_transcript",
+]
+QUOTED_PHRASE_PATTERN = re.compile(r'"(.*?)"')
+# The index parameter may list several indexes or use a pattern (season-*);
+# hit scores are then normalized per index before rerank
+MAX_FEDERATED_INDEXES = int(os.environ.get("max_federated_indexes", "10"))
+FEDERATED_NORMALIZATION = os.environ.get("federated_normalization", "minmax")
+# Only for indexes whose shots were all ingested with routing=jobId
+ROUTE_BY_JOB = os.environ.get("route_by_job", "false").lower() == "true"
+# k-NN engines that apply a "filter" while traversing the graph
+EFFICIENT_FILTER_ENGINES = ("faiss", "lucene")
+# Candidates fetched from a quantized graph per result, before exact rescoring
+RESCORE_OVERSAMPLE = {"fp16": 1.5, "int8": 2.0, "binary": 5.0}
+if os.environ.get("rescore_oversample"):
+    RESCORE_OVERSAMPLE = dict.fromkeys(
+        RESCORE_OVERSAMPLE, float(os.environ["rescore_oversample"])
+    )
+# Candidates fetched from the <field>_small vectors per result, see index_schema
+SMALL_VECTOR_OVERSAMPLE = float(os.environ.get("small_vector_oversample", "4"))
+# Upper bound of a rescore window in OpenSearch
+MAX_RESCORE_WINDOW = 10000
+SOURCE_FIELDS = [
+    "jobId",
+    "video_name",
+    "shot_id",
+    "shot_startTime",
+    "shot_endTime",
+    "shot_description",
+    "shot_publicFigures",
+    "shot_privateFigures",
+    "shot_transcript",
+]
 
-def searchByText(aoss_index, client, user_query):
-    query_embedding = get_text_embedding(os.environ["text_embedding_model"], user_query)
+# Indexes and field mappings per searched name, least recently used first
+index_mappings = OrderedDict()
+index_mappings_lock = threading.Lock()
+INDEX_MAPPING_CACHE_SIZE = int(os.environ.get("index_mapping_cache_size", "64"))
+INDEX_MAPPING_TTL = int(os.environ.get("index_mapping_ttl", "300"))
 
-    aoss_query = {
-        "size": MAX_OPENSEARCH_RESULTS,
-        "query": {
-            "bool": {
-                "should": [
-                    {
-                        "script_score": {
-                            "query": {"match_all": {}},
-                            "script": {
-                                "lang": "knn",
-                                "source": "knn_score",
-                                "params": {
-                                    "field": "shot_desc_vector",
-                                    "query_value": query_embedding,
-                                    "space_type": "cosinesimil",
-                                },
-                            },
-                            "boost": 3.0,  # 75/25 weight split favouring shot description over transcript
-                        }
-                    },
-                    {
-                        "script_score": {
-                            "query": {"match_all": {}},
-                            "script": {
-                                "lang": "knn",
-                                "source": "knn_score",
-                                "params": {
-                                    "field": "shot_transcript_vector",
-                                    "query_value": query_embedding,
-                                    "space_type": "cosinesimil",
-                                },
-                            },
-                            "boost": 1.0,
-                        }
-                    },
-                ],
-                "minimum_should_match": 1,
-            }
-        },
-        "_source": [
-            "jobId",
-            "video_name",
-            "shot_id",
-            "shot_startTime",
-            "shot_endTime",
-            "shot_description",
-            "shot_publicFigures",
-            "shot_privateFigures",
-            "shot_transcript",
-        ],
-    }
 
-    pattern = r'"(.*?)"'
-    matches = re.findall(pattern, user_query)
-    if len(matches) > 0:
-        aoss_query["query"]["bool"]["must"] = []
-        for match in matches:
-            aoss_query["query"]["bool"]["must"].append(
-                {
-                    "multi_match": {
-                        "query": match,
-                        "fields": [
-                            "shot_publicFigures",
-                            "shot_privateFigures",
-                            "shot_description",
-                            "shot_transcript",
-                        ],
-                        "type": "phrase",
-                    }
-                }
-            )
+def searchByText(aoss_index, client, user_query, options=None):
+    options = options or get_search_options({})
+    retrieval = options["retrieval"]
+    fusion = options["fusion"]
+    phrase_filters = get_phrase_filters(user_query)
+    filter_clauses = get_filter_clauses(aoss_index, client, options)
+    routing = get_routing(options)
 
-    response = client.search(body=aoss_query, index=aoss_index)
-    hits = response["hits"]["hits"]
-    unranked_results = []
-    for hit in hits:
-        if hit["_score"] >= OPENSEARCH_RELEVANCE_THRESHOLD:
-            unranked_results.append(
-                {
-                    "jobId": hit["_source"]["jobId"],
-                    "video_name": hit["_source"]["video_name"],
-                    "shot_id": hit["_source"]["shot_id"],
-                    "shot_startTime": hit["_source"]["shot_startTime"],
-                    "shot_endTime": hit["_source"]["shot_endTime"],
-                    "shot_description": hit["_source"]["shot_description"],
-                    "shot_publicFigures": hit["_source"]["shot_publicFigures"],
-                    "shot_privateFigures": hit["_source"]["shot_privateFigures"],
-                    "shot_transcript": hit["_source"]["shot_transcript"],
-                    "score": hit["_score"]  # Add score field
-                }
+    if retrieval == "hybrid":
+        hits = hybrid_text_search(
+            aoss_index,
+            client,
+            user_query,
+            phrase_filters,
+            fusion,
+            filter_clauses,
+            routing,
+        )
+    else:
+        with stage("embed"):
+            query_embedding = get_text_embedding(
+                os.environ["text_embedding_model"], user_query
+            )
+        filters = phrase_filters + filter_clauses
+        if retrieval == "exact":
+            hits = exact_text_search(
+                aoss_index, client, query_embedding, filters, routing
+            )
+        else:
+            hits = ann_text_search(
+                aoss_index, client, query_embedding, filters, fusion, routing
             )
-    rerank_results = rerank(user_query, unranked_results, MAX_RERANK_RESULTS)
-    ranked_results = []
-    for rerank_result in rerank_results:
-        if rerank_result["relevanceScore"] >= RERANK_RELEVANCE_THRESHOLD:
-            idx = rerank_result["index"]
-            unranked_results[idx]["score"] = rerank_result["relevanceScore"]
-            ranked_results.append(unranked_results[idx])
 
-    # Remove duplicates by keeping only the highest scoring result per video
-    deduplicated_results = deduplicate_by_video(ranked_results)
-    
-    return deduplicated_results
+    return rank_text_hits(user_query, hits, options)
 
 
-def deduplicate_by_video(results):
-    """
-    Remove duplicate videos by keeping only the highest scoring result per video.
-    For videos with multiple high-scoring segments, merge nearby segments.
-    """
-    video_results = {}
-    
-    # Group results by video
-    for result in results:
-        video_name = result["video_name"]
-        if video_name not in video_results:
-            video_results[video_name] = []
-        video_results[video_name].append(result)
-    
-    final_results = []
-    
-    for video_name, video_segments in video_results.items():
-        if len(video_segments) == 1:
-            # Only one segment for this video, keep it
-            final_results.append(video_segments[0])
-        else:
-            # Multiple segments for this video, apply smart deduplication
-            best_segment = smart_deduplicate_video_segments(video_segments)
-            final_results.append(best_segment)
-    
-    # Sort by score
-    final_results.sort(key=lambda x: x["score"], reverse=True)
-    
-    return final_results
+def rank_text_hits(user_query, hits, options):
+    """Threshold, rerank and merge the fused hits of one text query."""
+    # Fused ann lists were thresholded per field before fusion (see
+    # fuse_text_hits), and hybrid scores mix in a normalized BM25 share, so
+    # only exact scores are cut here
+    threshold = 0
+    if options["retrieval"] == "exact":
+        threshold = OPENSEARCH_RELEVANCE_THRESHOLD
+    unranked_results = normalize_per_index(
+        [hit_to_result(hit) for hit in hits if hit["_score"] >= threshold]
+    )
+    with stage("rerank"):
+        rerank_results = rerank(user_query, unranked_results, MAX_RERANK_RESULTS)
+    ranked_results = []
+    if rerank_results is None:  # top hit clearly wins, keep the k-NN order
+        ranked_results = unranked_results[:MAX_RERANK_RESULTS]
+    else:
+        for rerank_result in rerank_results:
+            if rerank_result["relevanceScore"] >= RERANK_RELEVANCE_THRESHOLD:
+                idx = rerank_result["index"]
+                unranked_results[idx]["score"] = rerank_result["relevanceScore"]
+                ranked_results.append(unranked_results[idx])
 
+    # Merge nearby hits into the top segments of each video
+    with stage("dedup"):
+        return merge_segments(
+            ranked_results,
+            options["merge_policy"],
+            MERGE_GAP_MS,
+            options["segments_per_video"],
+        )
 
-def smart_deduplicate_video_segments(segments):
-    """
-    Smart deduplication for multiple segments from the same video.
-    Merges nearby segments and keeps the best representative segment.
-    """
-    # Sort segments by score (highest first)
-    segments.sort(key=lambda x: x["score"], reverse=True)
-    
-    # Take the highest scoring segment as base
-    best_segment = segments[0].copy()
-    
-    # Check if there are other high-scoring segments nearby (within 30 seconds)
-    TIME_MERGE_THRESHOLD = 30  # seconds
-    
-    for segment in segments[1:]:
-        # Only consider segments with score >= 80% of the best score
-        if segment["score"] >= best_segment["score"] * 0.8:
-            best_start = float(best_segment["shot_startTime"])
-            best_end = float(best_segment["shot_endTime"])
-            seg_start = float(segment["shot_startTime"])
-            seg_end = float(segment["shot_endTime"])
-            
-            # Check if segments are close in time
-            time_gap = min(abs(seg_start - best_end), abs(best_start - seg_end))
-            
-            if time_gap <= TIME_MERGE_THRESHOLD:
-                # Merge segments by extending time range
-                best_segment["shot_startTime"] = str(min(best_start, seg_start))
-                best_segment["shot_endTime"] = str(max(best_end, seg_end))
-                
-                # Combine descriptions if different
-                if segment["shot_description"] != best_segment["shot_description"]:
-                    best_segment["shot_description"] += f" | {segment['shot_description']}"
-                
-                # Combine transcripts if different
-                if segment["shot_transcript"] != best_segment["shot_transcript"]:
-                    if best_segment["shot_transcript"] and segment["shot_transcript"]:
-                        best_segment["shot_transcript"] += f" {segment['shot_transcript']}"
-                    elif segment["shot_transcript"]:
-                        best_segment["shot_transcript"] = segment["shot_transcript"]
-    
-    return best_segment
-
-
-def rerank(user_query, unranked_results, num_results):
-    docs = []
-    for unranked_result in unranked_results:
-        docs.append(
+
+def get_phrase_filters(user_query):
+    """Quoted phrases in the query must match one of the shot text fields."""
+    phrase_filters = []
+    for match in QUOTED_PHRASE_PATTERN.findall(user_query):
+        phrase_filters.append(
             {
-                "shot_description": unranked_result["shot_description"],
-                "shot_publicFigures": unranked_result["shot_publicFigures"],
-                "shot_privateFigures": unranked_result["shot_privateFigures"],
-                "shot_transcript": unranked_result["shot_transcript"],
+                "multi_match": {
+                    "query": match,
+                    "fields": [
+                        "shot_publicFigures",
+                        "shot_privateFigures",
+                        "shot_description",
+                        "shot_transcript",
+                    ],
+                    "type": "phrase",
+                }
             }
         )
-    bedrock_agent_runtime = boto3.client(
-        "bedrock-agent-runtime", region_name="us-west-2"
+    return phrase_filters
+
+
+def get_filter_clauses(aoss_index, client, options):
+    """Clauses for the request's metadata filters under this index's mapping."""
+    if not options["filters"]:
+        return []
+    return build_filter_clauses(
+        options["filters"], get_field_mappings(aoss_index, client)
     )
-    rerank_model_id = "cohere.rerank-v3-5:0"
-    model_package_arn = f"arn:aws:bedrock:us-west-2::foundation-model/{rerank_model_id}"
-    sources = []
-    for doc in docs:
-        sources.append(
+
+
+def get_routing(options):
+    """Shard routing for jobId-filtered requests, when shots are routed by job."""
+    if ROUTE_BY_JOB and "jobId" in options["filters"]:
+        return ",".join(options["filters"]["jobId"])
+    return None
+
+
+def search_header(aoss_index, routing):
+    header = {"index": aoss_index}
+    if routing:
+        header["routing"] = routing
+    return header
+
+
+def exact_text_search(aoss_index, client, query_embedding, filters, routing=None):
+    """Brute-force cosine scoring of every shot on both text vectors."""
+    response = run_search(
+        client,
+        aoss_index,
+        build_exact_text_query(query_embedding, filters),
+        "exact_text",
+        routing=routing,
+    )
+    return response["hits"]["hits"]
+
+
+def build_exact_text_query(query_embedding, filters):
+    should = []
+    boost_scale = EXACT_BOOST_TOTAL / sum(TEXT_VECTOR_WEIGHTS)
+    for field, weight in zip(TEXT_VECTOR_FIELDS, TEXT_VECTOR_WEIGHTS):
+        should.append(
             {
-                "inlineDocumentSource": {
-                    "jsonDocument": doc,
-                    "type": "JSON",
-                },
-                "type": "INLINE",
+                "script_score": {
+                    "query": {"match_all": {}},
+                    "script": {
+                        "lang": "knn",
+                        "source": "knn_score",
+                        "params": {
+                            "field": field,
+                            "query_value": query_embedding,
+                            "space_type": "cosinesimil",
+                        },
+                    },
+                    "boost": weight * boost_scale,
+                }
             }
         )
-    response = bedrock_agent_runtime.rerank(
-        queries=[{"type": "TEXT", "textQuery": {"text": user_query}}],
-        sources=sources,
-        rerankingConfiguration={
-            "type": "BEDROCK_RERANKING_MODEL",
-            "bedrockRerankingConfiguration": {
-                "numberOfResults": min(num_results, len(docs)),
-                "modelConfiguration": {
-                    "modelArn": model_package_arn,
-                    # "additionalModelRequestFields": {
-                    #     "rank_fields": ["shot_description", "shot_transcript"]
-                    # },
-                },
-            },
-        },
+    aoss_query = {
+        "size": MAX_OPENSEARCH_RESULTS,
+        "query": {"bool": {"should": should, "minimum_should_match": 1}},
+        "_source": SOURCE_FIELDS,
+    }
+    if filters:
+        aoss_query["query"]["bool"]["filter"] = filters
+    return aoss_query
+
+
+def ann_text_search(
+    aoss_index, client, query_embedding, filters, fusion, routing=None
+):
+    """
+    Run one HNSW k-NN query per text vector field in a single _msearch and
+    fuse the ranked lists.
+    """
+    ranked_hits = ann_ranked_hits(
+        aoss_index, client, query_embedding, filters, routing
     )
-    return response["results"]
+    return fuse_text_hits(ranked_hits, fusion)
+
+
+def fuse_text_hits(ranked_hits, fusion):
+    """
+    Fuse the per-field k-NN lists of a text query. With weighted fusion the
+    similarity threshold applies to each list, as a shot missing from a list
+    adds nothing to its fused score. RRF scores are rank based and keep every
+    hit for rerank.
+    """
+    if fusion == "weighted":
+        ranked_hits = [
+            [hit for hit in hits if hit["_score"] >= OPENSEARCH_RELEVANCE_THRESHOLD]
+            for hits in ranked_hits
+        ]
+    return fuse_ranked_hits(ranked_hits, TEXT_VECTOR_WEIGHTS, fusion)[
+        :MAX_OPENSEARCH_RESULTS
+    ]
+
+
+def ann_ranked_hits(aoss_index, client, query_embedding, filters, routing=None):
+    """One ranked hit list per text vector field, from a single _msearch."""
+    msearch_body = []
+    for field in TEXT_VECTOR_FIELDS:
+        msearch_body.append(search_header(aoss_index, routing))
+        msearch_body.append(
+            build_knn_query(
+                aoss_index,
+                client,
+                field,
+                query_embedding,
+                MAX_OPENSEARCH_RESULTS,
+                filters,
+            )
+        )
+    response = run_msearch(client, msearch_body, "ann_text")
+
+    ranked_hits = []
+    for field, field_response in zip(TEXT_VECTOR_FIELDS, response["responses"]):
+        if "error" in field_response:
+            raise Exception(f"k-NN search failed: {field_response['error']}")
+        hits = field_response["hits"]["hits"]
+        if uses_exact_scores(aoss_index, client, field, filters):
+            hits = rescale_exact_scores(hits)
+        ranked_hits.append(hits)
+    return ranked_hits
+
+
+def hybrid_text_search(
+    aoss_index,
+    client,
+    user_query,
+    phrase_filters,
+    fusion,
+    filter_clauses=(),
+    routing=None,
+):
+    """
+    BM25 over the shot text fields fused with the k-NN lists. The BM25 query
+    runs while the query is being embedded; a query made only of quoted
+    phrases is answered by BM25 alone without calling the embedding model.
+    """
+    free_text = QUOTED_PHRASE_PATTERN.sub(" ", user_query).strip()
+    lexical_query = build_lexical_query(free_text, phrase_filters, filter_clauses)
+    if not free_text:
+        return lexical_text_search(aoss_index, client, lexical_query, routing)
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        # Copy the context so the BM25 search is timed with this request
+        lexical_future = executor.submit(
+            contextvars.copy_context().run,
+            lexical_text_search,
+            aoss_index,
+            client,
+            lexical_query,
+            routing,
+        )
+        with stage("embed"):
+            query_embedding = get_text_embedding(
+                os.environ["text_embedding_model"], user_query
+            )
+        ranked_hits = ann_ranked_hits(
+            aoss_index,
+            client,
+            query_embedding,
+            phrase_filters + list(filter_clauses),
+            routing,
+        )
+        lexical_hits = lexical_future.result()
+    return fuse_hybrid_hits(ranked_hits, lexical_hits, fusion)
+
+
+def fuse_hybrid_hits(ranked_hits, lexical_hits, fusion):
+    if fusion == "weighted":
+        lexical_hits = normalize_scores(lexical_hits)
+    weights = [weight * (1 - LEXICAL_WEIGHT) for weight in TEXT_VECTOR_WEIGHTS]
+    return fuse_ranked_hits(
+        ranked_hits + [lexical_hits], weights + [LEXICAL_WEIGHT], fusion
+    )[:MAX_OPENSEARCH_RESULTS]
+
 
+def build_lexical_query(free_text, phrase_filters, filter_clauses=()):
+    query = {"bool": {}}
+    if free_text:
+        query["bool"]["should"] = [
+            {"multi_match": {"query": free_text, "fields": LEXICAL_FIELDS}}
+        ]
+    if phrase_filters:
+        query["bool"]["must"] = phrase_filters
+    if filter_clauses:
+        query["bool"]["filter"] = list(filter_clauses)
+    return {"size": MAX_OPENSEARCH_RESULTS, "query": query, "_source": SOURCE_FIELDS}
 
-def get_opensearch_client(host, region, index):
-    host = host.split("://")[1] if "://" in host else host
-    credentials = boto3.Session().get_credentials()
-    auth = AWSV4SignerAuth(credentials, region, "aoss")
 
-    client = OpenSearch(
-        hosts=[{"host": host, "port": 443}],
-        http_auth=auth,
-        use_ssl=True,
-        verify_certs=True,
-        connection_class=RequestsHttpConnection,
-        pool_maxsize=20,
+def lexical_text_search(aoss_index, client, lexical_query, routing=None):
+    response = run_search(
+        client, aoss_index, lexical_query, "lexical", "lexical", routing
     )
+    return response["hits"]["hits"]
+
+
+def normalize_scores(hits):
+    """Min-max scale BM25 scores to [0, 1] so they can be weighted with cosine."""
+    if not hits:
+        return hits
+    highest = hits[0]["_score"]
+    lowest = hits[-1]["_score"]
+    spread = highest - lowest
+    return [
+        dict(hit, _score=(hit["_score"] - lowest) / spread if spread else 1.0)
+        for hit in hits
+    ]
+
+
+def run_search(client, aoss_index, body, label, stage_name="knn", routing=None):
+    """client.search timed as a pipeline stage, profiled in debug mode."""
+    if profiling_enabled():
+        body = dict(body, profile=True)
+    params = {"routing": routing} if routing else None
+    with stage(stage_name):
+        response = client.search(body=body, index=aoss_index, params=params)
+    record_profile(label, response.get("profile"))
+    return response
 
-    return client
 
+def run_msearch(client, msearch_body, label):
+    """client.msearch timed as the k-NN stage, profiled in debug mode."""
+    if profiling_enabled():
+        # Every other line is a query body, the rest are headers
+        msearch_body = [
+            dict(line, profile=True) if position % 2 else line
+            for position, line in enumerate(msearch_body)
+        ]
+    with stage("knn"):
+        response = client.msearch(body=msearch_body)
+    for position, sub_response in enumerate(response["responses"]):
+        record_profile(f"{label}[{position}]", sub_response.get("profile"))
+    return response
 
-def searchByImage(aoss_index, client, user_query):
-    image_embedding = get_titan_image_embedding(
-        os.environ["image_embedding_model"], user_query
+
+def build_knn_query(aoss_index, client, field, vector, k, filters):
+    knn = {"vector": vector, "k": k}
+    query = {"knn": {field: knn}}
+    if uses_exact_prefilter(aoss_index, client, field, filters):
+        # nmslib cannot filter inside the graph: score only the shots that
+        # pass the filter exactly, which is still a full top-k
+        return {
+            "size": k,
+            "query": exact_vector_query({"bool": {"filter": filters}}, field, vector),
+            "_source": SOURCE_FIELDS,
+        }
+    if filters:
+        # Filter applied during graph traversal, so k hits still come back
+        knn["filter"] = {"bool": {"must": filters}}
+
+    body = {"size": k, "query": query, "_source": SOURCE_FIELDS}
+    oversample = 1
+    small_field = get_small_vector_field(aoss_index, client, field)
+    if small_field:
+        # Walk the graph of the truncated vectors instead of the full ones
+        dimension = get_field_mappings(aoss_index, client)[small_field]["dimension"]
+        knn["vector"] = truncate_vector(vector, dimension)
+        query["knn"] = {small_field: knn}
+        oversample = SMALL_VECTOR_OVERSAMPLE
+    quantization = get_vector_quantization(aoss_index, client, small_field or field)
+    if quantization != "none":
+        oversample *= RESCORE_OVERSAMPLE[quantization]
+    if small_field or quantization != "none":
+        # The graph only shortlists; the full-precision vectors of the
+        # shortlist decide the order and the scores
+        window = min(int(k * oversample), MAX_RESCORE_WINDOW)
+        knn["k"] = window
+        body["rescore"] = {
+            "window_size": window,
+            "query": {
+                "rescore_query": exact_vector_query({"match_all": {}}, field, vector),
+                "query_weight": 0,
+                "rescore_query_weight": 1,
+            },
+        }
+    return body
+
+
+def exact_vector_query(query, field, vector):
+    """Exact cosine score (1 + cos) of the shots matching query."""
+    return {
+        "script_score": {
+            "query": query,
+            "script": {
+                "lang": "knn",
+                "source": "knn_score",
+                "params": {
+                    "field": field,
+                    "query_value": vector,
+                    "space_type": "cosinesimil",
+                },
+            },
+        }
+    }
+
+
+def uses_exact_prefilter(aoss_index, client, field, filters):
+    return bool(filters) and (
+        get_knn_engine(aoss_index, client, field) not in EFFICIENT_FILTER_ENGINES
     )
 
-    aoss_query = {
-        "size": 50,
-        "query": {"knn": {"shot_image_vector": {"vector": image_embedding, "k": 50}}},
-        "_source": [
-            "jobId",
-            "video_name",
-            "shot_id",
-            "shot_startTime",
-            "shot_endTime",
-            "shot_description",
-            "shot_publicFigures",
-            "shot_privateFigures",
-            "shot_transcript",
-        ],
+
+def uses_exact_scores(aoss_index, client, field, filters):
+    """Whether a build_knn_query body returns knn_score rather than k-NN scores."""
+    return (
+        uses_exact_prefilter(aoss_index, client, field, filters)
+        or get_small_vector_field(aoss_index, client, field) is not None
+        or get_vector_quantization(aoss_index, client, field) != "none"
+    )
+
+
+def rescale_exact_scores(hits):
+    """
+    Map knn_score cosine scores (1 + cos) onto the k-NN query scale
+    (1 / (2 - cos)) so exactly scored and graph hits share thresholds and
+    weights, whichever engine or quantization an index uses.
+    """
+    return [dict(hit, _score=1 / (3 - hit["_score"])) for hit in hits]
+
+
+def get_knn_engine(aoss_index, client, field):
+    """The k-NN engine backing a vector field, nmslib if the mapping is unknown."""
+    method = get_field_mappings(aoss_index, client).get(field, {}).get("method", {})
+    return method.get("engine", "nmslib")
+
+
+def get_vector_quantization(aoss_index, client, field):
+    return vector_quantization(get_field_mappings(aoss_index, client).get(field, {}))
+
+
+def get_small_vector_field(aoss_index, client, field):
+    """The <field>_small shortlist field if every searched index has one."""
+    small_field = small_vector_field(field)
+    mapping = get_field_mappings(aoss_index, client).get(small_field, {})
+    if mapping.get("type") == "knn_vector" and "dimension" in mapping:
+        return small_field
+    return None
+
+
+def get_field_mappings(aoss_index, client):
+    return get_index_info(aoss_index, client)["properties"]
+
+
+def resolve_indexes(aoss_index, client):
+    """Physical indexes behind an index, alias, comma-separated list or pattern."""
+    return get_index_info(aoss_index, client)["indexes"]
+
+
+def get_index_info(aoss_index, client):
+    """
+    Look up the indexes and field mappings of a name, cached per container for
+    INDEX_MAPPING_TTL seconds or until the generation of a named index changes,
+    e.g. when migrate_index swaps an alias to a new index. A failed lookup
+    falls back to the defaults for this call only and is retried on the next.
+    """
+    now = time.monotonic()
+    generation = get_mapping_generation(aoss_index)
+    with index_mappings_lock:
+        entry = index_mappings.get(aoss_index)
+        if (
+            entry is not None
+            and entry["expires_at"] > now
+            and entry["generation"] == generation
+        ):
+            index_mappings.move_to_end(aoss_index)
+            return entry["info"]
+
+    try:
+        mappings = client.indices.get_mapping(index=aoss_index)
+    except Exception as e:
+        logging.warning(f"Could not read mapping of {aoss_index}: {e}")
+        return {"indexes": aoss_index.split(","), "properties": {}}
+    info = {
+        "indexes": sorted(mappings),
+        "properties": merge_field_mappings(
+            [
+                index_mapping["mappings"].get("properties", {})
+                for index_mapping in mappings.values()
+            ]
+        ),
     }
+    with index_mappings_lock:
+        index_mappings[aoss_index] = {
+            "info": info,
+            "generation": generation,
+            "expires_at": now + INDEX_MAPPING_TTL,
+        }
+        index_mappings.move_to_end(aoss_index)
+        while len(index_mappings) > INDEX_MAPPING_CACHE_SIZE:
+            index_mappings.popitem(last=False)
+    return info
 
-    response = client.search(body=aoss_query, index=aoss_index)
-    hits = response["hits"]["hits"]
-    results = []
-    for hit in hits:
-        if hit["_score"] >= 0:  # Set score threshold
-            results.append(
-                {
-                    "jobId": hit["_source"]["jobId"],
-                    "video_name": hit["_source"]["video_name"],
-                    "shot_id": hit["_source"]["shot_id"],
-                    "shot_startTime": hit["_source"]["shot_startTime"],
-                    "shot_endTime": hit["_source"]["shot_endTime"],
-                    "shot_description": hit["_source"]["shot_description"],
-                    "shot_publicFigures": hit["_source"]["shot_publicFigures"],
-                    "shot_privateFigures": hit["_source"]["shot_privateFigures"],
-                    "shot_transcript": hit["_source"]["shot_transcript"],
-                    "score": hit["_score"],
+
+def get_mapping_generation(aoss_index):
+    """
+    Generations of the indexes and aliases named in aoss_index, None without a
+    generation table. A pattern stands for the catalog generation, which moves
+    when a new index receives its first shot, so the pattern is resolved again.
+    """
+    if not os.environ.get("index_generation_table"):
+        return None
+    names = {CATALOG_KEY if "*" in name else name for name in aoss_index.split(",")}
+    return tuple(
+        get_index_generation(os.environ["index_generation_table"], name)
+        for name in sorted(names)
+    )
+
+
+def merge_field_mappings(all_properties):
+    """
+    One mapping per field that is valid for every index searched together.
+    Vector fields on different engines fall back to exact prefiltering, other
+    conflicting fields to match_phrase filters (no numeric range). A vector
+    field missing from some of the indexes is left out, so no k-NN query
+    targets it, and any other such field counts as conflicting.
+    """
+    merged = {}
+    presence = Counter()
+    for properties in all_properties:
+        for field, mapping in properties.items():
+            presence[field] += 1
+            if field not in merged:
+                merged[field] = mapping
+            elif merged[field] != mapping:
+                if merged[field].get("type") == mapping.get("type") == "knn_vector":
+                    merged[field] = {"type": "knn_vector", "method": {}}
+                else:
+                    merged[field] = {"type": "mixed"}
+    for field, count in presence.items():
+        if count < len(all_properties):
+            if merged[field].get("type") == "knn_vector":
+                del merged[field]
+            else:
+                merged[field] = {"type": "mixed"}
+    return merged
+
+
+def fuse_ranked_hits(ranked_hits, weights, fusion):
+    """
+    Merge several ranked hit lists into one.
+    "weighted" sums the weighted similarity scores, "rrf" sums weighted
+    reciprocal ranks, so a shot missing from one list simply gets no share.
+    """
+    fused = {}
+    for hits, weight in zip(ranked_hits, weights):
+        for rank, hit in enumerate(hits):
+            # Ids are only unique within an index
+            key = (hit.get("_index"), hit["_id"])
+            if key not in fused:
+                fused[key] = {
+                    "_index": hit.get("_index"),
+                    "_id": hit["_id"],
+                    "_source": hit["_source"],
+                    "_score": 0.0,
                 }
-            )
+            if fusion == "rrf":
+                fused[key]["_score"] += weight / (RRF_RANK_CONSTANT + rank + 1)
+            else:
+                fused[key]["_score"] += weight * hit["_score"]
 
-    # Apply deduplication to image search results
-    deduplicated_results = deduplicate_by_video(results)
-    
-    return deduplicated_results
+    return sorted(fused.values(), key=lambda x: x["_score"], reverse=True)
 
 
-MAX_CLIPSEARCH_RELEVANCE_THRESHOLD = 0.75
+IMAGE_SEARCH_RESULTS = 50
+IMAGE_RELEVANCE_THRESHOLD = 0
+# Bounded concurrency for the per-frame Bedrock embedding calls of clip search
+CLIP_EMBEDDING_WORKERS = 10
 
 
-def searchByClip(aoss_index, client, user_query):
-    tmp_clip_dir = os.environ["tmp_dir"] + "/clip/"
-    tmp_frames_dir = os.environ["tmp_dir"] + "/" + user_query + "/"
-    os.makedirs(tmp_clip_dir, exist_ok=True)
-    os.makedirs(tmp_frames_dir, exist_ok=True)
-    ffmpeg_path = "/opt/bin/ffmpeg"
-    local_clip_path = os.path.join(tmp_clip_dir, user_query)
-    s3_client.download_file(
-        os.environ["bucket_clip_search"], user_query, local_clip_path
+def searchByImage(aoss_index, client, user_query, options=None):
+    # Pillow is imported on first use, text-only cold starts skip it
+    from image_preprocessing import prepare_query_image
+
+    options = options or get_search_options({})
+    filters = get_filter_clauses(aoss_index, client, options)
+    # Rejects non-images and oversized uploads before any Bedrock call
+    with stage("preprocess"):
+        image_data, image_hash = prepare_query_image(user_query)
+    with stage("embed"):
+        image_embedding = get_titan_image_embedding(
+            os.environ["image_embedding_model"], image_data, image_hash
+        )
+
+    response = run_search(
+        client,
+        aoss_index,
+        build_image_knn_query(aoss_index, client, image_embedding, filters),
+        "image",
+        routing=get_routing(options),
     )
+    hits = response["hits"]["hits"]
+    if uses_exact_scores(aoss_index, client, "shot_image_vector", filters):
+        hits = rescale_exact_scores(hits)
+    return rank_image_hits(hits, options)
 
-    output_pattern = f"{tmp_frames_dir}%03d.png"
-    try:
-        subprocess.run(
-            [
-                ffmpeg_path,
-                "-i",
-                local_clip_path,
-                "-vf",
-                "fps=1,select='lte(n,10)'",  # 1 FPS, up to 10 frames
-                "-vsync",
-                "0",
-                "-q:v",
-                "1",
-                output_pattern,
-            ],
-            stderr=subprocess.PIPE,
+
+def rank_image_hits(hits, options):
+    results = normalize_per_index(image_hits_to_results(hits))
+
+    # Merge nearby hits into the top segments of each video
+    with stage("dedup"):
+        return merge_segments(
+            results,
+            options["merge_policy"],
+            MERGE_GAP_MS,
+            options["segments_per_video"],
         )
 
-        extracted_frames = glob.glob(f"{tmp_frames_dir}*.png")
-        num_frames = len(extracted_frames)
-        all_frame_search_res = []
-        with ThreadPoolExecutor(max_workers=num_frames) as executor:
-            future_to_frame = {}
-            for frame_path in extracted_frames:
-                future = executor.submit(
-                    lambda p: base64.b64encode(open(p, "rb").read()).decode(),
-                    frame_path,
+
+def searchByImageEmbeddings(
+    aoss_index, client, image_embeddings, filters=None, routing=None
+):
+    """Search several image embeddings with a single _msearch round trip."""
+    msearch_body = []
+    for image_embedding in image_embeddings:
+        msearch_body.append(search_header(aoss_index, routing))
+        msearch_body.append(
+            build_image_knn_query(aoss_index, client, image_embedding, filters)
+        )
+    response = run_msearch(client, msearch_body, "image")
+    exact = uses_exact_scores(aoss_index, client, "shot_image_vector", filters)
+
+    all_results = []
+    for image_response in response["responses"]:
+        if "error" in image_response:
+            raise Exception(f"k-NN search failed: {image_response['error']}")
+        hits = image_response["hits"]["hits"]
+        if exact:
+            hits = rescale_exact_scores(hits)
+        all_results.append(image_hits_to_results(hits))
+    return all_results
+
+
+def build_image_knn_query(aoss_index, client, image_embedding, filters=None):
+    return build_knn_query(
+        aoss_index,
+        client,
+        "shot_image_vector",
+        image_embedding,
+        IMAGE_SEARCH_RESULTS,
+        filters,
+    )
+
+
+def image_hits_to_results(hits):
+    return [
+        hit_to_result(hit)
+        for hit in hits
+        if hit["_score"] >= IMAGE_RELEVANCE_THRESHOLD
+    ]
+
+
+def normalize_per_index(results):
+    """
+    Min-max scale the scores of each index when results come from several,
+    so no index dominates only because its scores run higher. Keeps the order
+    sorted by the new score.
+    """
+    if FEDERATED_NORMALIZATION != "minmax":
+        return results
+    index_scores = {}
+    for result in results:
+        index_scores.setdefault(result["index"], []).append(result["score"])
+    if len(index_scores) < 2:
+        return results
+    for result in results:
+        scores = index_scores[result["index"]]
+        spread = max(scores) - min(scores)
+        result["score"] = (result["score"] - min(scores)) / spread if spread else 1.0
+    return sorted(results, key=lambda x: x["score"], reverse=True)
+
+
+def hit_to_result(hit):
+    return {
+        "index": hit.get("_index"),
+        "jobId": hit["_source"]["jobId"],
+        "video_name": hit["_source"]["video_name"],
+        "shot_id": hit["_source"]["shot_id"],
+        "shot_startTime": hit["_source"]["shot_startTime"],
+        "shot_endTime": hit["_source"]["shot_endTime"],
+        "shot_description": hit["_source"]["shot_description"],
+        "shot_publicFigures": join_figures(hit["_source"]["shot_publicFigures"]),
+        "shot_privateFigures": join_figures(hit["_source"]["shot_privateFigures"]),
+        "shot_transcript": hit["_source"]["shot_transcript"],
+        "score": hit["_score"],
+    }
+
+
+MAX_CLIPSEARCH_RELEVANCE_THRESHOLD = 0.75
+# Keyframes at scene changes, or every CLIP_MAX_FRAME_INTERVAL seconds without one
+CLIP_SCENE_THRESHOLD = float(os.environ.get("clip_scene_threshold", "0.3"))
+CLIP_MAX_FRAME_INTERVAL = float(os.environ.get("clip_max_frame_interval", "2"))
+# Near-duplicate keyframes (dHash distance in bits) are dropped, then the rest
+# is thinned over the clip down to the budget
+CLIP_FRAME_HASH_DISTANCE = int(os.environ.get("clip_frame_hash_distance", "5"))
+CLIP_FRAME_BUDGET = int(os.environ.get("clip_frame_budget", "10"))
+# "url" lets ffmpeg range-read a presigned URL, "pipe" streams the object body
+CLIP_FRAME_SOURCE = os.environ.get("clip_frame_source", "url")
+CLIP_SEARCH_TOP_K = int(os.environ.get("clip_search_top_k", "5"))
+# Longer clips are rejected, and frames are scaled down to CLIP_FRAME_MAX_EDGE
+CLIP_MAX_DURATION = float(os.environ.get("clip_max_duration", "600"))
+CLIP_FRAME_MAX_EDGE = int(os.environ.get("image_max_edge", "1024"))
+
+
+def searchByClip(aoss_index, client, user_query, options=None):
+    # NumPy and Pillow are imported on first use, text-only cold starts skip them
+    from clip_aggregation import top_alignments
+    from clip_frames import keyframe_filter, select_keyframes, stream_clip_frames
+    from image_preprocessing import prepare_image_bytes
+
+    options = options or get_search_options({})
+    image_embedding_model = os.environ["image_embedding_model"]
+    clip_info = {}
+    frames = select_keyframes(
+        stream_clip_frames(
+            s3_client,
+            os.environ["bucket_clip_search"],
+            user_query,
+            keyframe_filter(
+                CLIP_SCENE_THRESHOLD, CLIP_MAX_FRAME_INTERVAL, CLIP_FRAME_MAX_EDGE
+            ),
+            CLIP_FRAME_SOURCE,
+            CLIP_MAX_DURATION,
+            clip_info,
+        ),
+        CLIP_FRAME_BUDGET,
+        CLIP_FRAME_HASH_DISTANCE,
+        clip_info,
+    )
+    frame_times = []
+    futures = []
+    with ThreadPoolExecutor(max_workers=CLIP_EMBEDDING_WORKERS) as executor:
+        # Frames are submitted as they pass dedup, so embedding overlaps decoding
+        with stage("clip_frames"):
+            for timestamp_ms, frame in frames:
+                frame_times.append(timestamp_ms)
+                futures.append(
+                    executor.submit(
+                        lambda frame: get_titan_image_embedding(
+                            image_embedding_model, *prepare_image_bytes(frame)
+                        ),
+                        frame,
+                    )
                 )
-                future_to_frame[future] = frame_path
-
-            for future in as_completed(future_to_frame):
-                base64_image = future.result()
-                frame_search_res = searchByImage(aoss_index, client, base64_image)
-                all_frame_search_res.append(frame_search_res)
-
-        # Aggregate results
-        aggregated_results = {}
-        for index, frame_search_res in enumerate(all_frame_search_res):
-            processed_videos = set()
-            for item in frame_search_res:
-                video_name = item["video_name"]
-                if video_name not in processed_videos:
-                    processed_videos.add(video_name)
-
-                    if video_name not in aggregated_results:
-                        aggregated_results[video_name] = {
-                            "scores": [0] * num_frames,
-                            "data": item,
-                        }
-                    # For every frame search, only take into account the highest score of a video in the result
-                    aggregated_results[video_name]["scores"][index] = item["score"]
-                    if (
-                        item["shot_startTime"]
-                        < aggregated_results[video_name]["data"]["shot_startTime"]
-                    ):
-                        aggregated_results[video_name]["data"]["shot_startTime"] = item[
-                            "shot_startTime"
-                        ]
-                    if (
-                        item["shot_endTime"]
-                        > aggregated_results[video_name]["data"]["shot_endTime"]
-                    ):
-                        aggregated_results[video_name]["data"]["shot_endTime"] = item[
-                            "shot_endTime"
-                        ]
-
-        # Calculate score averages and find the best result
-        response = []
-
-        for video_name, result in aggregated_results.items():
-            result["average_score"] = sum(result["scores"]) / num_frames
-
-        if aggregated_results:
-            best_result = max(
-                aggregated_results.values(), key=lambda x: x["average_score"]
+        with stage("embed"):
+            frame_embeddings = [future.result() for future in futures]
+    if None in frame_times:
+        frame_times = None
+
+    all_frame_search_res = []
+    if frame_embeddings:
+        all_frame_search_res = searchByImageEmbeddings(
+            aoss_index,
+            client,
+            frame_embeddings,
+            get_filter_clauses(aoss_index, client, options),
+            get_routing(options),
+        )
+
+    # Align the frames to each video's shots in time order and keep the best spans
+    with stage("dedup"):
+        return top_alignments(
+            all_frame_search_res,
+            CLIP_SEARCH_TOP_K,
+            MAX_CLIPSEARCH_RELEVANCE_THRESHOLD,
+            frame_times,
+        )
+
+
+MAX_BATCH_QUERIES = int(os.environ.get("max_batch_queries", "50"))
+# Bounded concurrency for batch embeddings and the per-query rerank and merge
+BATCH_WORKERS = 10
+
+
+def get_batch_queries(params):
+    """Validated [type, query] pairs of a batch request body."""
+    queries = params["queries"]
+    if not isinstance(queries, list) or not queries:
+        raise ValueError("queries must be a non-empty list")
+    if len(queries) > MAX_BATCH_QUERIES:
+        raise ValueError(f"A batch holds at most {MAX_BATCH_QUERIES} queries")
+    batch = []
+    for index, query in enumerate(queries):
+        if not isinstance(query, dict):
+            raise ValueError(f"queries[{index}] must be an object")
+        if query.get("type") not in ("text", "image"):
+            raise ValueError(
+                f"queries[{index}] has an unsupported type: {query.get('type')}"
             )
-            best_result["data"]["average_score"] = best_result["average_score"]
-            best_result["data"]["occurrence_count"] = sum(
-                score > 0 for score in best_result["scores"]
+        user_query = query.get("query")
+        if not isinstance(user_query, str) or not user_query:
+            raise ValueError(f"queries[{index}].query must be a non-empty string")
+        if query["type"] == "image" and user_query.startswith("data:image"):
+            user_query = user_query.split(",")[1]
+        batch.append([query["type"], user_query])
+    return batch
+
+
+def searchBatch(aoss_index, client, queries, options=None):
+    """
+    Run many text and image queries in one request. Embeddings are computed
+    together (a single call for models that take several texts), every
+    OpenSearch query goes out in one _msearch, and the per-query rerank and
+    merge run in parallel. Results are returned in query order.
+    """
+    options = options or get_search_options({})
+    retrieval = options["retrieval"]
+    filter_clauses = get_filter_clauses(aoss_index, client, options)
+    routing = get_routing(options)
+
+    # Hybrid text queries made only of quoted phrases need no embedding
+    needs_embedding = [
+        query_type == "image"
+        or retrieval != "hybrid"
+        or bool(QUOTED_PHRASE_PATTERN.sub(" ", user_query).strip())
+        for query_type, user_query in queries
+    ]
+    texts = [
+        user_query
+        for (query_type, user_query), needed in zip(queries, needs_embedding)
+        if query_type == "text" and needed
+    ]
+    images = []
+    with stage("preprocess"):
+        for position, (query_type, user_query) in enumerate(queries):
+            if query_type == "image":
+                from image_preprocessing import prepare_query_image
+
+                try:
+                    images.append(prepare_query_image(user_query))
+                except ValueError as e:
+                    raise ValueError(f"Query {position}: {e}")
+    image_embedding_model = os.environ["image_embedding_model"]
+    with stage("embed"):
+        text_embeddings = iter(
+            get_text_embeddings(os.environ["text_embedding_model"], texts)
+        )
+        with ThreadPoolExecutor(max_workers=BATCH_WORKERS) as executor:
+            image_embeddings = iter(
+                list(
+                    executor.map(
+                        lambda image: get_titan_image_embedding(
+                            image_embedding_model, *image
+                        ),
+                        images,
+                    )
+                )
             )
-            if (
-                best_result["data"]["average_score"]
-                >= MAX_CLIPSEARCH_RELEVANCE_THRESHOLD
+
+    plans = []
+    msearch_body = []
+    for (query_type, user_query), needed in zip(queries, needs_embedding):
+        if query_type == "image":
+            embedding = next(image_embeddings)
+        else:
+            embedding = next(text_embeddings) if needed else None
+        plan = plan_batch_query(
+            aoss_index,
+            client,
+            query_type,
+            user_query,
+            embedding,
+            retrieval,
+            filter_clauses,
+        )
+        plans.append(plan)
+        for _, _, body in plan["requests"]:
+            msearch_body.append(search_header(aoss_index, routing))
+            msearch_body.append(body)
+    responses = iter(run_msearch(client, msearch_body, "batch")["responses"])
+
+    tasks = []
+    for plan in plans:
+        ranked_hits = []
+        lexical_hits = None
+        for kind, field, _ in plan["requests"]:
+            response = next(responses)
+            if "error" in response:
+                raise Exception(f"Batch search failed: {response['error']}")
+            hits = response["hits"]["hits"]
+            if kind == "lexical":
+                lexical_hits = hits
+                continue
+            if kind == "knn" and uses_exact_scores(
+                aoss_index, client, field, plan["filters"]
             ):
-                response.append(
-                    {
-                        "video_name": best_result["data"]["video_name"],
-                        "shot_startTime": best_result["data"]["shot_startTime"],
-                        "shot_endTime": best_result["data"]["shot_endTime"],
-                        "score": best_result["data"]["average_score"],
-                    }
+                hits = rescale_exact_scores(hits)
+            ranked_hits.append(hits)
+
+        if plan["type"] == "image" or retrieval == "exact":
+            hits = ranked_hits[0]
+        elif retrieval == "hybrid":
+            hits = lexical_hits
+            if ranked_hits:
+                hits = fuse_hybrid_hits(ranked_hits, lexical_hits, options["fusion"])
+        else:
+            hits = fuse_text_hits(ranked_hits, options["fusion"])
+        tasks.append((plan["type"], plan["query"], hits))
+
+    def rank_batch_hits(query_type, user_query, hits):
+        if query_type == "image":
+            return rank_image_hits(hits, options)
+        return rank_text_hits(user_query, hits, options)
+
+    # One context copy per task so the stage timings reach this request
+    contexts = [contextvars.copy_context() for _ in tasks]
+    with ThreadPoolExecutor(max_workers=BATCH_WORKERS) as executor:
+        return list(
+            executor.map(
+                lambda context, task: context.run(rank_batch_hits, *task),
+                contexts,
+                tasks,
+            )
+        )
+
+
+def plan_batch_query(
+    aoss_index, client, query_type, user_query, embedding, retrieval, filter_clauses
+):
+    """The (kind, vector field, body) searches one batch query needs."""
+    if query_type == "image":
+        return {
+            "type": query_type,
+            "query": user_query,
+            "filters": filter_clauses,
+            "requests": [
+                (
+                    "knn",
+                    "shot_image_vector",
+                    build_image_knn_query(
+                        aoss_index, client, embedding, filter_clauses
+                    ),
                 )
-        return response
+            ],
+        }
+
+    phrase_filters = get_phrase_filters(user_query)
+    filters = phrase_filters + filter_clauses
+    requests = []
+    if retrieval == "exact":
+        requests.append(("exact", None, build_exact_text_query(embedding, filters)))
+    elif embedding is not None:
+        for field in TEXT_VECTOR_FIELDS:
+            knn_query = build_knn_query(
+                aoss_index, client, field, embedding, MAX_OPENSEARCH_RESULTS, filters
+            )
+            requests.append(("knn", field, knn_query))
+    if retrieval == "hybrid":
+        free_text = QUOTED_PHRASE_PATTERN.sub(" ", user_query).strip()
+        lexical_query = build_lexical_query(free_text, phrase_filters, filter_clauses)
+        requests.append(("lexical", None, lexical_query))
+    return {
+        "type": query_type,
+        "query": user_query,
+        "filters": filters,
+        "requests": requests,
+    }
+
 
-    finally:
-        # Clean up
-        for frame_path in glob.glob(f"{tmp_frames_dir}*.png"):
-            os.remove(frame_path)
-        if os.path.exists(local_clip_path):
-            os.remove(local_clip_path)
+def warm_up_embedding_cache(queries):
+    """Pre-embed known hot queries so the first real request is a cache hit."""
+    text_embedding_model = os.environ["text_embedding_model"]
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        list(
+            executor.map(
+                lambda query: get_text_embedding(text_embedding_model, query),
+                queries,
+            )
+        )
+    return {"statusCode": 200, "body": json.dumps(embedding_cache.stats())}
 
 
 def get_text_embedding(text_embedding_model, shot_description):
+    key = text_cache_key(
+        text_embedding_model, TEXT_EMBEDDING_DIMENSIONS, shot_description
+    )
+    return embedding_cache.get_or_compute(
+        key, lambda: invoke_text_embedding(text_embedding_model, shot_description)
+    )
+
+
+def get_text_embeddings(text_embedding_model, texts):
+    """Embeddings of several texts, cache misses embedded in as few calls as we can."""
+    keys = [
+        text_cache_key(text_embedding_model, TEXT_EMBEDDING_DIMENSIONS, text)
+        for text in texts
+    ]
+    embeddings = [embedding_cache.get(key) for key in keys]
+    missing = {}
+    for key, text, embedding in zip(keys, texts, embeddings):
+        if embedding is None:
+            missing.setdefault(key, text)
+    if missing:
+        computed = dict(
+            zip(
+                missing,
+                invoke_text_embeddings(text_embedding_model, list(missing.values())),
+            )
+        )
+        for key, embedding in computed.items():
+            embedding_cache.put(key, embedding)
+        embeddings = [
+            computed[key] if embedding is None else embedding
+            for key, embedding in zip(keys, embeddings)
+        ]
+    return embeddings
+
+
+# Cohere embed accepts at most 96 texts per call
+COHERE_MAX_TEXTS = 96
+
+
+def invoke_text_embeddings(text_embedding_model, texts):
+    if text_embedding_model.startswith("amazon.titan-embed-text"):
+        # Titan embeds one text per call
+        with ThreadPoolExecutor(max_workers=BATCH_WORKERS) as executor:
+            return list(
+                executor.map(
+                    lambda text: invoke_text_embedding(text_embedding_model, text),
+                    texts,
+                )
+            )
+
+    embeddings = []
+    for start in range(0, len(texts), COHERE_MAX_TEXTS):
+        body = json.dumps(
+            {
+                "texts": texts[start : start + COHERE_MAX_TEXTS],
+                "input_type": "search_document",
+            }
+        )
+        response = bedrock_client.invoke_model(
+            body=body,
+            modelId=text_embedding_model,
+            accept="application/json",
+            contentType="application/json",
+        )
+        embeddings.extend(json.loads(response["body"].read()).get("embeddings"))
+    return embeddings
+
+
+def invoke_text_embedding(text_embedding_model, shot_description):
     accept = "application/json"
     content_type = "application/json"
     if text_embedding_model.startswith("amazon.titan-embed-text"):
         body = json.dumps(
-            {"inputText": shot_description, "dimensions": 1024, "normalize": True}
+            {
+                "inputText": shot_description,
+                "dimensions": TEXT_EMBEDDING_DIMENSIONS,
+                "normalize": True,
+            }
         )
         response = bedrock_client.invoke_model(
             body=body,
@@ -491,7 +1315,16 @@ def get_text_embedding(text_embedding_model, shot_description):
     return embedding
 
 
-def get_titan_image_embedding(embedding_model, query):
+def get_titan_image_embedding(embedding_model, query, image_hash=None):
+    if image_hash is None:
+        image_hash = hashlib.sha256(query.encode("utf-8")).hexdigest()
+    key = image_cache_key(embedding_model, IMAGE_EMBEDDING_DIMENSIONS, image_hash)
+    return embedding_cache.get_or_compute(
+        key, lambda: invoke_titan_image_embedding(embedding_model, query)
+    )
+
+
+def invoke_titan_image_embedding(embedding_model, query):
     accept = "application/json"
     content_type = "application/json"
     body = json.dumps({"inputImage": query})
@@ -0,0 +1,181 @@
+"""
+Order-preserving aggregation of clip-search frame hits.
+
+Every frame of the query clip is searched on its own, which gives a sparse
+frames x shots similarity matrix. A clip taken from a video should hit that
+video's shots in timestamp order, so instead of averaging per-frame scores we
+run a banded DTW-style dynamic programme over the matrix: each frame is
+assigned a shot, assignments never go back in time, and consecutive frames
+may only move forward by roughly the time that separates them in the clip.
+The best path per video gives its score and the precise span it covers.
+
+The programme is vectorized over shots (all videos at once), so each frame
+step is a handful of NumPy operations regardless of how many frames are used.
+"""
+
+import numpy as np
+
+# Slack on top of the inter-frame interval when matching shot boundaries
+ALIGNMENT_TOLERANCE_MS = 2000
+DEFAULT_FRAME_INTERVAL_MS = 1000
+
+
+def build_score_matrix(frame_results):
+    """
+    Turn per-frame hit lists into a dense frames x shots score matrix with
+    shots sorted by (video, start time). Returns the matrix and a shot table.
+    """
+    shot_columns = {}
+    shot_rows = []
+    cells = []
+    for frame_index, results in enumerate(frame_results):
+        for result in results:
+            key = (result.get("index") or "", result["video_name"], result["shot_id"])
+            if key not in shot_columns:
+                shot_columns[key] = len(shot_rows)
+                shot_rows.append(result)
+            cells.append((frame_index, shot_columns[key], result["score"]))
+
+    videos = sorted({_video_key(row) for row in shot_rows})
+    video_ids = {video: index for index, video in enumerate(videos)}
+    video_idx = np.array(
+        [video_ids[_video_key(row)] for row in shot_rows], dtype=np.int64
+    )
+    start = np.array([row["shot_startTime"] for row in shot_rows], dtype=np.float64)
+    end = np.array([row["shot_endTime"] for row in shot_rows], dtype=np.float64)
+
+    order = np.lexsort((start, video_idx))
+    position = np.empty_like(order)
+    position[order] = np.arange(len(order))
+
+    scores = np.zeros((len(frame_results), len(shot_rows)), dtype=np.float64)
+    if cells:
+        frame_index, column, score = (np.array(values) for values in zip(*cells))
+        np.maximum.at(
+            scores,
+            (frame_index.astype(np.int64), position[column.astype(np.int64)]),
+            score,
+        )
+
+    shots = {
+        "videos": videos,
+        "video_idx": video_idx[order],
+        "start": start[order],
+        "end": end[order],
+        "rows": [shot_rows[index] for index in order],
+    }
+    return scores, shots
+
+
+def align(scores, shots, frame_times=None, tolerance_ms=ALIGNMENT_TOLERANCE_MS):
+    """
+    Banded order-preserving alignment of frames to shots.
+    Returns the cumulative path score per shot after the last frame and the
+    back-pointer matrix for path recovery.
+    """
+    num_frames, num_shots = scores.shape
+    if frame_times is None:
+        frame_times = np.arange(num_frames) * DEFAULT_FRAME_INTERVAL_MS
+    frame_times = np.asarray(frame_times, dtype=np.float64)
+
+    video_idx, start, end = shots["video_idx"], shots["start"], shots["end"]
+    columns = np.arange(num_shots)
+    # First column of each shot's video, so a path never crosses videos
+    video_first = np.searchsorted(video_idx, video_idx, side="left")
+    # Monotonic global key over (video, end time) for band lookups
+    video_span = (
+        end.max() - min(start.min(), 0.0) + np.ptp(frame_times) + tolerance_ms + 1
+    )
+    end_key = np.maximum.accumulate(video_idx * video_span + end)
+
+    path_score = scores[0].copy()
+    back = np.empty((num_frames, num_shots), dtype=np.int64)
+    back[0] = columns
+    for frame in range(1, num_frames):
+        max_step = frame_times[frame] - frame_times[frame - 1] + tolerance_ms
+        # Earliest shot the previous frame may sit on: ends at most max_step
+        # before the current shot starts
+        lowest = np.searchsorted(end_key, video_idx * video_span + start - max_step)
+        lowest = np.minimum(np.maximum(lowest, video_first), columns)
+        best_score, best_column = range_max(path_score, lowest, columns)
+        path_score = scores[frame] + best_score
+        back[frame] = best_column
+    return path_score, back
+
+
+def top_alignments(frame_results, top_k, min_score, frame_times=None):
+    """
+    Best aligned span per video, ranked by mean per-frame similarity along the
+    path. Only videos whose mean reaches min_score are returned.
+    """
+    num_frames = len(frame_results)
+    scores, shots = build_score_matrix(frame_results)
+    if num_frames == 0 or scores.shape[1] == 0:
+        return []
+
+    path_score, back = align(scores, shots, frame_times)
+    video_idx = shots["video_idx"]
+    # Best final column per video: sort by (video, -score) and take group heads
+    order = np.lexsort((-path_score, video_idx))
+    heads = order[np.r_[True, video_idx[order][1:] != video_idx[order][:-1]]]
+    heads = heads[np.argsort(-path_score[heads], kind="stable")][:top_k]
+
+    alignments = []
+    for column in heads:
+        mean_score = path_score[column] / num_frames
+        if mean_score < min_score:
+            break
+        path = np.empty(num_frames, dtype=np.int64)
+        path[-1] = column
+        for frame in range(num_frames - 1, 0, -1):
+            path[frame - 1] = back[frame, path[frame]]
+        matched = path[scores[np.arange(num_frames), path] > 0]
+        if len(matched) == 0:
+            continue
+        first_row = shots["rows"][matched.min()]
+        alignments.append(
+            {
+                "index": first_row.get("index"),
+                "jobId": first_row["jobId"],
+                "video_name": first_row["video_name"],
+                "shot_startTime": _as_number(shots["start"][matched].min()),
+                "shot_endTime": _as_number(shots["end"][matched].max()),
+                "score": float(mean_score),
+                "occurrence_count": int(len(matched)),
+            }
+        )
+    return alignments
+
+
+def range_max(values, lowest, highest):
+    """
+    Vectorized max/argmax of values over the inclusive ranges
+    [lowest[i], highest[i]] using a sparse table.
+    """
+    size = len(values)
+    levels = [np.arange(size)]
+    width = 1
+    while width * 2 <= size:
+        previous = levels[-1]
+        left = previous[: size - 2 * width + 1]
+        right = previous[width : size - width + 1]
+        levels.append(np.where(values[right] > values[left], right, left))
+        width *= 2
+    table = np.zeros((len(levels), size), dtype=np.int64)
+    for level, indexes in enumerate(levels):
+        table[level, : len(indexes)] = indexes
+
+    level = np.floor(np.log2(highest - lowest + 1)).astype(np.int64)
+    left = table[level, lowest]
+    right = table[level, highest - (1 << level) + 1]
+    best = np.where(values[right] > values[left], right, left)
+    return values[best], best
+
+
+def _video_key(row):
+    # Federated results may hold videos of the same name from other indexes
+    return (row.get("index") or "", row["video_name"])
+
+
+def _as_number(value):
+    return int(value) if float(value).is_integer() else float(value)
@@ -0,0 +1,291 @@
+"""
+Frame extraction for clip search without touching /tmp.
+
+ffmpeg reads the clip straight from S3, either through a presigned URL (it
+issues HTTP range requests, so MP4s with the moov atom at the end still work)
+or from a pipe fed with the object body, and writes the selected frames to
+stdout as a PNG image2pipe stream. The generator below splits that stream and
+yields each encoded frame as soon as it is complete, together with its
+timestamp reported by the showinfo filter.
+
+Keyframes are picked at scene changes across the whole clip (with a fallback
+sample when the picture does not change for a while) and near-identical frames
+are then dropped with a perceptual hash, so a clip costs as few embedding calls
+and k-NN queries as its visual content needs. The kept frames are spaced
+evenly over the clip duration ffmpeg reports and passed on one by one, so the
+caller can embed each frame while later ones are still decoded. Frames are
+downscaled by ffmpeg, extraction stops at the frame budget, and clips longer
+than the duration limit are rejected, so memory stays bounded whatever the
+clip length.
+"""
+
+import io
+import logging
+import queue
+import re
+import shutil
+import struct
+import subprocess
+import threading
+
+import numpy as np
+from PIL import Image
+
+FFMPEG_PATH = "/opt/bin/ffmpeg"
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PRESIGNED_URL_EXPIRATION = 300
+PIPE_CHUNK_SIZE = 1024 * 1024
+PTS_TIME_PATTERN = re.compile(r"pts_time:\s*(-?[\d.]+)")
+DURATION_PATTERN = re.compile(r"Duration:\s*(\d+):(\d+):([\d.]+)")
+# How long to wait for the showinfo line of a frame already read from stdout
+TIMESTAMP_TIMEOUT = 10
+# ffmpeg errors caused by the uploaded clip rather than by the service
+INVALID_CLIP_ERRORS = (
+    "Invalid data found when processing input",
+    "moov atom not found",
+    "does not contain any stream",
+    "Server returned 403",
+    "Server returned 404",
+)
+
+
+def keyframe_filter(scene_threshold, max_interval, max_edge):
+    """
+    ffmpeg filter selecting the first frame, every scene change and a fallback
+    frame whenever max_interval seconds pass without one, scaled down to fit
+    max_edge (hashing and embedding need no more).
+    """
+    return (
+        "select='isnan(prev_selected_t)"
+        f"+gt(scene,{scene_threshold})"
+        f"+gte(t-prev_selected_t,{max_interval})',"
+        f"scale='min(iw,{max_edge})':'min(ih,{max_edge})'"
+        ":force_original_aspect_ratio=decrease"
+    )
+
+
+def select_keyframes(frames, budget, max_hash_distance, clip_info=None):
+    """
+    Yield the (timestamp_ms, frame) pairs of frames, in clip order, whose
+    perceptual hash is more than max_hash_distance bits from every frame
+    yielded before and which come at least duration / budget after the last
+    one, so the budget spreads over the whole clip. Stops at the frame budget.
+    The duration is read from clip_info (see stream_frames); without it the
+    first distinct frames fill the budget.
+    """
+    hashes = []
+    last_yielded_ms = None
+    for timestamp_ms, frame in frames:
+        frame_hash = perceptual_hash(frame)
+        if any(
+            hamming_distance(frame_hash, seen_hash) <= max_hash_distance
+            for seen_hash in hashes
+        ):
+            continue
+        spacing = (clip_info or {}).get("duration_ms", 0) / budget
+        if (
+            timestamp_ms is not None
+            and last_yielded_ms is not None
+            and timestamp_ms - last_yielded_ms < spacing
+        ):
+            continue
+        hashes.append(frame_hash)
+        yield timestamp_ms, frame
+        last_yielded_ms = timestamp_ms
+        if len(hashes) == budget:
+            return
+
+
+def perceptual_hash(frame):
+    """64-bit difference hash (dHash) of an encoded image."""
+    image = Image.open(io.BytesIO(frame)).convert("L").resize((9, 8), Image.BILINEAR)
+    pixels = np.asarray(image, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming_distance(hash_a, hash_b):
+    return bin(hash_a ^ hash_b).count("1")
+
+
+def stream_clip_frames(
+    s3_client,
+    bucket,
+    key,
+    video_filter,
+    source="url",
+    max_duration=None,
+    clip_info=None,
+):
+    """
+    Yield (timestamp_ms, PNG bytes) for the frames of an S3 clip selected by an
+    ffmpeg filter. Raises ValueError for a clip that is invalid or longer than
+    max_duration seconds.
+    """
+    if source == "pipe":
+        try:
+            body = s3_client.get_object(Bucket=bucket, Key=key)["Body"]
+        except s3_client.exceptions.NoSuchKey:
+            raise ValueError("Clip not found")
+        yield from stream_frames(
+            "pipe:0",
+            video_filter,
+            input_stream=body,
+            max_duration=max_duration,
+            clip_info=clip_info,
+        )
+    else:
+        url = s3_client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": bucket, "Key": key},
+            ExpiresIn=PRESIGNED_URL_EXPIRATION,
+        )
+        yield from stream_frames(
+            url, video_filter, max_duration=max_duration, clip_info=clip_info
+        )
+
+
+def stream_frames(
+    input_path, video_filter, input_stream=None, max_duration=None, clip_info=None
+):
+    """
+    Yield (timestamp_ms, PNG bytes) for the frames an ffmpeg filter selects.
+    clip_info, if given, receives the input's duration_ms as soon as ffmpeg
+    reports it, which is before the first frame.
+    """
+    command = [FFMPEG_PATH, "-nostats", "-loglevel", "info"]
+    if input_stream is None:
+        command.append("-nostdin")
+    command += [
+        "-i",
+        input_path,
+        "-vf",
+        f"{video_filter},showinfo",
+        "-vsync",
+        "0",
+        "-f",
+        "image2pipe",
+        "-c:v",
+        "png",
+        "pipe:1",
+    ]
+    process = subprocess.Popen(
+        command,
+        stdin=subprocess.PIPE if input_stream is not None else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    feeder = None
+    if input_stream is not None:
+        feeder = threading.Thread(
+            target=_feed_stdin, args=(process, input_stream), daemon=True
+        )
+        feeder.start()
+    timestamps = queue.Queue()
+    log_lines = []
+    log_reader = threading.Thread(
+        target=_read_log,
+        args=(process, timestamps, log_lines, clip_info),
+        daemon=True,
+    )
+    log_reader.start()
+
+    finished = False
+    try:
+        while True:
+            frame = read_png(process.stdout)
+            if frame is None:
+                break
+            try:
+                timestamp_ms = timestamps.get(timeout=TIMESTAMP_TIMEOUT)
+            except queue.Empty:
+                timestamp_ms = None
+            if max_duration and timestamp_ms and timestamp_ms > max_duration * 1000:
+                raise ValueError(f"Clips are limited to {max_duration} seconds")
+            yield timestamp_ms, frame
+        finished = True
+    finally:
+        process.stdout.close()
+        if process.poll() is None:
+            process.kill()
+        log_reader.join()
+        returncode = process.wait()
+        if feeder is not None:
+            feeder.join()
+    # Only a run that ended by itself is checked, not one stopped above
+    if finished and returncode != 0:
+        raise clip_error("".join(log_lines))
+
+
+def clip_error(log):
+    """ValueError (a 400) for a clip ffmpeg cannot read, Exception otherwise."""
+    logging.warning(f"ffmpeg frame extraction failed: {log}")
+    if any(error in log for error in INVALID_CLIP_ERRORS):
+        return ValueError("Clip is not a readable video")
+    return Exception("Clip frame extraction failed")
+
+
+def read_png(stream):
+    """Read one PNG image from a stream of concatenated PNGs, None at EOF."""
+    signature = _read_exactly(stream, len(PNG_SIGNATURE))
+    if not signature:
+        return None
+    if signature != PNG_SIGNATURE:
+        raise ValueError("ffmpeg output is not a PNG stream")
+    parts = [signature]
+    while True:
+        header = _read_exactly(stream, 8)
+        if len(header) < 8:
+            raise ValueError("Truncated PNG in ffmpeg output")
+        length, chunk_type = struct.unpack(">I4s", header)
+        # chunk data followed by its CRC
+        body = _read_exactly(stream, length + 4)
+        parts.append(header)
+        parts.append(body)
+        if chunk_type == b"IEND":
+            return b"".join(parts)
+
+
+def _read_exactly(stream, size):
+    data = stream.read(size)
+    while data and len(data) < size:
+        more = stream.read(size - len(data))
+        if not more:
+            break
+        data += more
+    return data
+
+
+def _read_log(process, timestamps, log_lines, clip_info=None):
+    """
+    Drain ffmpeg's log, forwarding showinfo timestamps, recording the input
+    duration and keeping the rest.
+    """
+    for raw_line in process.stderr:
+        line = raw_line.decode(errors="replace")
+        match = PTS_TIME_PATTERN.search(line)
+        if match and "showinfo" in line:
+            timestamps.put(round(float(match.group(1)) * 1000))
+            continue
+        duration = DURATION_PATTERN.search(line)
+        if duration and clip_info is not None and "duration_ms" not in clip_info:
+            hours, minutes, seconds = duration.groups()
+            clip_info["duration_ms"] = round(
+                (int(hours) * 3600 + int(minutes) * 60 + float(seconds)) * 1000
+            )
+        if len(log_lines) < 50:
+            log_lines.append(line)
+    process.stderr.close()
+
+
+def _feed_stdin(process, input_stream):
+    try:
+        shutil.copyfileobj(input_stream, process.stdin, PIPE_CHUNK_SIZE)
+    except (BrokenPipeError, ValueError):
+        # ffmpeg stopped reading, e.g. the filter already selected every frame
+        pass
+    finally:
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
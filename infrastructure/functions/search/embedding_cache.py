@@ -0,0 +1,183 @@
+"""
+Two-tier cache for query embeddings.
+
+The first tier is a bounded in-process LRU that lives as long as the warm Lambda
+container. The optional second tier is shared by every container (DynamoDB item
+or S3 object per key) and honours the same TTL. Keys are built from the model
+id, the embedding dimensions and either the normalized query text or a hash of
+the query image, so switching models never serves a stale vector.
+"""
+
+import hashlib
+import logging
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+
+from botocore.exceptions import ClientError
+
+from aws_clients import get_client, get_resource
+
+
+def text_cache_key(model_id, dimensions, text):
+    normalized = " ".join(unicodedata.normalize("NFKC", text).split())
+    digest = hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+    return f"{model_id}#{dimensions}#text#{digest}"
+
+
+def image_cache_key(model_id, dimensions, image_hash):
+    return f"{model_id}#{dimensions}#image#{image_hash}"
+
+
+def pack_embedding(embedding):
+    return array("f", embedding).tobytes()
+
+
+def unpack_embedding(data):
+    embedding = array("f")
+    embedding.frombytes(bytes(data))
+    return embedding.tolist()
+
+
+class EmbeddingCache:
+    def __init__(self, max_entries=1024, ttl_seconds=86400, shared_tier=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.shared_tier = shared_tier
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {
+            "memory_hits": 0,
+            "shared_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "shared_errors": 0,
+        }
+
+    def get_or_compute(self, key, compute):
+        embedding = self.get(key)
+        if embedding is None:
+            embedding = compute()
+            self.put(key, embedding)
+        return embedding
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                embedding, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return embedding
+                del self._entries[key]
+
+        if self.shared_tier is not None:
+            try:
+                embedding = self.shared_tier.get(key, now)
+            except ClientError as e:
+                logging.warning(f"Shared embedding cache read failed: {e}")
+                embedding = None
+                self._count("shared_errors")
+            if embedding is not None:
+                self._count("shared_hits")
+                self._put_local(key, embedding, now)
+                return embedding
+
+        self._count("misses")
+        return None
+
+    def put(self, key, embedding):
+        now = time.time()
+        self._put_local(key, embedding, now)
+        if self.shared_tier is not None:
+            try:
+                self.shared_tier.put(key, embedding, int(now + self.ttl_seconds))
+            except ClientError as e:
+                logging.warning(f"Shared embedding cache write failed: {e}")
+                self._count("shared_errors")
+
+    def stats(self):
+        with self._lock:
+            lookups = (
+                self._stats["memory_hits"]
+                + self._stats["shared_hits"]
+                + self._stats["misses"]
+            )
+            hits = self._stats["memory_hits"] + self._stats["shared_hits"]
+            return dict(
+                self._stats,
+                entries=len(self._entries),
+                hit_rate=round(hits / lookups, 4) if lookups else 0.0,
+            )
+
+    def _put_local(self, key, embedding, now):
+        with self._lock:
+            self._entries[key] = (embedding, now + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+
+class DynamoDbEmbeddingTier:
+    """One item per key; expired items are removed by DynamoDB TTL on ExpiresAt."""
+
+    def __init__(self, table_name):
+        self.table = get_resource("dynamodb").Table(table_name)
+
+    def get(self, key, now):
+        item = self.table.get_item(Key={"CacheKey": key}).get("Item")
+        # TTL deletion is lazy, so expired items can still be returned
+        if item is None or int(item["ExpiresAt"]) <= now:
+            return None
+        return unpack_embedding(item["Embedding"].value)
+
+    def put(self, key, embedding, expires_at):
+        self.table.put_item(
+            Item={
+                "CacheKey": key,
+                "Embedding": pack_embedding(embedding),
+                "ExpiresAt": expires_at,
+            }
+        )
+
+
+class S3EmbeddingTier:
+    """One object per key; expiry is stored in the object metadata."""
+
+    def __init__(self, bucket, prefix="embedding-cache/"):
+        self.s3_client = get_client("s3")
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def get(self, key, now):
+        try:
+            response = self.s3_client.get_object(
+                Bucket=self.bucket, Key=self._object_key(key)
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+                return None
+            raise
+        if int(response["Metadata"].get("expires-at", "0")) <= now:
+            return None
+        return unpack_embedding(response["Body"].read())
+
+    def put(self, key, embedding, expires_at):
+        self.s3_client.put_object(
+            Bucket=self.bucket,
+            Key=self._object_key(key),
+            Body=pack_embedding(embedding),
+            Metadata={"expires-at": str(expires_at)},
+        )
+
+    def _object_key(self, key):
+        return self.prefix + hashlib.sha256(key.encode("utf-8")).hexdigest()
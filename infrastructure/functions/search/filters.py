@@ -0,0 +1,109 @@
+"""
+Request filters on shot metadata.
+
+Filters are parsed from the request parameters once and turned into OpenSearch
+clauses that are pushed into the k-NN query itself, so a narrow filter still
+yields a full top-k instead of whatever survives from the unfiltered hits.
+Clauses are chosen from the index mapping: keyword fields get term queries,
+analyzed text fields get match_phrase, and the time range needs numeric times.
+"""
+
+import datetime
+
+# Request parameter -> index field for exact value filters
+VALUE_FILTERS = {
+    "jobId": "jobId",
+    "video_name": "video_name",
+    "public_figure": "shot_publicFigures",
+    "private_figure": "shot_privateFigures",
+}
+NUMERIC_TYPES = ("long", "integer", "float", "double", "scaled_float")
+
+
+def parse_filters(params):
+    """Filters present in the request parameters; raises ValueError if invalid."""
+    filters = {}
+    for param in VALUE_FILTERS:
+        value = params.get(param)
+        if value:
+            values = value if isinstance(value, list) else str(value).split(",")
+            values = [item.strip() for item in values if item.strip()]
+            if values:
+                filters[param] = values
+
+    for param in ("start_time_ms", "end_time_ms"):
+        if params.get(param) not in (None, ""):
+            try:
+                filters[param] = int(params[param])
+            except (TypeError, ValueError):
+                raise ValueError(f"{param} must be an integer")
+    if filters.get("start_time_ms", 0) > filters.get("end_time_ms", float("inf")):
+        raise ValueError("start_time_ms must not be after end_time_ms")
+
+    for param in ("uploaded_after", "uploaded_before"):
+        if params.get(param):
+            try:
+                filters[param] = parse_upload_date(
+                    params[param], end_of_day=param == "uploaded_before"
+                )
+            except (TypeError, ValueError):
+                raise ValueError(f"{param} must be an ISO 8601 date")
+    return filters
+
+
+def parse_upload_date(value, end_of_day=False):
+    """
+    ISO timestamp of an upload date bound. Both bounds are inclusive, so a bare
+    date as the upper bound stands for the end of that day.
+    """
+    if end_of_day and len(value) == 10:
+        day = datetime.date.fromisoformat(value)
+        return datetime.datetime.combine(day, datetime.time.max).isoformat()
+    return datetime.datetime.fromisoformat(value).isoformat()
+
+
+def build_filter_clauses(filters, field_mappings):
+    """OpenSearch filter clauses for parsed filters under the given mapping."""
+    clauses = []
+    for param, field in VALUE_FILTERS.items():
+        if param in filters:
+            clauses.append(
+                value_clause(field, filters[param], field_mappings.get(field, {}))
+            )
+
+    if "start_time_ms" in filters or "end_time_ms" in filters:
+        for field in ("shot_startTime", "shot_endTime"):
+            if field_mappings.get(field, {}).get("type") not in NUMERIC_TYPES:
+                raise ValueError(
+                    "Time range filters need an index with numeric shot times"
+                )
+        # Shots overlapping the requested range
+        if "start_time_ms" in filters:
+            clauses.append(
+                {"range": {"shot_endTime": {"gte": filters["start_time_ms"]}}}
+            )
+        if "end_time_ms" in filters:
+            clauses.append(
+                {"range": {"shot_startTime": {"lte": filters["end_time_ms"]}}}
+            )
+
+    upload_range = {}
+    if "uploaded_after" in filters:
+        upload_range["gte"] = filters["uploaded_after"]
+    if "uploaded_before" in filters:
+        upload_range["lte"] = filters["uploaded_before"]
+    if upload_range:
+        clauses.append({"range": {"upload_date": upload_range}})
+    return clauses
+
+
+def value_clause(field, values, field_mapping):
+    """Match any of values exactly on a keyword field or as a phrase on text."""
+    if field_mapping.get("type") == "keyword":
+        return {"terms": {field: values}}
+    if field_mapping.get("fields", {}).get("keyword", {}).get("type") == "keyword":
+        return {"terms": {f"{field}.keyword": values}}
+    phrases = [{"match_phrase": {field: value}} for value in values]
+    if len(phrases) == 1:
+        return phrases[0]
+    return {"bool": {"should": phrases, "minimum_should_match": 1}}
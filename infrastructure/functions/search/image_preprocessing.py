@@ -0,0 +1,73 @@
+"""
+Validation and normalization of query images before they are embedded.
+
+Uploads are decoded once, rejected if they are not an image or too large,
+downscaled to the resolution the embedding model actually uses and re-encoded
+as a compact JPEG. The content hash is taken over the normalized pixels, so
+the same picture uploaded as PNG or as a different JPEG maps to the same
+embedding cache entry.
+"""
+
+import base64
+import binascii
+import hashlib
+import io
+import os
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+MAX_IMAGE_BYTES = int(os.environ.get("max_image_bytes", str(5 * 1024 * 1024)))
+# Decoded size limit, guards against decompression bombs
+MAX_IMAGE_PIXELS = int(os.environ.get("max_image_pixels", "40000000"))
+# Longest edge kept for embedding; larger images only cost payload and latency
+IMAGE_MAX_EDGE = int(os.environ.get("image_max_edge", "1024"))
+IMAGE_JPEG_QUALITY = 90
+ACCEPTED_FORMATS = ("JPEG", "PNG", "WEBP", "GIF", "BMP")
+# Pillow refuses to open images over twice this size
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+
+def prepare_query_image(data, max_edge=IMAGE_MAX_EDGE):
+    """
+    Base64 (optionally a data URL) image upload -> (base64 JPEG, content hash).
+    Raises ValueError for anything that should not reach the embedding model.
+    """
+    if data.startswith("data:"):
+        data = data.split(",", 1)[-1]
+    # base64 inflates by 4/3, check before decoding anything
+    if len(data) * 3 // 4 > MAX_IMAGE_BYTES:
+        raise ValueError(f"Image is larger than {MAX_IMAGE_BYTES} bytes")
+    try:
+        image_bytes = base64.b64decode(data, validate=True)
+    except (binascii.Error, ValueError):
+        raise ValueError("Image is not valid base64")
+    return prepare_image_bytes(image_bytes, max_edge)
+
+
+def prepare_image_bytes(image_bytes, max_edge=IMAGE_MAX_EDGE):
+    """Encoded image bytes -> (base64 JPEG, content hash), see prepare_query_image."""
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+    except UnidentifiedImageError:
+        raise ValueError("Upload is not a supported image")
+    except Image.DecompressionBombError:
+        raise ValueError(f"Image has more than {MAX_IMAGE_PIXELS} pixels")
+    if image.format not in ACCEPTED_FORMATS:
+        raise ValueError(f"Unsupported image format: {image.format}")
+    if image.width * image.height > MAX_IMAGE_PIXELS:
+        raise ValueError(f"Image has more than {MAX_IMAGE_PIXELS} pixels")
+
+    try:
+        image = ImageOps.exif_transpose(image).convert("RGB")
+    except Image.DecompressionBombError:
+        raise ValueError(f"Image has more than {MAX_IMAGE_PIXELS} pixels")
+    except (OSError, SyntaxError):
+        raise ValueError("Image data is corrupt")
+    image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+    content_hash = hashlib.sha256(
+        f"{image.width}x{image.height}".encode() + image.tobytes()
+    ).hexdigest()
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=IMAGE_JPEG_QUALITY, optimize=True)
+    return base64.b64encode(output.getvalue()).decode(), content_hash
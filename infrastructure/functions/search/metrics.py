@@ -0,0 +1,140 @@
+"""
+Per-stage latency instrumentation for the search API.
+
+A SearchTimings object is bound to the current request with start_request()
+and every pipeline stage is wrapped in stage(name). At the end of the request
+the accumulated timings are printed as a CloudWatch Embedded Metric Format
+record, which CloudWatch turns into metrics without any API call. Metric names
+are stable so dashboards and alarms can rely on them. With the debug flag the
+same breakdown, plus the OpenSearch profile output, is returned to the caller.
+Both also carry the container's OpenSearch connection pool counters, which
+show whether warm invocations reuse their clients and connections.
+"""
+
+import contextvars
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+METRIC_NAMESPACE = os.environ.get("metrics_namespace", "VideoSemanticSearch")
+STAGE_METRICS = {
+    "preprocess": "ImagePreprocessLatency",
+    "embed": "EmbedLatency",
+    "knn": "KnnLatency",
+    "lexical": "LexicalLatency",
+    "rerank": "RerankLatency",
+    "dedup": "DedupLatency",
+    "clip_frames": "ClipFrameExtractionLatency",
+}
+TOTAL_METRIC = "TotalLatency"
+
+_current_timings = contextvars.ContextVar("search_timings", default=None)
+
+
+class SearchTimings:
+    def __init__(self, query_type, debug=False):
+        self.query_type = query_type
+        self.debug = debug
+        self.stages = {}
+        self.profiles = []
+        self.started = time.perf_counter()
+        self.total_ms = None
+
+    def add(self, name, elapsed_ms):
+        self.stages[name] = self.stages.get(name, 0.0) + elapsed_ms
+
+    def finish(self):
+        self.total_ms = (time.perf_counter() - self.started) * 1000
+
+    def breakdown(self):
+        stages = {name: round(elapsed_ms, 2) for name, elapsed_ms in self.stages.items()}
+        if self.total_ms is not None:
+            stages["total"] = round(self.total_ms, 2)
+        return stages
+
+    def debug_report(self):
+        return {
+            "stages_ms": self.breakdown(),
+            "opensearch_profile": self.profiles,
+            "connection_pool": get_pool_stats(),
+        }
+
+    def to_emf(self):
+        metrics = []
+        record = {"QueryType": self.query_type}
+        for name, elapsed_ms in self.stages.items():
+            metric_name = STAGE_METRICS.get(name)
+            if metric_name is not None:
+                metrics.append({"Name": metric_name, "Unit": "Milliseconds"})
+                record[metric_name] = round(elapsed_ms, 2)
+        if self.total_ms is not None:
+            metrics.append({"Name": TOTAL_METRIC, "Unit": "Milliseconds"})
+            record[TOTAL_METRIC] = round(self.total_ms, 2)
+        pool_stats = get_pool_stats()
+        if pool_stats is not None:
+            # Logged as properties: the counters are cumulative per container
+            record["OpenSearchPool"] = {
+                name: count for name, count in pool_stats.items() if name != "clients"
+            }
+        record["_aws"] = {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": METRIC_NAMESPACE,
+                    "Dimensions": [["QueryType"]],
+                    "Metrics": metrics,
+                }
+            ],
+        }
+        return record
+
+
+@contextmanager
+def start_request(query_type, debug=False):
+    timings = SearchTimings(query_type, debug)
+    token = _current_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        timings.finish()
+        _current_timings.reset(token)
+
+
+@contextmanager
+def stage(name):
+    """Time a block and add it to the current request's stage, if any."""
+    timings = _current_timings.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings.add(name, (time.perf_counter() - started) * 1000)
+
+
+def profiling_enabled():
+    timings = _current_timings.get()
+    return timings is not None and timings.debug
+
+
+def record_profile(label, profile):
+    timings = _current_timings.get()
+    if timings is not None and timings.debug and profile is not None:
+        timings.profiles.append({"query": label, "profile": profile})
+
+
+def get_pool_stats():
+    """
+    Connection pool counters of the container, None when no OpenSearch client
+    was created (e.g. with the local vector backend).
+    """
+    opensearch_pool = sys.modules.get("opensearch_pool")
+    if opensearch_pool is None:
+        return None
+    return opensearch_pool.get_pool_stats()
+
+
+def emit_metrics(timings):
+    print(json.dumps(timings.to_emf()))
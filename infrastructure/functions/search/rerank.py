@@ -0,0 +1,187 @@
+"""
+Rerank stage of the search API.
+
+The k-NN candidates are reranked only when it can change the answer: if the top
+hit already wins by a clear score gap the stage is skipped, otherwise only the
+candidates scoring close to the top hit are sent. Documents are trimmed to a
+token budget before they leave the container and results are cached per
+(query, candidate set) fingerprint. The reranker itself is pluggable so the
+Bedrock model can be benchmarked against a local stand-in.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from aws_clients import get_client
+
+RERANK_MODEL_ID = "cohere.rerank-v3-5:0"
+# Cohere Rerank 3.5 is only available in us-west-2 at the moment
+RERANK_REGION = os.environ.get("rerank_region", "us-west-2")
+RERANK_FIELDS = [
+    "shot_publicFigures",
+    "shot_privateFigures",
+    "shot_description",
+    "shot_transcript",
+]
+# Rough characters-per-token ratio for English text
+CHARS_PER_TOKEN = 4
+RERANK_DOC_TOKEN_BUDGET = int(os.environ.get("rerank_doc_token_budget", "512"))
+# Skip the rerank when the top hit beats the runner-up by this relative margin
+RERANK_SKIP_GAP = float(os.environ.get("rerank_skip_gap", "0.15"))
+# Rerank the candidates scoring within this relative window of the top hit
+RERANK_SCORE_WINDOW = float(os.environ.get("rerank_score_window", "0.3"))
+MIN_RERANK_CANDIDATES = int(os.environ.get("min_rerank_candidates", "10"))
+RERANK_CACHE_SIZE = int(os.environ.get("rerank_cache_size", "256"))
+
+
+class BedrockReranker:
+    name = "bedrock"
+
+    def __init__(self, region=RERANK_REGION, model_id=RERANK_MODEL_ID):
+        self.client = get_client("bedrock-agent-runtime", region_name=region)
+        self.model_arn = f"arn:aws:bedrock:{region}::foundation-model/{model_id}"
+
+    def score(self, user_query, docs, num_results):
+        sources = []
+        for doc in docs:
+            sources.append(
+                {
+                    "inlineDocumentSource": {
+                        "jsonDocument": doc,
+                        "type": "JSON",
+                    },
+                    "type": "INLINE",
+                }
+            )
+        response = self.client.rerank(
+            queries=[{"type": "TEXT", "textQuery": {"text": user_query}}],
+            sources=sources,
+            rerankingConfiguration={
+                "type": "BEDROCK_RERANKING_MODEL",
+                "bedrockRerankingConfiguration": {
+                    "numberOfResults": num_results,
+                    "modelConfiguration": {"modelArn": self.model_arn},
+                },
+            },
+        )
+        return response["results"]
+
+
+class LocalReranker:
+    """Term-overlap scorer used as an offline stand-in for benchmarking."""
+
+    name = "local"
+
+    def score(self, user_query, docs, num_results):
+        query_terms = set(re.findall(r"\w+", user_query.lower()))
+        results = []
+        for index, doc in enumerate(docs):
+            doc_terms = set(re.findall(r"\w+", " ".join(doc.values()).lower()))
+            overlap = len(query_terms & doc_terms)
+            relevance = overlap / len(query_terms) if query_terms else 0.0
+            results.append({"index": index, "relevanceScore": relevance})
+        results.sort(key=lambda x: x["relevanceScore"], reverse=True)
+        return results[:num_results]
+
+
+RERANKERS = {"bedrock": BedrockReranker, "local": LocalReranker}
+
+_reranker = None
+_reranker_lock = threading.Lock()
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_stats = {"reranked": 0, "skipped": 0, "cache_hits": 0}
+# Batch queries rerank from a thread pool
+_stats_lock = threading.Lock()
+
+
+def get_reranker():
+    """Module-scoped reranker, so warm invocations reuse its client."""
+    global _reranker
+    with _reranker_lock:
+        if _reranker is None:
+            _reranker = RERANKERS[os.environ.get("reranker", "bedrock")]()
+        return _reranker
+
+
+def rerank(user_query, candidates, num_results):
+    """
+    Rerank candidates sorted by k-NN score. Returns None when the stage is
+    skipped, otherwise results in the Bedrock shape ({"index", "relevanceScore"})
+    with indexes into candidates.
+    """
+    depth = select_rerank_depth([candidate["score"] for candidate in candidates])
+    if depth == 0:
+        _count("skipped")
+        return None
+
+    reranker = get_reranker()
+    candidates = candidates[:depth]
+    num_results = min(num_results, depth)
+    fingerprint = rerank_fingerprint(reranker.name, user_query, candidates, num_results)
+    with _cache_lock:
+        if fingerprint in _cache:
+            _cache.move_to_end(fingerprint)
+            _count("cache_hits")
+            return _cache[fingerprint]
+
+    docs = [trim_document(candidate) for candidate in candidates]
+    results = reranker.score(user_query, docs, num_results)
+    _count("reranked")
+
+    with _cache_lock:
+        _cache[fingerprint] = results
+        while len(_cache) > RERANK_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return results
+
+
+def rerank_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    with _cache_lock:
+        stats["cached"] = len(_cache)
+    return stats
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def select_rerank_depth(scores):
+    """
+    Number of leading candidates worth reranking, 0 to skip the stage. Only a
+    clear score gap after the top hit skips it; a lone candidate is still
+    reranked, so it gets a relevance score and the relevance threshold too.
+    """
+    if len(scores) < 2:
+        return len(scores)
+    top = scores[0]
+    if top > 0 and (top - scores[1]) / top >= RERANK_SKIP_GAP:
+        return 0
+    depth = sum(1 for score in scores if score >= top * (1 - RERANK_SCORE_WINDOW))
+    return min(max(depth, MIN_RERANK_CANDIDATES), len(scores))
+
+
+def trim_document(candidate, token_budget=RERANK_DOC_TOKEN_BUDGET):
+    """Keep the rerank fields only, cut to a shared token budget in field order."""
+    char_budget = token_budget * CHARS_PER_TOKEN
+    doc = {}
+    for field in RERANK_FIELDS:
+        value = (candidate.get(field) or "")[:char_budget]
+        doc[field] = value
+        char_budget -= len(value)
+    return doc
+
+
+def rerank_fingerprint(reranker_name, user_query, candidates, num_results):
+    candidate_ids = [
+        f"{candidate['jobId']}/{candidate['shot_id']}" for candidate in candidates
+    ]
+    payload = json.dumps([reranker_name, user_query, num_results, candidate_ids])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
@@ -0,0 +1,99 @@
+"""
+In-process cache of complete search responses.
+
+Keys combine the index, its ingestion generation, the search type, the
+normalized query and the search options, so a response is reused only while
+the index has not changed. Concurrent identical requests in one container are
+coalesced: the first one computes the response and the others wait for it
+instead of running the same embed, k-NN and rerank pipeline again.
+"""
+
+import hashlib
+import json
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+
+def response_cache_key(index_name, generation, search_type, query, options):
+    if search_type == "text":
+        query = " ".join(unicodedata.normalize("NFKC", query).split())
+    payload = json.dumps(
+        {
+            "query": query,
+            "options": {
+                name: value for name, value in options.items() if name != "debug"
+            },
+        },
+        sort_keys=True,
+    )
+    digest = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    return f"{index_name}#{generation}#{search_type}#{digest}"
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ResponseCache:
+    def __init__(self, max_entries=256, ttl_seconds=300):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0}
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                response, expires_at = entry
+                if expires_at > time.time():
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return response
+                del self._entries[key]
+
+            flight = self._in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._in_flight[key] = flight
+                self._stats["misses"] += 1
+            else:
+                self._stats["coalesced"] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = compute()
+            self._put(key, flight.result)
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            flight.done.set()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries))
+
+    def _put(self, key, response):
+        with self._lock:
+            self._entries[key] = (response, time.time() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
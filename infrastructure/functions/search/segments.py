@@ -0,0 +1,99 @@
+"""
+Interval-merge consolidation of shot hits into per-video segments.
+
+Hits are grouped by video, their times parsed once and sorted by start, and a
+single sweep merges hits that overlap or sit within a gap threshold of each
+other. Every video keeps its top N merged segments, so long videos with several
+relevant moments return all of them instead of only the best one.
+"""
+
+import os
+
+MERGE_POLICIES = ("max", "sum", "decay")
+MERGE_POLICY = os.environ.get("segment_merge_policy", "max")
+MERGE_GAP_MS = int(os.environ.get("segment_merge_gap_ms", "30000"))
+SEGMENTS_PER_VIDEO = int(os.environ.get("segments_per_video", "3"))
+# Weight of the n-th best hit of a segment under the "decay" policy is DECAY**n
+MERGE_DECAY = 0.5
+
+
+def merge_segments(
+    results,
+    policy=MERGE_POLICY,
+    gap_ms=MERGE_GAP_MS,
+    segments_per_video=SEGMENTS_PER_VIDEO,
+):
+    """
+    Merge hits of the same video that overlap or are at most gap_ms apart and
+    return the top segments_per_video segments of every video, best first.
+    """
+    video_hits = {}
+    for result in results:
+        # Federated results may hold videos of the same name from other indexes
+        video_key = (result.get("index"), result["video_name"])
+        video_hits.setdefault(video_key, []).append(
+            (float(result["shot_startTime"]), float(result["shot_endTime"]), result)
+        )
+
+    merged = []
+    for hits in video_hits.values():
+        hits.sort(key=lambda hit: hit[0])
+        segments = []
+        members = [hits[0]]
+        segment_end = hits[0][1]
+        for hit in hits[1:]:
+            if hit[0] <= segment_end + gap_ms:
+                members.append(hit)
+                segment_end = max(segment_end, hit[1])
+            else:
+                segments.append(build_segment(members, segment_end, policy))
+                members = [hit]
+                segment_end = hit[1]
+        segments.append(build_segment(members, segment_end, policy))
+
+        segments.sort(key=lambda x: x["score"], reverse=True)
+        merged.extend(segments[:segments_per_video])
+
+    merged.sort(key=lambda x: x["score"], reverse=True)
+    return merged
+
+
+def build_segment(members, segment_end, policy):
+    """One result for a run of merged hits, members sorted by start time."""
+    best = max(members, key=lambda hit: hit[2]["score"])[2]
+    segment = dict(best)
+    segment["shot_startTime"] = _as_number(members[0][0])
+    segment["shot_endTime"] = _as_number(segment_end)
+    segment["score"] = aggregate_scores(
+        [hit[2]["score"] for hit in members], policy
+    )
+    segment["merged_shot_count"] = len(members)
+    if len(members) > 1:
+        segment["shot_description"] = " | ".join(
+            _distinct(hit[2].get("shot_description") for hit in members)
+        )
+        segment["shot_transcript"] = " ".join(
+            _distinct(hit[2].get("shot_transcript") for hit in members)
+        )
+    return segment
+
+
+def aggregate_scores(scores, policy):
+    if policy == "sum":
+        return sum(scores)
+    if policy == "decay":
+        ordered = sorted(scores, reverse=True)
+        return sum(score * MERGE_DECAY**rank for rank, score in enumerate(ordered))
+    return max(scores)
+
+
+def _distinct(values):
+    seen = set()
+    for value in values:
+        if value and value not in seen:
+            seen.add(value)
+            yield value
+
+
+def _as_number(value):
+    return int(value) if value.is_integer() else value
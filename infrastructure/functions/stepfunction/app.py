@@ -1,14 +1,8 @@
 import json
-import logging
-import re
-import boto3
-from botocore.exceptions import ClientError
 import os
-import datetime
-import time
-import uuid
+from aws_clients import lazy_client
 
-sf_client = boto3.client("stepfunctions")
+sf_client = lazy_client("stepfunctions")
 
 
 def lambda_handler(event, context):
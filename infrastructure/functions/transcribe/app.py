@@ -1,10 +1,8 @@
-import json
-import boto3
-from botocore.exceptions import ClientError
 import os
+from aws_clients import lazy_client, lazy_resource
 
-transcribe_client = boto3.client("transcribe")
-dynamodb_client = boto3.resource("dynamodb")
+transcribe_client = lazy_client("transcribe")
+dynamodb_client = lazy_resource("dynamodb")
 
 
 def lambda_handler(event, context):
@@ -0,0 +1,61 @@
+"""
+Lazily created boto3 clients and resources shared by the Lambda functions.
+
+Functions declare their clients at module scope with lazy_client("s3") or
+lazy_resource("dynamodb"). Nothing is built (and boto3 is not even imported)
+until a client is first used, so a cold start only pays for the clients its
+code path actually touches. Every client is then memoized per container and
+shared by all modules that ask for the same service and arguments.
+"""
+
+import threading
+
+_clients = {}
+# boto3 client creation through the default session is not thread-safe
+_lock = threading.Lock()
+
+
+def get_client(service_name, **kwargs):
+    return _get("client", service_name, kwargs)
+
+
+def get_resource(service_name, **kwargs):
+    return _get("resource", service_name, kwargs)
+
+
+def lazy_client(service_name, **kwargs):
+    return LazyClient("client", service_name, kwargs)
+
+
+def lazy_resource(service_name, **kwargs):
+    return LazyClient("resource", service_name, kwargs)
+
+
+class LazyClient:
+    """Stands in for a boto3 client or resource until its first attribute access."""
+
+    def __init__(self, kind, service_name, kwargs):
+        self._kind = kind
+        self._service_name = service_name
+        self._kwargs = kwargs
+
+    def __getattr__(self, name):
+        return getattr(_get(self._kind, self._service_name, self._kwargs), name)
+
+    def __repr__(self):
+        return f"<lazy {self._service_name} {self._kind}>"
+
+
+def _get(kind, service_name, kwargs):
+    key = (kind, service_name, tuple(sorted(kwargs.items(), key=lambda item: item[0])))
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                import boto3
+
+                factory = boto3.client if kind == "client" else boto3.resource
+                client = factory(service_name, **kwargs)
+                _clients[key] = client
+    return client
@@ -0,0 +1,111 @@
+"""
+Encoding of the video frames the ingestion pipeline stores and sends to models.
+
+frame_format (png, jpeg or webp; png by default) is shared by every function
+that writes or reads frames, so the frame extractor, the S3 keys, the Bedrock
+messages and the embedding requests all agree on one format. JPEG and WebP
+frames are several times smaller than PNG at the same visual quality, which
+cuts S3 storage, transfer time, Bedrock payload size and Lambda memory.
+
+Rekognition and the Titan image embedding model only take PNG and JPEG, so
+WebP frames are transcoded to JPEG for them (the calling function then has to
+ship Pillow), and shot images built from WebP frames are stored as JPEG.
+"""
+
+import base64
+import io
+import os
+
+FRAME_FORMATS = {
+    "png": {
+        "extension": "png",
+        "content_type": "image/png",
+        "pil_format": "PNG",
+        "ffmpeg_options": [],
+    },
+    "jpeg": {
+        "extension": "jpg",
+        "content_type": "image/jpeg",
+        "pil_format": "JPEG",
+        "ffmpeg_options": ["-q:v", "2"],
+    },
+    "webp": {
+        "extension": "webp",
+        "content_type": "image/webp",
+        "pil_format": "WEBP",
+        "ffmpeg_options": ["-c:v", "libwebp", "-quality", "90"],
+    },
+}
+# Formats Rekognition and the Titan image embedding model accept
+MODEL_FORMATS = ("png", "jpeg")
+# Quality of JPEG and WebP images encoded with Pillow
+IMAGE_QUALITY = 90
+
+
+def get_frame_format():
+    frame_format = os.environ.get("frame_format", "png")
+    if frame_format not in FRAME_FORMATS:
+        raise ValueError(f"Unknown frame_format: {frame_format}")
+    return frame_format
+
+
+def get_model_format():
+    """Format of the images passed to Rekognition and embedding models."""
+    frame_format = get_frame_format()
+    return frame_format if frame_format in MODEL_FORMATS else "jpeg"
+
+
+def frame_extension(frame_format=None):
+    return FRAME_FORMATS[frame_format or get_frame_format()]["extension"]
+
+
+def frame_content_type(frame_format=None):
+    return FRAME_FORMATS[frame_format or get_frame_format()]["content_type"]
+
+
+def frame_key(jobId, name, frame_format=None):
+    """S3 key of a frame (or shot image) of a job, e.g. <jobId>/1000.png."""
+    return f"{jobId}/{name}.{frame_extension(frame_format)}"
+
+
+def ffmpeg_options(frame_format=None):
+    """ffmpeg output options encoding the frames in the format."""
+    return list(FRAME_FORMATS[frame_format or get_frame_format()]["ffmpeg_options"])
+
+
+def save_image(image, buffer, frame_format=None):
+    """Encode a Pillow image into buffer in the format."""
+    frame_format = frame_format or get_frame_format()
+    options = {} if frame_format == "png" else {"quality": IMAGE_QUALITY}
+    image.save(buffer, format=FRAME_FORMATS[frame_format]["pil_format"], **options)
+
+
+def bedrock_image_block(image_bytes):
+    """Converse API content block of a frame; Converse takes all frame formats."""
+    return {"image": {"format": get_frame_format(), "source": {"bytes": image_bytes}}}
+
+
+def rekognition_image(bucket, key):
+    """Rekognition Image parameter of a frame stored in S3."""
+    if get_frame_format() in MODEL_FORMATS:
+        return {"S3Object": {"Bucket": bucket, "Name": key}}
+    from aws_clients import get_client
+
+    image_bytes = get_client("s3").get_object(Bucket=bucket, Key=key)["Body"].read()
+    return {"Bytes": model_image_bytes(image_bytes)}
+
+
+def model_image_bytes(image_bytes):
+    """Frame bytes in a format Rekognition and the embedding models accept."""
+    if get_frame_format() in MODEL_FORMATS:
+        return image_bytes
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    save_image(Image.open(io.BytesIO(image_bytes)).convert("RGB"), buffer, "jpeg")
+    return buffer.getvalue()
+
+
+def embedding_image(image_bytes):
+    """Base64 inputImage of a frame for the Titan image embedding model."""
+    return base64.b64encode(model_image_bytes(image_bytes)).decode()
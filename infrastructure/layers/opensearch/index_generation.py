@@ -0,0 +1,71 @@
+"""
+Per-index generation counter for search response caching.
+
+Every ingestion into an index atomically bumps its counter in DynamoDB, and the
+search function makes the counter part of its response cache keys, so cached
+responses of an index stop being served as soon as new shots land in it. Reads
+are remembered for a few seconds per container to keep the lookup off the hot
+path of repeated queries.
+
+The first shot written to a new index also bumps the CATALOG_KEY counter, so
+searches over an index pattern notice that the pattern may match one more
+index.
+"""
+
+import logging
+import threading
+import time
+
+from aws_clients import get_resource
+from botocore.exceptions import ClientError
+
+GENERATION_MAX_AGE = 5
+# Counter of indexes created, never a valid index name
+CATALOG_KEY = "*"
+
+_table = None
+_generations = {}
+_lock = threading.Lock()
+
+
+def bump_index_generation(table_name, index_name):
+    response = _get_table(table_name).update_item(
+        Key={"IndexName": index_name},
+        UpdateExpression="ADD Generation :one",
+        ExpressionAttributeValues={":one": 1},
+        ReturnValues="UPDATED_NEW",
+    )
+    generation = int(response["Attributes"]["Generation"])
+    with _lock:
+        _generations[index_name] = (generation, time.monotonic())
+    if generation == 1 and index_name != CATALOG_KEY:
+        bump_index_generation(table_name, CATALOG_KEY)
+    return generation
+
+
+def get_index_generation(table_name, index_name, max_age=GENERATION_MAX_AGE):
+    """Current generation of an index (0 if never bumped), None if unreadable."""
+    now = time.monotonic()
+    with _lock:
+        cached = _generations.get(index_name)
+    if cached is not None and now - cached[1] < max_age:
+        return cached[0]
+
+    try:
+        item = _get_table(table_name).get_item(Key={"IndexName": index_name}).get(
+            "Item"
+        )
+    except ClientError as e:
+        logging.warning(f"Could not read generation of {index_name}: {e}")
+        return None
+    generation = int(item["Generation"]) if item else 0
+    with _lock:
+        _generations[index_name] = (generation, now)
+    return generation
+
+
+def _get_table(table_name):
+    global _table
+    if _table is None or _table.name != table_name:
+        _table = get_resource("dynamodb").Table(table_name)
+    return _table
@@ -0,0 +1,198 @@
+"""
+Versioned mapping of the shot index.
+
+Version 1 mapped every scalar field as text. Version 2 types them for the way
+they are queried: ids are keywords, shot times are longs, names keep a keyword
+for exact filters next to a text field for full-text matching, and the upload
+date is a date. The figure fields hold one value per figure, so an exact filter
+on one name matches shots showing several. Keyword, numeric and date fields
+keep doc_values, so filters, sorting and aggregations never need fielddata.
+The version is recorded in the mapping _meta so tools can tell which layout an
+index has.
+
+Vector fields can be quantized to cut index memory: fp16 (faiss scalar
+quantization, 2x smaller), int8 (lucene scalar quantization, 4x) or binary
+(faiss 1-bit quantization, 32x). The full-precision vectors stay in the
+document, so search oversamples the quantized graph and rescores the
+candidates exactly.
+
+An index can also carry a small copy of each vector (its first 256 or 512
+dimensions, renormalized) in a <field>_small field. Search shortlists on the
+small vectors and rescores on the full ones, so the graph it walks takes a
+fraction of the memory and bandwidth.
+"""
+
+import math
+
+SHOT_SCHEMA_VERSION = 2
+SHOT_VECTOR_FIELDS = ["shot_image_vector", "shot_desc_vector", "shot_transcript_vector"]
+VECTOR_QUANTIZATIONS = ("none", "fp16", "int8", "binary")
+HNSW_PARAMETERS = {"ef_construction": 512, "m": 16}
+SMALL_VECTOR_DIMENSIONS = (0, 256, 512)
+# Stored in the shot metadata as one ", "-joined string
+FIGURE_FIELDS = ("shot_publicFigures", "shot_privateFigures")
+
+
+def shot_index_body(
+    len_embedding,
+    version=SHOT_SCHEMA_VERSION,
+    quantization="none",
+    small_dimension=0,
+):
+    if version == 1:
+        properties = {
+            "jobId": {"type": "text"},
+            "video_name": {"type": "text"},
+            "shot_id": {"type": "text"},
+            "shot_startTime": {"type": "text"},
+            "shot_endTime": {"type": "text"},
+            "shot_description": {"type": "text"},
+            "shot_publicFigures": {"type": "text"},
+            "shot_privateFigures": {"type": "text"},
+            "shot_transcript": {"type": "text"},
+            "upload_date": {"type": "date"},
+        }
+    elif version == 2:
+        properties = {
+            "jobId": {"type": "keyword"},
+            "video_name": {"type": "keyword", "fields": {"text": {"type": "text"}}},
+            "shot_id": {"type": "keyword"},
+            "shot_startTime": {"type": "long"},
+            "shot_endTime": {"type": "long"},
+            "shot_description": {"type": "text"},
+            "shot_publicFigures": {
+                "type": "text",
+                "fields": {"keyword": {"type": "keyword"}},
+            },
+            "shot_privateFigures": {
+                "type": "text",
+                "fields": {"keyword": {"type": "keyword"}},
+            },
+            "shot_transcript": {"type": "text"},
+            "upload_date": {"type": "date"},
+        }
+    else:
+        raise ValueError(f"Unknown shot index schema version: {version}")
+
+    for field in SHOT_VECTOR_FIELDS:
+        properties[field] = vector_field(len_embedding, quantization)
+        if small_dimension:
+            properties[small_vector_field(field)] = vector_field(
+                small_dimension, quantization
+            )
+    return {
+        "mappings": {
+            "_meta": {"schema_version": version},
+            "properties": properties,
+        },
+        "settings": {
+            "index": {
+                "number_of_shards": 2,
+                "knn.algo_param": {"ef_search": 512},
+                "knn": True,
+            }
+        },
+    }
+
+
+def vector_field(len_embedding, quantization="none"):
+    if quantization == "none":
+        engine, parameters = "nmslib", dict(HNSW_PARAMETERS)
+    elif quantization == "fp16":
+        engine = "faiss"
+        parameters = dict(
+            HNSW_PARAMETERS,
+            encoder={"name": "sq", "parameters": {"type": "fp16"}},
+        )
+    elif quantization == "int8":
+        engine = "lucene"
+        parameters = dict(HNSW_PARAMETERS, encoder={"name": "sq"})
+    elif quantization == "binary":
+        engine = "faiss"
+        parameters = dict(
+            HNSW_PARAMETERS,
+            encoder={"name": "binary", "parameters": {"bits": 1}},
+        )
+    else:
+        raise ValueError(f"Unknown vector quantization: {quantization}")
+    return {
+        "type": "knn_vector",
+        "dimension": int(len_embedding),
+        "method": {
+            "engine": engine,
+            "space_type": "cosinesimil",
+            "name": "hnsw",
+            "parameters": parameters,
+        },
+    }
+
+
+def vector_quantization(field_mapping):
+    """Quantization of a knn_vector field mapping, see vector_field."""
+    method = field_mapping.get("method", {})
+    encoder = method.get("parameters", {}).get("encoder", {})
+    if encoder.get("name") == "binary":
+        return "binary"
+    if encoder.get("name") == "sq":
+        if method.get("engine") == "lucene":
+            return "int8"
+        return encoder.get("parameters", {}).get("type", "fp16")
+    return "none"
+
+
+def small_vector_field(field):
+    return f"{field}_small"
+
+
+def truncate_vector(vector, dimension):
+    """First dimension components of a vector, scaled back to unit length."""
+    head = vector[:dimension]
+    norm = math.sqrt(sum(value * value for value in head))
+    return [value / norm for value in head] if norm else list(head)
+
+
+def add_small_vectors(document, small_dimension):
+    """Add the <field>_small vectors of a shot document, see truncate_vector."""
+    if small_dimension:
+        for field in SHOT_VECTOR_FIELDS:
+            if document.get(field):
+                document[small_vector_field(field)] = truncate_vector(
+                    document[field], small_dimension
+                )
+    return document
+
+
+def schema_version(index_mapping):
+    """Schema version recorded in an index mapping, 1 for unversioned indexes."""
+    return index_mapping.get("mappings", {}).get("_meta", {}).get("schema_version", 1)
+
+
+def versioned_index_name(alias, version):
+    return f"{alias}-v{version}"
+
+
+def to_schema_document(source, version=SHOT_SCHEMA_VERSION):
+    """Convert a shot document of any version to the given version's types."""
+    document = dict(source)
+    if version >= 2:
+        for field in ("shot_startTime", "shot_endTime"):
+            if document.get(field) not in (None, ""):
+                document[field] = int(float(document[field]))
+        for field in FIGURE_FIELDS:
+            if field in document:
+                document[field] = split_figures(document[field])
+    return document
+
+
+def split_figures(figures):
+    """Figure names of a ", "-joined figures string, as indexed from version 2."""
+    if isinstance(figures, list):
+        return figures
+    return [name.strip() for name in (figures or "").split(",") if name.strip()]
+
+
+def join_figures(figures):
+    """Figures of a shot document of any version as one ", "-joined string."""
+    if isinstance(figures, list):
+        return ", ".join(figures)
+    return figures or ""
@@ -0,0 +1,540 @@
+"""
+In-process vector search engine with the OpenSearch client interface.
+
+Small deployments, CI and offline benchmarks can run the search and ingestion
+path without an OpenSearch Serverless collection. LocalVectorClient implements
+the part of opensearchpy.OpenSearch the functions use (search, msearch, index,
+count and indices.exists/create/delete/get_mapping) and understands the query
+shapes they send: knn (with filter), script_score with knn_score, bool,
+match_all, multi_match, match_phrase, term(s), range and query rescoring.
+
+Every index is a directory holding
+    mapping.json            index mapping and the stored vector dtype
+    docs.jsonl              one JSON line per document (_id and _source)
+    <field>.vec             row-aligned unit vectors, float32 or float16
+    <field>.ivf.npz         optional IVF centroids and row assignments
+The vector files are memory mapped, so opening a snapshot only reads the
+document table. Scores follow the OpenSearch cosinesimil formulas so
+thresholds carry over: 1 / (2 - cos) for knn queries, 1 + cos for knn_score.
+"""
+
+import fcntl
+import fnmatch
+import json
+import math
+import os
+import re
+import shutil
+import threading
+from collections import Counter
+
+import numpy as np
+
+from index_schema import shot_index_body, small_vector_field
+
+VECTOR_DTYPES = ("float32", "float16")
+TOKEN_PATTERN = re.compile(r"\w+")
+BM25_K1 = 1.2
+BM25_B = 0.75
+IVF_ITERATIONS = 10
+# k-means is fitted on at most this many rows
+IVF_SAMPLE_SIZE = 50000
+
+
+class LocalVectorClient:
+    def __init__(self, root, search_mode="exact", nprobe=8, dtype="float32"):
+        if dtype not in VECTOR_DTYPES:
+            raise ValueError(f"Unsupported vector dtype: {dtype}")
+        self.root = root
+        self.search_mode = search_mode
+        self.nprobe = nprobe
+        self.dtype = dtype
+        self.indices = LocalIndices(self)
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def get_index(self, name):
+        path = os.path.join(self.root, name)
+        if not os.path.exists(os.path.join(path, "mapping.json")):
+            raise KeyError(f"no such index [{name}]")
+        with self._lock:
+            index = self._indexes.get(name)
+            if index is None or index.changed():
+                index = LocalIndex(path)
+                self._indexes[name] = index
+            return index
+
+    def resolve(self, index):
+        """Index names matching a name, comma-separated list or pattern."""
+        names = []
+        existing = sorted(os.listdir(self.root)) if os.path.isdir(self.root) else []
+        for pattern in index.split(","):
+            if any(char in pattern for char in "*?"):
+                names.extend(fnmatch.filter(existing, pattern))
+            else:
+                names.append(pattern)
+        return names
+
+    def search(self, body=None, index=None, params=None, **kwargs):
+        body = body or {}
+        hits = []
+        for name in self.resolve(index):
+            hits.extend(
+                self.get_index(name).search(body, self.search_mode, self.nprobe)
+            )
+        hits.sort(key=lambda hit: hit["_score"], reverse=True)
+        return {
+            "hits": {
+                "total": {"value": len(hits), "relation": "eq"},
+                "hits": hits[: body.get("size", 10)],
+            }
+        }
+
+    def msearch(self, body=None, index=None, params=None, **kwargs):
+        responses = []
+        for header, query in zip(body[::2], body[1::2]):
+            try:
+                responses.append(
+                    self.search(body=query, index=header.get("index", index))
+                )
+            except (KeyError, ValueError) as e:
+                responses.append(
+                    {"error": {"type": type(e).__name__, "reason": e.args[0]}}
+                )
+        return {"responses": responses}
+
+    def index(self, index, body, params=None, **kwargs):
+        document = json.loads(body) if isinstance(body, str) else body
+        path = os.path.join(self.root, index)
+        if not os.path.exists(os.path.join(path, "mapping.json")):
+            dimension = max(
+                len(value) for value in document.values() if _is_vector(value)
+            )
+            small_vector = document.get(small_vector_field("shot_desc_vector"))
+            LocalIndex.create(
+                path,
+                shot_index_body(dimension, small_dimension=len(small_vector or [])),
+                self.dtype,
+            )
+        document_id = self.get_index(index).add_documents([document])[0]
+        return {"_index": index, "_id": document_id, "result": "created"}
+
+    def count(self, index, body=None, **kwargs):
+        return {
+            "count": sum(len(self.get_index(name).docs) for name in self.resolve(index))
+        }
+
+
+class LocalIndices:
+    def __init__(self, client):
+        self.client = client
+
+    def exists(self, index, **kwargs):
+        return all(
+            os.path.exists(os.path.join(self.client.root, name, "mapping.json"))
+            for name in self.client.resolve(index)
+        )
+
+    def create(self, index, body=None, **kwargs):
+        path = os.path.join(self.client.root, index)
+        if os.path.exists(os.path.join(path, "mapping.json")):
+            raise ValueError(f"index [{index}] already exists")
+        LocalIndex.create(path, body or {}, self.client.dtype)
+        return {"acknowledged": True, "index": index}
+
+    def delete(self, index, **kwargs):
+        for name in self.client.resolve(index):
+            shutil.rmtree(os.path.join(self.client.root, name), ignore_errors=True)
+        return {"acknowledged": True}
+
+    def get_mapping(self, index, **kwargs):
+        return {
+            name: {"mappings": self.client.get_index(name).mappings}
+            for name in self.client.resolve(index)
+        }
+
+    def refresh(self, index=None, **kwargs):
+        return {}
+
+
+class LocalIndex:
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+        with open(os.path.join(path, "mapping.json")) as f:
+            stored = json.load(f)
+        self.mappings = stored["mappings"]
+        self.dtype = np.dtype(stored["dtype"])
+        self.dimensions = {
+            field: int(mapping["dimension"])
+            for field, mapping in self.mappings.get("properties", {}).items()
+            if mapping.get("type") == "knn_vector"
+        }
+
+        self.ivf = {}
+        self.load()
+
+    def load(self):
+        """Read the document table and map the vector files."""
+        docs_path = os.path.join(self.path, "docs.jsonl")
+        self._docs_size = os.path.getsize(docs_path)
+        with open(docs_path) as f:
+            self.docs = [json.loads(line) for line in f if line.endswith("\n")]
+        # Rows of the next document, whatever the vector files hold
+        self._doc_lines = len(self.docs)
+        self.map_vectors()
+
+    def map_vectors(self):
+        self.vectors = {}
+        count = self._doc_lines
+        for field, dimension in self.dimensions.items():
+            vector_path = os.path.join(self.path, f"{field}.vec")
+            rows = os.path.getsize(vector_path) // (dimension * self.dtype.itemsize)
+            count = min(count, rows)
+            if rows:
+                self.vectors[field] = np.memmap(
+                    vector_path, dtype=self.dtype, mode="r", shape=(rows, dimension)
+                )
+        # A writer appends vectors before the document line, so trailing rows
+        # without a document (or the reverse) belong to an unfinished write
+        del self.docs[count:]
+        self._text_stats = {}
+
+    @classmethod
+    def create(cls, path, body, dtype="float32"):
+        os.makedirs(path, exist_ok=True)
+        mappings = body.get("mappings", {"properties": {}})
+        with open(os.path.join(path, "mapping.json"), "w") as f:
+            json.dump({"mappings": mappings, "dtype": dtype}, f)
+        for name in ["docs.jsonl"] + [
+            f"{field}.vec"
+            for field, mapping in mappings.get("properties", {}).items()
+            if mapping.get("type") == "knn_vector"
+        ]:
+            open(os.path.join(path, name), "a").close()
+
+    def changed(self):
+        return os.path.getsize(os.path.join(self.path, "docs.jsonl")) != self._docs_size
+
+    def add_documents(self, documents):
+        """
+        Append documents; safe against concurrent writers of the same index.
+        The loaded table is extended in place, so it is only read again when
+        another writer appended to it.
+        """
+        ids = []
+        records = []
+        with open(os.path.join(self.path, ".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if self.changed():
+                self.load()
+            next_row = self._doc_lines
+            for field, dimension in self.dimensions.items():
+                rows = np.zeros((len(documents), dimension), dtype=np.float32)
+                for row, document in enumerate(documents):
+                    if document.get(field):
+                        rows[row] = document[field]
+                norms = np.linalg.norm(rows, axis=1, keepdims=True)
+                rows = rows / np.where(norms == 0, 1, norms)
+                vector_path = os.path.join(self.path, f"{field}.vec")
+                with open(vector_path, "r+b") as f:
+                    f.truncate(next_row * dimension * self.dtype.itemsize)
+                    f.seek(0, os.SEEK_END)
+                    f.write(rows.astype(self.dtype).tobytes())
+            with open(os.path.join(self.path, "docs.jsonl"), "a") as f:
+                for offset, document in enumerate(documents):
+                    document_id = document.get("_id") or str(next_row + offset)
+                    source = {
+                        key: value
+                        for key, value in document.items()
+                        if key not in self.dimensions and key != "_id"
+                    }
+                    record = {"_id": document_id, "_source": source}
+                    f.write(json.dumps(record) + "\n")
+                    records.append(record)
+                    ids.append(document_id)
+            self._docs_size = os.path.getsize(os.path.join(self.path, "docs.jsonl"))
+            self._doc_lines += len(records)
+            # Vectors first, so a concurrent search never sees rows without one
+            self.map_vectors()
+            self.docs.extend(records)
+        return ids
+
+    def build_ivf(self, field, nlist=None, iterations=IVF_ITERATIONS):
+        """Fit IVF centroids for a vector field with spherical k-means and save them."""
+        vectors = np.asarray(self.vectors[field][: len(self.docs)], dtype=np.float32)
+        nlist = nlist or max(1, int(math.sqrt(len(vectors))))
+        rng = np.random.default_rng(0)
+        sample = vectors[
+            rng.choice(len(vectors), min(len(vectors), IVF_SAMPLE_SIZE), replace=False)
+        ]
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)]
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            for centroid in range(nlist):
+                members = sample[assignment == centroid]
+                if len(members):
+                    mean = members.sum(axis=0)
+                    centroids[centroid] = mean / (np.linalg.norm(mean) or 1)
+        assignment = np.argmax(vectors @ centroids.T, axis=1).astype(np.int32)
+        np.savez(
+            os.path.join(self.path, f"{field}.ivf.npz"),
+            centroids=centroids,
+            assignment=assignment,
+        )
+        self.ivf.pop(field, None)
+
+    def search(self, body, mode="exact", nprobe=8):
+        mask, scores = self.evaluate(body.get("query", {"match_all": {}}), mode, nprobe)
+        rows = np.flatnonzero(mask)
+        rows = rows[np.argsort(-scores[rows], kind="stable")]
+        if "rescore" in body:
+            rows, scores = self.rescore(rows, scores, body["rescore"], mode, nprobe)
+        rows = rows[: body.get("size", 10)]
+        source_fields = body.get("_source")
+        hits = []
+        for row in rows:
+            source = self.docs[row]["_source"]
+            if isinstance(source_fields, list):
+                source = {
+                    field: source[field] for field in source_fields if field in source
+                }
+            hits.append(
+                {
+                    "_index": self.name,
+                    "_id": self.docs[row]["_id"],
+                    "_score": float(scores[row]),
+                    "_source": source,
+                }
+            )
+        return hits
+
+    def rescore(self, rows, scores, rescore, mode="exact", nprobe=8):
+        """Re-rank the first window_size rows like an OpenSearch query rescorer."""
+        window = rows[: rescore.get("window_size", 10)]
+        spec = rescore["query"]
+        rescore_mask, rescore_scores = self.evaluate(
+            spec["rescore_query"], mode, nprobe
+        )
+        scores = scores.copy()
+        scores[window] = spec.get("query_weight", 1) * scores[window] + np.where(
+            rescore_mask[window],
+            spec.get("rescore_query_weight", 1) * rescore_scores[window],
+            0,
+        )
+        window = window[np.argsort(-scores[window], kind="stable")]
+        return np.concatenate([window, rows[len(window) :]]), scores
+
+    def evaluate(self, query, mode="exact", nprobe=8):
+        """Matching mask and score of every document for one query clause."""
+        count = len(self.docs)
+        (kind, spec), = query.items()
+        if kind == "match_all":
+            return np.ones(count, dtype=bool), np.ones(count)
+
+        if kind == "knn":
+            (field, knn), = spec.items()
+            candidates = None
+            if knn.get("filter"):
+                candidates = self.evaluate(knn["filter"], mode, nprobe)[0]
+            rows, cosine = self.nearest(
+                field, knn["vector"], knn["k"], candidates, mode, nprobe
+            )
+            mask = np.zeros(count, dtype=bool)
+            scores = np.zeros(count)
+            mask[rows] = True
+            scores[rows] = 1 / (2 - cosine)
+            return mask, scores
+
+        if kind == "script_score":
+            mask = self.evaluate(spec["query"], mode, nprobe)[0]
+            params = spec["script"]["params"]
+            rows = np.flatnonzero(mask)
+            scores = np.zeros(count)
+            scores[rows] = 1 + self.cosine(params["field"], params["query_value"], rows)
+            return mask, scores * spec.get("boost", 1)
+
+        if kind == "bool":
+            mask = np.ones(count, dtype=bool)
+            scores = np.zeros(count)
+            for clause in spec.get("must", []):
+                clause_mask, clause_scores = self.evaluate(clause, mode, nprobe)
+                mask &= clause_mask
+                scores += clause_scores
+            for clause in _as_list(spec.get("filter", [])):
+                mask &= self.evaluate(clause, mode, nprobe)[0]
+            should = spec.get("should", [])
+            if should:
+                matched = np.zeros(count)
+                for clause in should:
+                    clause_mask, clause_scores = self.evaluate(clause, mode, nprobe)
+                    matched += clause_mask
+                    scores += np.where(clause_mask, clause_scores, 0)
+                required = 0 if spec.get("must") or spec.get("filter") else 1
+                mask &= matched >= spec.get("minimum_should_match", required)
+            return mask, scores
+
+        if kind == "multi_match":
+            fields = [_parse_boost(field) for field in spec["fields"]]
+            if spec.get("type") == "phrase":
+                mask = np.zeros(count, dtype=bool)
+                for field, _ in fields:
+                    mask |= self.phrase_mask(field, spec["query"])
+                return mask, mask.astype(float)
+            scores = np.zeros(count)
+            for field, boost in fields:
+                scores = np.maximum(scores, boost * self.bm25(field, spec["query"]))
+            return scores > 0, scores
+
+        if kind == "match_phrase":
+            (field, phrase), = spec.items()
+            mask = self.phrase_mask(field, phrase)
+            return mask, mask.astype(float)
+
+        if kind in ("term", "terms"):
+            (field, values), = spec.items()
+            if isinstance(values, dict):
+                values = values.get("value")
+            values = set(_as_list(values))
+            field = field.removesuffix(".keyword")
+            mask = np.array(
+                [
+                    not values.isdisjoint(_as_list(doc["_source"].get(field)))
+                    for doc in self.docs
+                ],
+                dtype=bool,
+            )
+            return mask, mask.astype(float)
+
+        if kind == "range":
+            (field, bounds), = spec.items()
+            mask = np.array(
+                [_in_range(doc["_source"].get(field), bounds) for doc in self.docs],
+                dtype=bool,
+            )
+            return mask, mask.astype(float)
+
+        raise ValueError(f"Unsupported query in local vector store: {kind}")
+
+    def cosine(self, field, vector, rows):
+        if field not in self.vectors or len(rows) == 0:
+            return np.zeros(len(rows))
+        query = np.asarray(vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1)
+        return np.asarray(self.vectors[field][rows], dtype=np.float32) @ query
+
+    def nearest(self, field, vector, k, candidates=None, mode="exact", nprobe=8):
+        """Top-k rows by cosine, over candidates (exact) or the probed IVF lists."""
+        count = len(self.docs)
+        if candidates is not None:
+            rows = np.flatnonzero(candidates)
+        elif mode == "ivf" and self.load_ivf(field) is not None:
+            centroids, assignment = self.load_ivf(field)
+            query = np.asarray(vector, dtype=np.float32)
+            probed = np.argsort(-(centroids @ query))[:nprobe]
+            # Rows added after the IVF was built are always scanned
+            rows = np.concatenate(
+                [
+                    np.flatnonzero(np.isin(assignment[:count], probed)),
+                    np.arange(len(assignment), count),
+                ]
+            )
+        else:
+            rows = np.arange(count)
+        cosine = self.cosine(field, vector, rows)
+        if len(rows) > k:
+            top = np.argpartition(-cosine, k - 1)[:k]
+            rows, cosine = rows[top], cosine[top]
+        return rows, cosine
+
+    def load_ivf(self, field):
+        if field not in self.ivf:
+            ivf_path = os.path.join(self.path, f"{field}.ivf.npz")
+            self.ivf[field] = None
+            if os.path.exists(ivf_path):
+                with np.load(ivf_path) as ivf:
+                    self.ivf[field] = (ivf["centroids"], ivf["assignment"])
+        return self.ivf[field]
+
+    def phrase_mask(self, field, phrase):
+        tokens = _tokens(phrase)
+        if not tokens:
+            return np.zeros(len(self.docs), dtype=bool)
+        needle = f" {' '.join(tokens)} "
+        return np.array(
+            [
+                needle in f" {' '.join(doc_tokens)} "
+                for doc_tokens in self.field_tokens(field)
+            ],
+            dtype=bool,
+        )
+
+    def bm25(self, field, text):
+        field_tokens = self.field_tokens(field)
+        if field not in self._text_stats:
+            lengths = np.array([len(tokens) for tokens in field_tokens], dtype=float)
+            document_frequency = Counter()
+            for tokens in field_tokens:
+                document_frequency.update(set(tokens))
+            self._text_stats[field] = (lengths, document_frequency)
+        lengths, document_frequency = self._text_stats[field]
+        average_length = lengths.mean() if len(lengths) else 0
+        scores = np.zeros(len(field_tokens))
+        for term in set(_tokens(text)):
+            frequency = document_frequency.get(term, 0)
+            if not frequency:
+                continue
+            idf = math.log(
+                1 + (len(field_tokens) - frequency + 0.5) / (frequency + 0.5)
+            )
+            tf = np.array([tokens.count(term) for tokens in field_tokens], dtype=float)
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / (average_length or 1))
+            scores += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return scores
+
+    def field_tokens(self, field):
+        key = ("tokens", field)
+        if key not in self._text_stats:
+            field = field.removesuffix(".text").removesuffix(".keyword")
+            self._text_stats[key] = [
+                _tokens(" ".join(map(str, _as_list(doc["_source"].get(field)))))
+                for doc in self.docs
+            ]
+        return self._text_stats[key]
+
+
+def _tokens(text):
+    return TOKEN_PATTERN.findall(str(text).lower())
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _is_vector(value):
+    return isinstance(value, list) and len(value) > 0 and all(
+        isinstance(item, (int, float)) for item in value[:8]
+    )
+
+
+def _parse_boost(field):
+    name, _, boost = field.partition("^")
+    return name, float(boost) if boost else 1.0
+
+
+def _in_range(value, bounds):
+    if value is None:
+        return False
+    try:
+        value = float(value)
+        bounds = {op: float(bound) for op, bound in bounds.items()}
+    except (TypeError, ValueError):
+        value = str(value)
+    return (
+        ("gte" not in bounds or value >= bounds["gte"])
+        and ("gt" not in bounds or value > bounds["gt"])
+        and ("lte" not in bounds or value <= bounds["lte"])
+        and ("lt" not in bounds or value < bounds["lt"])
+    )
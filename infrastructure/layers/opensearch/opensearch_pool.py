@@ -0,0 +1,124 @@
+"""
+Shared OpenSearch Serverless clients for the Lambda functions.
+
+Clients are cached at module scope per (host, region, service) so warm
+invocations reuse the same SigV4 signer and the HTTP keep-alive connections of
+the underlying requests session instead of paying client construction and a
+TLS handshake on every call. Credentials are re-read shortly before they
+expire and swapped into the existing connections without dropping them.
+"""
+
+import threading
+import time
+
+import boto3
+from opensearchpy import OpenSearch, RequestsHttpConnection, AWSV4SignerAuth
+
+POOL_MAXSIZE = 20
+# Re-sign with fresh credentials this many seconds before they expire
+CREDENTIAL_REFRESH_MARGIN = 300
+# Credentials without a known expiry (e.g. Lambda environment variables) are
+# re-read after this many seconds
+CREDENTIAL_MAX_AGE = 2700
+
+_clients = {}
+_lock = threading.Lock()
+_stats = {"created": 0, "reused": 0, "credential_refreshes": 0}
+
+
+def get_opensearch_client(host, region, service="aoss"):
+    host = host.split("://")[1] if "://" in host else host
+    key = (host, region, service)
+    with _lock:
+        entry = _clients.get(key)
+        if entry is None:
+            entry = _create_client(host, region, service)
+            _clients[key] = entry
+            _stats["created"] += 1
+        else:
+            if _credentials_expiring(entry):
+                _refresh_credentials(entry, region, service)
+            _stats["reused"] += 1
+        return entry["client"]
+
+
+def get_pool_stats():
+    """Counters and per-host connection usage of the cached clients."""
+    with _lock:
+        clients = []
+        for (host, region, service), entry in _clients.items():
+            requests_sent = 0
+            connections_opened = 0
+            for connection in entry["client"].transport.connection_pool.connections:
+                adapter = connection.session.get_adapter("https://")
+                for pool_key in adapter.poolmanager.pools.keys():
+                    pool = adapter.poolmanager.pools.get(pool_key)
+                    if pool is not None:
+                        requests_sent += pool.num_requests
+                        connections_opened += pool.num_connections
+            clients.append(
+                {
+                    "host": host,
+                    "region": region,
+                    "service": service,
+                    "age_seconds": round(time.time() - entry["created_at"], 1),
+                    "requests": requests_sent,
+                    "connections_opened": connections_opened,
+                }
+            )
+        return dict(_stats, clients=clients)
+
+
+def clear_pool():
+    with _lock:
+        for entry in _clients.values():
+            entry["client"].close()
+        _clients.clear()
+
+
+def _create_client(host, region, service):
+    credentials = boto3.Session().get_credentials()
+    auth = AWSV4SignerAuth(credentials, region, service)
+
+    client = OpenSearch(
+        hosts=[{"host": host, "port": 443}],
+        http_auth=auth,
+        use_ssl=True,
+        verify_certs=True,
+        connection_class=RequestsHttpConnection,
+        pool_maxsize=POOL_MAXSIZE,
+    )
+
+    return {
+        "client": client,
+        "created_at": time.time(),
+        "credentials_loaded_at": time.time(),
+        "credentials_expiry": _credentials_expiry(credentials),
+    }
+
+
+def _credentials_expiry(credentials):
+    expiry_time = getattr(credentials, "_expiry_time", None)
+    if expiry_time is None:
+        return None
+    return expiry_time.timestamp()
+
+
+def _credentials_expiring(entry):
+    now = time.time()
+    if entry["credentials_expiry"] is not None:
+        return entry["credentials_expiry"] - now <= CREDENTIAL_REFRESH_MARGIN
+    return now - entry["credentials_loaded_at"] >= CREDENTIAL_MAX_AGE
+
+
+def _refresh_credentials(entry, region, service):
+    credentials = boto3.Session().get_credentials()
+    auth = AWSV4SignerAuth(credentials, region, service)
+    transport = entry["client"].transport
+    transport.kwargs["http_auth"] = auth
+    # Swap the signer on the live sessions so keep-alive connections survive
+    for connection in transport.connection_pool.connections:
+        connection.session.auth = auth
+    entry["credentials_loaded_at"] = time.time()
+    entry["credentials_expiry"] = _credentials_expiry(credentials)
+    _stats["credential_refreshes"] += 1
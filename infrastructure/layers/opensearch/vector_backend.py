@@ -0,0 +1,42 @@
+"""
+Selects the vector store the search and ingestion functions talk to.
+
+vector_backend=opensearch (the default) returns the pooled OpenSearch
+Serverless client. vector_backend=local returns an in-process
+LocalVectorClient over the index snapshots under local_index_path, which
+serves the same calls and query shapes without a collection, e.g. for small
+deployments, CI or offline benchmarks.
+"""
+
+import os
+import threading
+
+VECTOR_BACKENDS = ("opensearch", "local")
+
+_local_clients = {}
+_lock = threading.Lock()
+
+
+def get_vector_client(host, region):
+    backend = os.environ.get("vector_backend", "opensearch")
+    # Each backend imports its client library (opensearch-py or NumPy) only
+    # when it is selected
+    if backend == "opensearch":
+        from opensearch_pool import get_opensearch_client
+
+        return get_opensearch_client(host, region)
+    if backend != "local":
+        raise ValueError(f"Unknown vector_backend: {backend}")
+
+    root = os.environ.get("local_index_path", "/tmp/vss-index")
+    with _lock:
+        if root not in _local_clients:
+            from local_vector_store import LocalVectorClient
+
+            _local_clients[root] = LocalVectorClient(
+                root,
+                search_mode=os.environ.get("local_search_mode", "exact"),
+                nprobe=int(os.environ.get("local_ivf_nprobe", "8")),
+                dtype=os.environ.get("local_vector_dtype", "float32"),
+            )
+        return _local_clients[root]
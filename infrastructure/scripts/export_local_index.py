@@ -0,0 +1,78 @@
+"""
+Export the shot index into a snapshot for the local vector backend.
+
+Every shot of the OpenSearch index (or alias) is copied with its vectors into
+<output>/<index>, the layout LocalVectorClient reads. Optionally IVF lists are
+fitted for the vector fields, so the snapshot can be served with
+local_search_mode=ivf. Point local_index_path at the output directory and set
+vector_backend=local to run the search function against the snapshot.
+
+Example:
+    python infrastructure/scripts/export_local_index.py \\
+        --host <collection-endpoint> --region us-east-1 --index vss-index \\
+        --output ./vss-snapshot --ivf
+"""
+
+import argparse
+import os
+import sys
+
+from opensearchpy import helpers
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(__file__), "..", "layers", "opensearch")
+)
+from opensearch_pool import get_opensearch_client  # noqa: E402
+from local_vector_store import LocalIndex  # noqa: E402
+from index_schema import SHOT_VECTOR_FIELDS  # noqa: E402
+
+SCAN_SIZE = 200
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", required=True, help="collection endpoint")
+    parser.add_argument("--region", required=True)
+    parser.add_argument("--index", required=True)
+    parser.add_argument("--output", required=True, help="snapshot directory")
+    parser.add_argument("--dtype", choices=("float32", "float16"), default="float32")
+    parser.add_argument("--ivf", action="store_true", help="fit IVF lists")
+    parser.add_argument("--nlist", type=int, help="IVF lists, default sqrt(shots)")
+    args = parser.parse_args()
+
+    client = get_opensearch_client(args.host, args.region)
+    path = os.path.join(args.output, args.index)
+    if os.path.exists(path):
+        sys.exit(f"{path} already exists")
+
+    # An alias can span several indexes; their mappings agree on the fields
+    index_mapping = next(iter(client.indices.get_mapping(index=args.index).values()))
+    LocalIndex.create(path, index_mapping, args.dtype)
+    index = LocalIndex(path)
+
+    batch = []
+    exported = 0
+    for hit in helpers.scan(
+        client,
+        index=args.index,
+        query={"query": {"match_all": {}}},
+        size=SCAN_SIZE,
+    ):
+        batch.append(dict(hit["_source"], _id=hit["_id"]))
+        if len(batch) == SCAN_SIZE:
+            exported += len(index.add_documents(batch))
+            batch = []
+    if batch:
+        exported += len(index.add_documents(batch))
+    print(f"Exported {exported} shots to {path}")
+
+    if args.ivf and exported:
+        index = LocalIndex(path)
+        for field in SHOT_VECTOR_FIELDS:
+            if field in index.vectors:
+                index.build_ivf(field, args.nlist)
+                print(f"Built IVF lists for {field}")
+
+
+if __name__ == "__main__":
+    main()
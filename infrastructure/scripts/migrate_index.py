@@ -0,0 +1,337 @@
+"""
+Migrate the shot index to another schema version with no search downtime.
+
+The shots are copied into a new physical index named <index>-v<version>,
+either from the live index (vectors are reused, fields are converted to the
+new types) or from the per-shot JSON files in the shots bucket (every shot is
+sent through the EmbeddingAoss function again). Once the copy is done the
+index name is atomically pointed at the new index through an alias, so the
+search API and the frontend keep using the same name throughout.
+
+Ingestion may keep running while an alias is migrated. Shots written to the
+old indexes during the copy are caught up by comparing the (jobId, shot_id)
+keys of both sides, again right before the swap and once more after it, when
+the old indexes no longer receive writes. The swap is refused while any shot
+is missing from the new index, and --delete-old only removes the old indexes
+after the last catch-up.
+
+If the name is still a concrete index rather than an alias, the swap has to
+delete that index in the same atomic request, so shots written in between
+would be lost: pause ingestion (no running video workflows) and pass
+--ingestion-paused.
+
+Example:
+    python infrastructure/scripts/migrate_index.py \\
+        --host <collection-endpoint> --region us-east-1 --index vss-index
+"""
+
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from opensearchpy import helpers
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(__file__), "..", "layers", "opensearch")
+)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "layers", "common"))
+from opensearch_pool import get_opensearch_client  # noqa: E402
+from index_generation import bump_index_generation  # noqa: E402
+from index_schema import (  # noqa: E402
+    SHOT_SCHEMA_VERSION,
+    SMALL_VECTOR_DIMENSIONS,
+    VECTOR_QUANTIZATIONS,
+    add_small_vectors,
+    shot_index_body,
+    to_schema_document,
+    versioned_index_name,
+)
+
+BULK_CHUNK_SIZE = 200
+INVOKE_WORKERS = 8
+# Catch-up passes before giving up on a source that keeps changing
+CATCH_UP_PASSES = 3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", required=True, help="collection endpoint")
+    parser.add_argument("--region", required=True)
+    parser.add_argument("--index", required=True, help="index or alias to migrate")
+    parser.add_argument("--version", type=int, default=SHOT_SCHEMA_VERSION)
+    parser.add_argument("--source", choices=("index", "s3"), default="index")
+    parser.add_argument("--bucket-shots", help="shots bucket, for --source s3")
+    parser.add_argument(
+        "--embedding-function", help="EmbeddingAoss function name, for --source s3"
+    )
+    parser.add_argument("--dimension", type=int, help="default: from current index")
+    parser.add_argument(
+        "--quantization", choices=VECTOR_QUANTIZATIONS, default="none"
+    )
+    parser.add_argument(
+        "--small-dimension",
+        type=int,
+        choices=SMALL_VECTOR_DIMENSIONS,
+        default=0,
+        help="add truncated shortlist vectors (set small_vector_dimension to match)",
+    )
+    parser.add_argument(
+        "--route-by-job",
+        action="store_true",
+        help="index shots with routing=jobId (set route_by_job in the functions)",
+    )
+    parser.add_argument(
+        "--generation-table", help="IndexGenerationTable, to drop cached responses"
+    )
+    parser.add_argument(
+        "--delete-old", action="store_true", help="delete replaced indexes"
+    )
+    parser.add_argument(
+        "--ingestion-paused",
+        action="store_true",
+        help="confirm nothing is ingested, needed to replace a concrete index",
+    )
+    parser.add_argument("--yes", action="store_true", help="do not ask to swap")
+    args = parser.parse_args()
+    if args.source == "s3" and not (args.bucket_shots and args.embedding_function):
+        parser.error("--source s3 needs --bucket-shots and --embedding-function")
+
+    client = get_opensearch_client(args.host, args.region)
+    alias = args.index
+    current_indexes = resolve_indexes(client, alias)
+    target = versioned_index_name(alias, args.version)
+    if target in current_indexes:
+        sys.exit(f"{alias} already points at {target}")
+    if current_indexes == [alias] and not args.ingestion_paused:
+        sys.exit(
+            f"{alias} is a concrete index that the swap deletes: pause ingestion "
+            "and pass --ingestion-paused"
+        )
+    if client.indices.exists(index=target):
+        sys.exit(f"{target} already exists, delete it to restart the migration")
+
+    dimension = args.dimension or current_dimension(client, current_indexes)
+    client.indices.create(
+        index=target,
+        body=shot_index_body(
+            dimension, args.version, args.quantization, args.small_dimension
+        ),
+    )
+    print(
+        f"Created {target} (schema v{args.version}, dimension {dimension}, "
+        f"quantization {args.quantization}, small vectors {args.small_dimension})"
+    )
+
+    if args.source == "index":
+        if not current_indexes:
+            sys.exit(f"{alias} does not exist, use --source s3")
+        copied = copy_from_index(
+            client,
+            current_indexes,
+            target,
+            args.version,
+            args.route_by_job,
+            args.small_dimension,
+        )
+    else:
+        copied = copy_from_s3(
+            args.bucket_shots, args.embedding_function, target, args.region
+        )
+    print(f"Copied {copied} shots")
+
+    def sync():
+        if current_indexes:
+            catch_up(
+                client,
+                current_indexes,
+                target,
+                args.version,
+                args.route_by_job,
+                args.small_dimension,
+            )
+
+    sync()
+    print(f"{target} reports {count(client, [target])}")
+    if current_indexes:
+        print(f"{', '.join(current_indexes)} reports {count(client, current_indexes)}")
+
+    if not args.yes and input(f"Point {alias} at {target}? [y/N] ") != "y":
+        print(f"Left {alias} unchanged, {target} is kept for inspection")
+        return
+    # Shots ingested while waiting for the confirmation
+    sync()
+    swap_alias(client, alias, current_indexes, target)
+    if args.generation_table:
+        bump_index_generation(args.generation_table, alias)
+    print(f"{alias} now points at {target}")
+
+    if current_indexes != [alias]:
+        # Shots written to the old indexes just before the swap
+        sync()
+        if args.delete_old:
+            for index in current_indexes:
+                client.indices.delete(index=index)
+                print(f"Deleted {index}")
+
+
+def resolve_indexes(client, alias):
+    """Physical indexes behind a name: the alias targets or the index itself."""
+    if client.indices.exists_alias(name=alias):
+        return sorted(client.indices.get_alias(name=alias).keys())
+    if client.indices.exists(index=alias):
+        return [alias]
+    return []
+
+
+def current_dimension(client, indexes):
+    for index_mapping in client.indices.get_mapping(index=",".join(indexes)).values():
+        properties = index_mapping["mappings"].get("properties", {})
+        if "shot_desc_vector" in properties:
+            return properties["shot_desc_vector"]["dimension"]
+    sys.exit("Cannot infer the vector dimension, pass --dimension")
+
+
+def copy_from_index(
+    client,
+    source_indexes,
+    target,
+    version,
+    route_by_job,
+    small_dimension=0,
+    skip_keys=None,
+):
+    """Bulk copy the shots of the source indexes, except those in skip_keys."""
+
+    def actions():
+        for hit in helpers.scan(
+            client,
+            index=",".join(source_indexes),
+            query={"query": {"match_all": {}}},
+            size=BULK_CHUNK_SIZE,
+        ):
+            if skip_keys and shot_key(hit["_source"]) in skip_keys:
+                continue
+            action = {
+                "_index": target,
+                "_source": add_small_vectors(
+                    to_schema_document(hit["_source"], version), small_dimension
+                ),
+            }
+            if route_by_job:
+                action["_routing"] = hit["_source"]["jobId"]
+            yield action
+
+    copied, errors = helpers.bulk(
+        client, actions(), chunk_size=BULK_CHUNK_SIZE, raise_on_error=False
+    )
+    for error in errors[:10]:
+        print(f"Failed to copy shot: {error}")
+    if errors:
+        sys.exit(f"{len(errors)} shots failed to copy, {target} was not swapped in")
+    return copied
+
+
+def copy_from_s3(bucket_shots, embedding_function, target, region):
+    s3_client = boto3.client("s3", region_name=region)
+    lambda_client = boto3.client("lambda", region_name=region)
+
+    def reindex_shot(key):
+        shot = json.loads(
+            s3_client.get_object(Bucket=bucket_shots, Key=key)["Body"].read()
+        )
+        event = {
+            "jobId": shot["jobId"],
+            "video_name": shot["video_name"],
+            "shot_id": shot["shot_id"],
+            "shot_startTime": shot["shot_startTime"],
+            "shot_endTime": shot["shot_endTime"],
+            "target_index": target,
+        }
+        response = lambda_client.invoke(
+            FunctionName=embedding_function, Payload=json.dumps(event)
+        )
+        if "FunctionError" in response:
+            return f"{key}: {response['Payload'].read().decode()}"
+        return None
+
+    keys = []
+    for page in s3_client.get_paginator("list_objects_v2").paginate(
+        Bucket=bucket_shots
+    ):
+        for item in page.get("Contents", []):
+            # Shot documents are <jobId>/<shot_id>.json
+            if item["Key"].endswith(".json") and item["Key"].count("/") == 1:
+                keys.append(item["Key"])
+
+    with ThreadPoolExecutor(max_workers=INVOKE_WORKERS) as executor:
+        errors = [error for error in executor.map(reindex_shot, keys) if error]
+    for error in errors[:10]:
+        print(f"Failed to reindex shot {error}")
+    if errors:
+        sys.exit(f"{len(errors)} shots failed to reindex, {target} was not swapped in")
+    return len(keys)
+
+
+def catch_up(client, source_indexes, target, version, route_by_job, small_dimension):
+    """
+    Copy the shots of the source indexes that are missing from the target,
+    until none are. Exits if the source keeps changing faster than that.
+    """
+    for _ in range(CATCH_UP_PASSES):
+        client.indices.refresh(index=target)
+        target_keys = shot_keys(client, [target])
+        missing = shot_keys(client, source_indexes) - target_keys
+        if not missing:
+            return
+        copied = copy_from_index(
+            client,
+            source_indexes,
+            target,
+            version,
+            route_by_job,
+            small_dimension,
+            skip_keys=target_keys,
+        )
+        print(f"Caught up {copied} shots written during the migration")
+    sys.exit(f"Shots are still missing from {target} after {CATCH_UP_PASSES} passes")
+
+
+def shot_keys(client, indexes):
+    """(jobId, shot_id) of every shot; document ids are not kept across copies."""
+    return {
+        shot_key(hit["_source"])
+        for hit in helpers.scan(
+            client,
+            index=",".join(indexes),
+            query={"query": {"match_all": {}}, "_source": ["jobId", "shot_id"]},
+            size=BULK_CHUNK_SIZE,
+        )
+    }
+
+
+def shot_key(source):
+    return source["jobId"], source["shot_id"]
+
+
+def count(client, indexes):
+    return client.count(index=",".join(indexes))["count"]
+
+
+def swap_alias(client, alias, current_indexes, target):
+    if current_indexes == [alias]:
+        # A concrete index cannot share its name with an alias, so it is
+        # removed in the same atomic request that creates the alias
+        actions = [{"remove_index": {"index": alias}}]
+    else:
+        actions = [
+            {"remove": {"index": index, "alias": alias}} for index in current_indexes
+        ]
+    actions.append({"add": {"index": target, "alias": alias}})
+    client.indices.update_aliases(body={"actions": actions})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Report the import-time (cold start) cost of every Lambda function.
+
+Each function's app module is imported in a fresh interpreter with the layers
+on the path, the way the Lambda runtime does during init, and the wall time
+is taken as the median of several runs. Python's -X importtime output names
+the modules that cost the most. Save a report with --output and compare a
+later run against it with --baseline to catch regressions, e.g. in CI:
+
+    python infrastructure/scripts/profile_cold_start.py --output baseline.json
+    python infrastructure/scripts/profile_cold_start.py --baseline baseline.json
+
+Modules that are not installed locally are reported as errors for that
+function rather than stopping the run.
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+INFRASTRUCTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+FUNCTIONS_DIR = os.path.join(INFRASTRUCTURE, "functions")
+LAYER_DIRS = [
+    os.path.join(INFRASTRUCTURE, "layers", "common"),
+    os.path.join(INFRASTRUCTURE, "layers", "opensearch"),
+]
+IMPORTTIME_PATTERN = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s+)(\S+)")
+PROBE = (
+    "import time; start = time.perf_counter(); import app; "
+    "print('IMPORT_MS', (time.perf_counter() - start) * 1000)"
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("functions", nargs="*", help="default: all functions")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=5, help="modules listed")
+    parser.add_argument("--output", help="write the report as JSON")
+    parser.add_argument("--baseline", help="JSON report to compare against")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=20,
+        help="regression threshold in percent, for --baseline",
+    )
+    args = parser.parse_args()
+
+    functions = args.functions or sorted(
+        name
+        for name in os.listdir(FUNCTIONS_DIR)
+        if os.path.exists(os.path.join(FUNCTIONS_DIR, name, "app.py"))
+    )
+    report = {name: profile_function(name, args.runs) for name in functions}
+
+    for name, result in report.items():
+        if "error" in result:
+            print(f"{name:<34}{'error':>10}  {result['error']}")
+            continue
+        print(f"{name:<34}{result['import_ms']:>8.1f}ms")
+        for module, cumulative_ms in result["modules"][: args.top]:
+            print(f"{'':<6}{module:<40}{cumulative_ms:>8.1f}ms")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, args.threshold)
+        for name, before, after in regressions:
+            print(f"Regression: {name} {before:.1f}ms -> {after:.1f}ms")
+        if regressions:
+            sys.exit(1)
+
+
+def profile_function(name, runs):
+    function_dir = os.path.join(FUNCTIONS_DIR, name)
+    env = dict(
+        os.environ,
+        PYTHONPATH=os.pathsep.join([function_dir] + LAYER_DIRS),
+        AWS_DEFAULT_REGION=os.environ.get("AWS_DEFAULT_REGION", "us-east-1"),
+    )
+    timings = []
+    modules = {}
+    for _ in range(runs):
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", PROBE],
+            cwd=function_dir,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        if completed.returncode != 0:
+            lines = completed.stderr.strip().splitlines()
+            return {"error": lines[-1] if lines else "import failed"}
+        timings.append(float(completed.stdout.split("IMPORT_MS")[-1]))
+        for module, cumulative_ms in top_level_imports(completed.stderr):
+            modules.setdefault(module, []).append(cumulative_ms)
+
+    return {
+        "import_ms": statistics.median(timings),
+        "modules": sorted(
+            ((module, statistics.median(values)) for module, values in modules.items()),
+            key=lambda item: item[1],
+            reverse=True,
+        ),
+    }
+
+
+def top_level_imports(importtime_output):
+    """(module, cumulative ms) of the modules imported directly by app."""
+    imports = []
+    for line in importtime_output.splitlines():
+        match = IMPORTTIME_PATTERN.match(line)
+        if not match:
+            continue
+        # Nesting is shown by two spaces per level, and a module is listed
+        # after everything it imported
+        level = (len(match.group(3)) - 1) // 2
+        if level == 1:
+            imports.append((match.group(4), int(match.group(2)) / 1000))
+        elif level == 0:
+            if match.group(4) == "app":
+                return imports
+            imports = []
+    return []
+
+
+def compare(baseline, report, threshold):
+    regressions = []
+    for name, result in report.items():
+        before = baseline.get(name, {}).get("import_ms")
+        after = result.get("import_ms")
+        if before and after and after > before * (1 + threshold / 100):
+            regressions.append((name, before, after))
+    return regressions
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+"""
+Recall/latency report for quantized and truncated shot vectors.
+
+Copies the shots of an index into one scratch index per quantization
+(see index_schema.vector_field), then runs the same sample of queries against
+each: plain k-NN on the quantized graph and k-NN with an oversampled
+shortlist rescored on the full-precision vectors, the way the search function
+queries quantized indexes. With --small-dimension the scratch indexes also get
+truncated <field>_small vectors and the shortlist is additionally taken from
+those. Recall@k is measured against exact cosine search on the source index.
+Use the table to pick the quantization, the small vector dimension and the
+rescore_oversample / small_vector_oversample settings per index.
+
+Example:
+    python infrastructure/scripts/quantization_report.py \\
+        --host <collection-endpoint> --region us-east-1 --index vss-index \\
+        --quantizations none,fp16,int8,binary --oversample 1,2,5 \\
+        --small-dimension 256
+"""
+
+import argparse
+import os
+import sys
+import time
+
+from opensearchpy import helpers
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(__file__), "..", "layers", "opensearch")
+)
+from opensearch_pool import get_opensearch_client  # noqa: E402
+from index_schema import (  # noqa: E402
+    SMALL_VECTOR_DIMENSIONS,
+    VECTOR_QUANTIZATIONS,
+    add_small_vectors,
+    shot_index_body,
+    small_vector_field,
+    to_schema_document,
+    truncate_vector,
+)
+
+BULK_CHUNK_SIZE = 200
+# Bits stored per vector dimension by each quantization
+BITS_PER_DIMENSION = {"none": 32, "fp16": 16, "int8": 8, "binary": 1}
+INDEX_WAIT_SECONDS = 600
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", required=True, help="collection endpoint")
+    parser.add_argument("--region", required=True)
+    parser.add_argument("--index", required=True, help="full-precision source index")
+    parser.add_argument("--field", default="shot_desc_vector")
+    parser.add_argument("--quantizations", default="fp16,int8,binary")
+    parser.add_argument(
+        "--oversample", default="1,2,5", help="shortlist sizes, as multiples of k"
+    )
+    parser.add_argument(
+        "--small-dimension", type=int, choices=SMALL_VECTOR_DIMENSIONS, default=0
+    )
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("-k", type=int, default=100)
+    parser.add_argument("--keep", action="store_true", help="keep scratch indexes")
+    args = parser.parse_args()
+
+    quantizations = args.quantizations.split(",")
+    for quantization in quantizations:
+        if quantization not in VECTOR_QUANTIZATIONS:
+            parser.error(f"Unknown quantization: {quantization}")
+    factors = [float(factor) for factor in args.oversample.split(",")]
+
+    client = get_opensearch_client(args.host, args.region)
+    index_mapping = next(iter(client.indices.get_mapping(index=args.index).values()))
+    dimension = index_mapping["mappings"]["properties"][args.field]["dimension"]
+    queries = sample_queries(client, args.index, args.field, args.queries)
+    print(f"{len(queries)} queries, k={args.k}, {args.field} ({dimension}-d)")
+
+    truth = [
+        shot_keys(run(client, args.index, exact_body(args.field, query, args.k))[0])
+        for query in queries
+    ]
+    rows = [
+        report_row("none", "k-NN", dimension, client, args.index, args, queries, truth)
+    ]
+
+    for quantization in quantizations:
+        scratch = f"{args.index}-quant-{quantization}"
+        copy_index(
+            client, args.index, scratch, dimension, quantization, args.small_dimension
+        )
+        try:
+            rows.append(
+                report_row(
+                    quantization,
+                    "k-NN",
+                    dimension,
+                    client,
+                    scratch,
+                    args,
+                    queries,
+                    truth,
+                )
+            )
+            shortlists = [(dimension, "rescore")]
+            if args.small_dimension:
+                small = args.small_dimension
+                shortlists.append((small, f"small{small}"))
+            for shortlist_dimension, mode in shortlists:
+                for factor in factors:
+                    rows.append(
+                        report_row(
+                            quantization,
+                            f"{mode} x{factor:g}",
+                            shortlist_dimension,
+                            client,
+                            scratch,
+                            args,
+                            queries,
+                            truth,
+                            factor,
+                        )
+                    )
+        finally:
+            if not args.keep:
+                client.indices.delete(index=scratch)
+
+    print(
+        f"{'quantization':<14}{'mode':<16}{'bytes/vector':>13}"
+        f"{'recall@k':>10}{'p50 ms':>9}{'p95 ms':>9}"
+    )
+    for quantization, mode, graph_dimension, recall, latencies in rows:
+        # Size of the vectors the graph search reads
+        vector_bytes = graph_dimension * BITS_PER_DIMENSION[quantization] // 8
+        print(
+            f"{quantization:<14}{mode:<16}{vector_bytes:>13}{recall:>10.3f}"
+            f"{percentile(latencies, 50):>9.1f}{percentile(latencies, 95):>9.1f}"
+        )
+
+
+def sample_queries(client, index, field, size):
+    """Vectors of randomly chosen shots, used as the query sample."""
+    response = client.search(
+        index=index,
+        body={
+            "size": size,
+            "query": {"function_score": {"random_score": {"seed": 42}}},
+            "_source": [field],
+        },
+    )
+    return [
+        hit["_source"][field]
+        for hit in response["hits"]["hits"]
+        if hit["_source"].get(field)
+    ]
+
+
+def copy_index(client, source, target, dimension, quantization, small_dimension):
+    if client.indices.exists(index=target):
+        client.indices.delete(index=target)
+    client.indices.create(
+        index=target,
+        body=shot_index_body(
+            dimension, quantization=quantization, small_dimension=small_dimension
+        ),
+    )
+    actions = (
+        {
+            "_index": target,
+            "_source": add_small_vectors(
+                to_schema_document(hit["_source"]), small_dimension
+            ),
+        }
+        for hit in helpers.scan(
+            client,
+            index=source,
+            query={"query": {"match_all": {}}},
+            size=BULK_CHUNK_SIZE,
+        )
+    )
+    copied, errors = helpers.bulk(
+        client, actions, chunk_size=BULK_CHUNK_SIZE, raise_on_error=False
+    )
+    if errors:
+        sys.exit(f"{len(errors)} shots failed to copy into {target}")
+
+    # Serverless collections make new documents searchable asynchronously
+    deadline = time.time() + INDEX_WAIT_SECONDS
+    while client.count(index=target)["count"] < copied:
+        if time.time() > deadline:
+            sys.exit(f"{target} did not reach {copied} documents")
+        time.sleep(5)
+    print(f"Copied {copied} shots into {target} ({quantization})")
+
+
+def report_row(
+    quantization,
+    mode,
+    graph_dimension,
+    client,
+    index,
+    args,
+    queries,
+    truth,
+    factor=None,
+):
+    recalls = []
+    latencies = []
+    for query, expected in zip(queries, truth):
+        if factor is None:
+            body = knn_body(args.field, query, args.k)
+        else:
+            body = rescored_knn_body(args.field, query, args.k, factor)
+            if graph_dimension < len(query):
+                body["query"] = {
+                    "knn": {
+                        small_vector_field(args.field): {
+                            "vector": truncate_vector(query, graph_dimension),
+                            "k": body["rescore"]["window_size"],
+                        }
+                    }
+                }
+        hits, took = run(client, index, body)
+        recalls.append(len(shot_keys(hits) & expected) / max(len(expected), 1))
+        latencies.append(took)
+    recall = sum(recalls) / max(len(recalls), 1)
+    return quantization, mode, graph_dimension, recall, latencies
+
+
+def run(client, index, body):
+    start = time.perf_counter()
+    response = client.search(index=index, body=body)
+    return response["hits"]["hits"], (time.perf_counter() - start) * 1000
+
+
+def shot_keys(hits):
+    # Serverless vector indexes assign their own ids, so compare shots
+    return {(hit["_source"]["jobId"], hit["_source"]["shot_id"]) for hit in hits}
+
+
+def knn_body(field, vector, k):
+    return {
+        "size": k,
+        "query": {"knn": {field: {"vector": vector, "k": k}}},
+        "_source": ["jobId", "shot_id"],
+    }
+
+
+def exact_body(field, vector, k):
+    return {
+        "size": k,
+        "query": {
+            "script_score": {
+                "query": {"match_all": {}},
+                "script": {
+                    "lang": "knn",
+                    "source": "knn_score",
+                    "params": {
+                        "field": field,
+                        "query_value": vector,
+                        "space_type": "cosinesimil",
+                    },
+                },
+            }
+        },
+        "_source": ["jobId", "shot_id"],
+    }
+
+
+def rescored_knn_body(field, vector, k, factor):
+    window = int(k * factor)
+    body = knn_body(field, vector, window)
+    body["size"] = k
+    body["rescore"] = {
+        "window_size": window,
+        "query": {
+            "rescore_query": exact_body(field, vector, k)["query"],
+            "query_weight": 0,
+            "rescore_query_weight": 1,
+        },
+    }
+    return body
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Search across several indexes with the local vector backend.
+
+Run from the repository root with: python -m pytest infrastructure/tests
+"""
+
+import os
+import sys
+
+import pytest
+
+INFRASTRUCTURE = os.path.join(os.path.dirname(__file__), "..")
+for path in ("layers/opensearch", "layers/common", "functions/search"):
+    sys.path.insert(0, os.path.join(INFRASTRUCTURE, path))
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("aoss_host", "localhost")
+os.environ.setdefault("region", "us-east-1")
+
+import app  # noqa: E402
+from index_schema import add_small_vectors, shot_index_body  # noqa: E402
+from local_vector_store import LocalVectorClient  # noqa: E402
+
+DIMENSION = 4
+SMALL_DIMENSION = 2
+
+
+def shot(jobId, shot_id, vector):
+    return {
+        "jobId": jobId,
+        "video_name": f"{jobId}.mp4",
+        "shot_id": shot_id,
+        "shot_startTime": 0,
+        "shot_endTime": 1000,
+        "shot_description": "a shot",
+        "shot_publicFigures": [],
+        "shot_privateFigures": [],
+        "shot_transcript": "",
+        "shot_desc_vector": vector,
+        "shot_image_vector": vector,
+        "shot_transcript_vector": vector,
+    }
+
+
+@pytest.fixture
+def client(tmp_path):
+    client = LocalVectorClient(str(tmp_path))
+    client.indices.create(
+        "shots-small",
+        body=shot_index_body(DIMENSION, small_dimension=SMALL_DIMENSION),
+    )
+    client.indices.create("shots-plain", body=shot_index_body(DIMENSION))
+    client.index(
+        "shots-small",
+        add_small_vectors(shot("small", "0-1000", [1, 0, 0, 0]), SMALL_DIMENSION),
+    )
+    client.index("shots-plain", shot("plain", "0-1000", [1, 0.1, 0, 0]))
+    app.index_mappings.clear()
+    yield client
+    app.index_mappings.clear()
+
+
+def test_small_vectors_are_only_used_if_every_index_has_them(client):
+    assert app.get_small_vector_field("shots-small", client, "shot_desc_vector")
+    assert app.get_small_vector_field("shots-*", client, "shot_desc_vector") is None
+
+    body = app.build_knn_query(
+        "shots-*", client, "shot_desc_vector", [1, 0, 0, 0], 10, []
+    )
+    assert list(body["query"]["knn"]) == ["shot_desc_vector"]
+    assert "rescore" not in body
+
+
+def test_federated_text_search_returns_shots_of_every_index(client):
+    hits = app.ann_text_search("shots-*", client, [1, 0, 0, 0], [], "weighted")
+
+    assert sorted(hit["_index"] for hit in hits) == ["shots-plain", "shots-small"]
+
+
+def test_fields_missing_from_an_index_are_conflicting():
+    merged = app.merge_field_mappings(
+        [
+            {"jobId": {"type": "keyword"}, "v_small": {"type": "knn_vector"}},
+            {"jobId": {"type": "keyword"}, "shot_startTime": {"type": "long"}},
+        ]
+    )
+
+    assert merged == {"jobId": {"type": "keyword"}, "shot_startTime": {"type": "mixed"}}